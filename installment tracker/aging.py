@@ -0,0 +1,110 @@
+"""
+Aging report: unpaid installments bucketed by how many days overdue they are.
+
+The report is built with one vectorized pass over the ledger arrays (see
+analytics.py) and cached for the day. When payments are marked during the
+day only the customers whose ledger entry changed are re-bucketed, and the
+totals are adjusted by the difference. The next day it is built again,
+since every installment ages by one day.
+
+Installments whose due date is not a valid date are left out.
+"""
+import threading
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from utils import CSVManager
+from ledger import Installment
+from analytics import LedgerArrays, ledger_arrays
+
+# Buckets of the report, in order
+AGING_BUCKETS = ("current", "1-30", "31-60", "61-90", "90+")
+# Days overdue at which each bucket after "current" starts ("current" is not yet due, or due today)
+BUCKET_STARTS = (1, 31, 61, 91)
+# A reload that changes more customers than this share rebuilds the report
+REBUILD_SHARE = 0.1
+
+
+def bucket_of(days_overdue: int) -> int:
+    """Index in AGING_BUCKETS of an installment overdue by days_overdue days"""
+    return bisect_right(BUCKET_STARTS, days_overdue)
+
+
+def aging_matrix(arrays: LedgerArrays, today: int) -> np.ndarray:
+    """Unpaid amount per customer (rows, as arrays.customer_ids) and bucket (columns)"""
+    unpaid = ~arrays.paid & (arrays.due_day > 0)
+    buckets = np.searchsorted(np.array(BUCKET_STARTS), today - arrays.due_day[unpaid], side="right")
+    # One cell per (customer, bucket): bincount sums every cell at once
+    cells = arrays.customer[unpaid].astype(np.int64) * len(AGING_BUCKETS) + buckets
+    sums = np.bincount(cells, weights=arrays.amount[unpaid],
+                       minlength=len(arrays.customer_ids) * len(AGING_BUCKETS))
+    return sums.reshape(len(arrays.customer_ids), len(AGING_BUCKETS))
+
+
+def customer_aging(installments: Sequence[Installment], today: int) -> List[float]:
+    """Unpaid amount per bucket of one customer"""
+    row = [0.0] * len(AGING_BUCKETS)
+    for installment in installments:
+        if not installment.paid and installment.due_day:
+            row[bucket_of(today - installment.due_day)] += installment.amount
+    return row
+
+
+class AgingReport:
+    """Aging report of a CSVManager's data, cached for the day"""
+
+    def __init__(self, csv_manager: CSVManager):
+        self.csv_manager = csv_manager
+        self._lock = threading.Lock()
+        self._day = None
+        self._version = None
+        # Ledger the report was computed from (entries are replaced, not modified, on change)
+        self._ledger: Dict[str, tuple] = {}
+        # Customer_ID -> amount per bucket, for customers with an unpaid installment
+        self._rows: Dict[str, List[float]] = {}
+        self._totals = [0.0] * len(AGING_BUCKETS)
+
+    def report(self, today: Optional[date] = None) -> Tuple[Dict[str, List[float]], List[float]]:
+        """Amount per bucket of each customer with unpaid installments, and the totals"""
+        day = (today or date.today()).toordinal()
+        with self._lock:
+            version, ledger = self.csv_manager.get_ledger()
+            if day != self._day:
+                self._build(ledger, day)
+            elif version != self._version:
+                self._update(ledger)
+            self._version = version
+            return dict(self._rows), list(self._totals)
+
+    def _build(self, ledger: Dict[str, tuple], day: int):
+        """Bucket every installment in one vectorized pass"""
+        arrays = ledger_arrays(ledger)
+        matrix = aging_matrix(arrays, day)
+        self._rows = {
+            arrays.customer_ids[index]: matrix[index].tolist()
+            for index in np.flatnonzero(matrix.any(axis=1))
+        }
+        self._totals = matrix.sum(axis=0).tolist()
+        self._ledger = ledger
+        self._day = day
+
+    def _update(self, ledger: Dict[str, tuple]):
+        """Re-bucket only the customers whose installments changed"""
+        changed = [customer_id for customer_id, installments in ledger.items()
+                   if self._ledger.get(customer_id) is not installments]
+        changed += [customer_id for customer_id in self._ledger.keys() - ledger.keys()]
+        if len(changed) > REBUILD_SHARE * max(len(ledger), 1):
+            self._build(ledger, self._day)
+            return
+
+        for customer_id in changed:
+            old_row = self._rows.pop(customer_id, None)
+            if old_row is not None:
+                self._totals = [total - amount for total, amount in zip(self._totals, old_row)]
+            if customer_id in ledger:
+                row = customer_aging(ledger[customer_id], self._day)
+                if any(row):
+                    self._rows[customer_id] = row
+                    self._totals = [total + amount for total, amount in zip(self._totals, row)]
+        self._ledger = ledger
@@ -0,0 +1,145 @@
+"""
+Portfolio analytics over the installment ledger.
+
+The ledger is copied once per data version into columnar NumPy arrays (due
+day ordinal, amount, paid flag, customer code). The KPIs are then computed
+with vectorized masks and np.bincount instead of Python loops, so they take
+milliseconds even for millions of installments; only the copy into arrays
+is proportional to the data, and it is redone only after the data changed.
+"""
+import logging
+import threading
+from datetime import date
+from itertools import chain
+from operator import attrgetter
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from utils import CSVManager
+
+# date.toordinal() of 1970-01-01, the epoch of numpy datetime64
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Horizons (days) of the expected cash figures
+CASH_HORIZONS = (30, 60, 90)
+# Months shown in the collection rate by month
+RATE_MONTHS = 12
+
+
+class LedgerArrays(NamedTuple):
+    """Every installment of the ledger as parallel arrays"""
+    due_day: np.ndarray    # int32 day ordinal, 0 if the date is invalid
+    amount: np.ndarray     # float64
+    paid: np.ndarray       # bool
+    customer: np.ndarray   # int32 index into customer_ids
+    month: np.ndarray      # int64 months since 1970-01 of due_day, -1 if the date is invalid
+    customer_ids: List[str]
+
+
+def ledger_arrays(ledger: Dict[str, tuple]) -> LedgerArrays:
+    """Copy a Customer_ID -> installments mapping into arrays"""
+    customer_ids = list(ledger)
+    records = list(chain.from_iterable(ledger.values()))
+    # fromiter over attrgetter fills each column without intermediate lists
+    due_day = np.fromiter(map(attrgetter("due_day"), records), dtype=np.int32, count=len(records))
+    amount = np.fromiter(map(attrgetter("amount"), records), dtype=np.float64, count=len(records))
+    paid = np.fromiter(map(attrgetter("paid"), records), dtype=np.bool_, count=len(records))
+    customer = np.repeat(
+        np.arange(len(customer_ids), dtype=np.int32),
+        [len(installments) for installments in ledger.values()]
+    )
+    month = np.full(len(records), -1, dtype=np.int64)
+    dated = due_day > 0
+    month[dated] = month_index(due_day[dated])
+    return LedgerArrays(due_day, amount, paid, customer, month, customer_ids)
+
+
+def month_index(days: np.ndarray) -> np.ndarray:
+    """Months since 1970-01 of day ordinals"""
+    return (days - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def portfolio_kpis(arrays: LedgerArrays, today: int) -> Dict:
+    """Portfolio KPIs on a given day (a date ordinal).
+
+    Amounts are sums of installment amounts:
+    receivable: unpaid; overdue: unpaid and due before today; collected:
+    paid; expected_cash: unpaid and due in the next N days (today included);
+    collection_rate: per month up to the current one, the share of the
+    amount due that month that has been paid.
+    """
+    due_day, amount, paid = arrays.due_day, arrays.amount, arrays.paid
+    unpaid = ~paid
+    unpaid_amount = np.where(unpaid, amount, 0.0)
+    dated = due_day > 0
+
+    expected_cash = {}
+    for horizon in CASH_HORIZONS:
+        window = dated & (due_day >= today) & (due_day < today + horizon)
+        expected_cash[horizon] = float(unpaid_amount[window].sum())
+
+    overdue_mask = unpaid & dated & (due_day < today)
+    overdue_customers = np.count_nonzero(
+        np.bincount(arrays.customer[overdue_mask], minlength=len(arrays.customer_ids))
+    )
+
+    return {
+        "customers": len(arrays.customer_ids),
+        "installments": int(len(due_day)),
+        "receivable": float(unpaid_amount.sum()),
+        "overdue": float(amount[overdue_mask].sum()),
+        "overdue_customers": int(overdue_customers),
+        "collected": float(amount[paid].sum()),
+        "expected_cash": expected_cash,
+        "collection_rate": collection_rate_by_month(arrays, today),
+    }
+
+
+def collection_rate_by_month(arrays: LedgerArrays, today: int, months: int = RATE_MONTHS) -> List[Dict]:
+    """Amount due, amount paid and paid share for each of the last months (oldest first)"""
+    current = int(month_index(np.array([today]))[0])
+    first = current - months + 1
+    month = arrays.month
+    in_range = (month >= first) & (month <= current)
+
+    # One bucket per month: bincount sums the amounts of each month at once
+    buckets = month[in_range] - first
+    due = np.bincount(buckets, weights=arrays.amount[in_range], minlength=months)
+    collected = np.bincount(buckets, weights=np.where(arrays.paid[in_range], arrays.amount[in_range], 0.0),
+                            minlength=months)
+
+    rates = []
+    for offset in range(months):
+        label = str(np.datetime64(first + offset, "M"))
+        rates.append({
+            "month": label,
+            "due": float(due[offset]),
+            "collected": float(collected[offset]),
+            "rate": float(collected[offset] / due[offset]) if due[offset] else None,
+        })
+    return rates
+
+
+class PortfolioAnalytics:
+    """KPIs of a CSVManager's data, with the ledger arrays cached per data version"""
+
+    def __init__(self, csv_manager: CSVManager):
+        self.csv_manager = csv_manager
+        self._arrays: Optional[LedgerArrays] = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def arrays(self) -> LedgerArrays:
+        """The ledger arrays, rebuilt only when the data changed"""
+        with self._lock:
+            version, ledger = self.csv_manager.get_ledger()
+            if self._arrays is None or version != self._version:
+                self._arrays = ledger_arrays(ledger)
+                self._version = version
+            return self._arrays
+
+    def kpis(self, today: Optional[date] = None) -> Optional[Dict]:
+        """Portfolio KPIs (see portfolio_kpis), or None on error"""
+        try:
+            return portfolio_kpis(self.arrays(), (today or date.today()).toordinal())
+        except Exception as e:
+            logging.error(f"Error computing portfolio analytics: {str(e)}")
+            return None
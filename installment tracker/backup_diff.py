@@ -0,0 +1,221 @@
+"""
+Differences between two backups (or a backup and the current data).
+
+Both sides are streamed: the first pass keeps only a hash per customer, the
+second compares the other side against those hashes, and a last pass over
+the first side fetches just the rows that were removed or changed. Changed
+customers are broken down into changed fields and changed installments.
+
+Customers are matched by Customer_ID. Backups taken before customers had an
+id (legacy backup_*.csv files) are matched by name and phone instead.
+
+Values are compared in canonical form (canonical_row), so a legacy backup
+that wrote "300" and 97431663542 where the current file has 300.0 and
++97431663542, or str() lists where it has JSON, shows no change.
+"""
+from typing import List, Dict, Iterable, Callable, NamedTuple, Tuple
+from ledger import parse_installments
+from backups import row_hash
+from normalize import normalize_phone
+from codec import decode_list, decode_dict, encode_list, encode_dict
+
+# Columns compared installment by installment rather than as raw strings
+INSTALLMENT_COLUMNS = ("Installment Dates", "Paid_Installments", "Notified_Installments", "Installment_Values")
+# Columns compared as numbers ("300" and "300.0" are the same amount)
+NUMBER_COLUMNS = ("Amount", "Installments", "Installment Value")
+
+
+class InstallmentChange(NamedTuple):
+    """One installment that differs between the two sides"""
+    due_date: str
+    kind: str     # "added", "removed", "paid", "unpaid", "notified", "amount"
+    old: str
+    new: str
+
+
+class CustomerChange(NamedTuple):
+    """A customer present on both sides with different values"""
+    customer_id: str
+    name: str
+    fields: Dict[str, Tuple[str, str]]  # column -> (old value, new value)
+    installments: List[InstallmentChange]
+
+
+class BackupDiff(NamedTuple):
+    """Customers added, removed and changed from the old side to the new side"""
+    added: List[Dict]
+    removed: List[Dict]
+    changed: List[CustomerChange]
+    # "id", or "contact" when a side had rows without Customer_ID (matched by name and phone)
+    matched_by: str = "id"
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+
+def _stored(value) -> str:
+    """A value the way the CSV file stores it"""
+    return "" if value is None else str(value)
+
+
+def canonical_value(column: str, value) -> str:
+    """One stored value in a form that is the same for every format that wrote it"""
+    text = _stored(value).strip()
+    if column in NUMBER_COLUMNS:
+        try:
+            return repr(float(text))
+        except ValueError:
+            return text
+    if column == "Phone":
+        return normalize_phone(text) if text else ""
+    if column == "Notification Sent":
+        # Read the same way CSVManager reads it
+        return str(text.lower() == "true")
+    if column == "Installment Dates":
+        return ";".join(date.strip() for date in text.split(";") if date.strip())
+    if column in ("Paid_Installments", "Notified_Installments"):
+        # Read as sets of dates by parse_installments, so order does not matter
+        return encode_list(sorted(set(decode_list(text))))
+    if column == "Installment_Values":
+        return encode_dict(dict(sorted(decode_dict(text).items())))
+    return _stored(value)
+
+
+def canonical_row(row: Dict, columns: List[str]) -> Dict[str, str]:
+    """The columns of a row in canonical form, for hashing and comparing"""
+    return {column: canonical_value(column, row.get(column)) for column in columns}
+
+
+def contact_key(row: Dict) -> Tuple[str, str]:
+    """Name and normalized phone of a row, the key of rows that have no id"""
+    return _stored(row.get("Name")).strip(), normalize_phone(_stored(row.get("Phone")))
+
+
+def diff_rows(old_rows: Callable[[], Iterable[Dict]], new_rows: Callable[[], Iterable[Dict]],
+              columns: List[str], id_column: str, version_column: str = "Row_Version") -> BackupDiff:
+    """Compare two datasets keyed by id_column.
+
+    old_rows and new_rows return a fresh iterator over their rows each time
+    they are called; old_rows is iterated twice.
+
+    If some old rows have no id, every row is matched by name and phone
+    (contact_key). New rows without an id are matched by name and phone to
+    the id of the old row with the same contact.
+    """
+    # Rows with an id are kept under it, rows without one under their contact key
+    old_hashes = {}
+    ids_by_contact = {}
+    missing_ids = False
+    for row in old_rows():
+        contact = contact_key(row)
+        customer_id = row.get(id_column)
+        if customer_id:
+            ids_by_contact[contact] = customer_id
+        else:
+            missing_ids = True
+        old_hashes[customer_id or contact] = row_hash(canonical_row(row, columns), columns)
+    if missing_ids:
+        for contact, customer_id in ids_by_contact.items():
+            old_hashes[contact] = old_hashes.pop(customer_id)
+
+    def key_of(row: Dict):
+        contact = contact_key(row)
+        if missing_ids:
+            return contact
+        return row.get(id_column) or ids_by_contact.get(contact, contact)
+
+    added = []
+    changed_new = {}
+    seen = set()
+    for row in new_rows():
+        key = key_of(row)
+        seen.add(key)
+        old_hash = old_hashes.get(key)
+        if old_hash is None:
+            added.append(row)
+        elif old_hash != row_hash(canonical_row(row, columns), columns):
+            changed_new[key] = row
+    del old_hashes  # Only the changed and removed rows are needed from here on
+
+    removed = []
+    changed = []
+    for row in old_rows():
+        key = key_of(row)
+        if key not in seen:
+            removed.append(row)
+        elif key in changed_new:
+            change = diff_customer(row, changed_new[key], columns, id_column, version_column)
+            # Rows whose only difference is their Row_Version are not reported
+            if change.fields or change.installments:
+                changed.append(change)
+    return BackupDiff(added, removed, changed, "contact" if missing_ids else "id")
+
+
+def diff_customer(old: Dict, new: Dict, columns: List[str], id_column: str,
+                  version_column: str = "Row_Version") -> CustomerChange:
+    """Changed fields and installments of one customer"""
+    skipped = set(INSTALLMENT_COLUMNS) | {id_column, version_column}
+    # Compared in canonical form, reported as stored
+    fields = {
+        column: (_stored(old.get(column)), _stored(new.get(column)))
+        for column in columns
+        if column not in skipped
+        and canonical_value(column, old.get(column)) != canonical_value(column, new.get(column))
+    }
+
+    customer_id = _stored(new.get(id_column))
+    old_installments = {installment.due_date: installment for installment in parse_installments(customer_id, old)}
+    new_installments = {installment.due_date: installment for installment in parse_installments(customer_id, new)}
+    installments = []
+    for due_date in sorted(old_installments.keys() | new_installments.keys()):
+        before = old_installments.get(due_date)
+        after = new_installments.get(due_date)
+        if before is None:
+            installments.append(InstallmentChange(due_date, "added", "", f"{after.amount:g}"))
+        elif after is None:
+            installments.append(InstallmentChange(due_date, "removed", f"{before.amount:g}", ""))
+        else:
+            if before.paid != after.paid:
+                installments.append(InstallmentChange(due_date, "paid" if after.paid else "unpaid", "", ""))
+            if before.notified != after.notified and after.notified:
+                installments.append(InstallmentChange(due_date, "notified", "", ""))
+            if before.amount != after.amount:
+                installments.append(InstallmentChange(due_date, "amount", f"{before.amount:g}", f"{after.amount:g}"))
+    return CustomerChange(customer_id, _stored(new.get("Name")), fields, installments)
+
+
+if __name__ == "__main__":
+    # Self-check: diffs keyed by id, and legacy backups without Customer_ID
+    check_columns = ["Name", "Phone", "Installment Dates", "Paid_Installments", "Customer_ID", "Row_Version"]
+
+    def customer(name, phone, paid="[]", customer_id="", version=""):
+        return {"Name": name, "Phone": phone, "Installment Dates": "2025-01-01;2025-02-01",
+                "Paid_Installments": paid, "Customer_ID": customer_id, "Row_Version": version}
+
+    # Both sides with ids
+    old = [customer("A", "+97450000001", customer_id="a"), customer("B", "+97450000002", customer_id="b")]
+    new = [customer("A", "+97450000001", '["2025-01-01"]', "a", "1"), customer("C", "+97450000003", customer_id="c")]
+    diff = diff_rows(lambda: old, lambda: new, check_columns, "Customer_ID")
+    assert diff.matched_by == "id"
+    assert [row["Name"] for row in diff.added] == ["C"] and [row["Name"] for row in diff.removed] == ["B"]
+    assert [(change.name, [i.kind for i in change.installments]) for change in diff.changed] == [("A", ["paid"])]
+
+    # Two legacy backups: no ids at all, so rows are matched by name and phone
+    old = [customer("A", "0501"), customer("B", "0502"), customer("C", "0503")]
+    new = [customer("A", "0501"), customer("B", "0502", '["2025-02-01"]'), customer("C", "0503")]
+    diff = diff_rows(lambda: old, lambda: new, check_columns, "Customer_ID")
+    assert diff.matched_by == "contact" and not diff.added and not diff.removed
+    assert [(change.name, change.fields, [i.kind for i in change.installments]) for change in diff.changed] == \
+        [("B", {}, ["paid"])], diff
+
+    # A legacy backup against data with ids
+    new = [customer("A", "0501", customer_id="a", version="1"), customer("B", "0502", customer_id="b", version="1")]
+    diff = diff_rows(lambda: old, lambda: new, check_columns, "Customer_ID")
+    assert diff.matched_by == "contact" and not diff.added and not diff.changed
+    assert [row["Name"] for row in diff.removed] == ["C"]
+
+    # Data with ids against a legacy backup taken later (rows without an id take the old id)
+    diff = diff_rows(lambda: new, lambda: old, check_columns, "Customer_ID")
+    assert diff.matched_by == "id" and not diff.removed and not diff.changed
+    assert [row["Name"] for row in diff.added] == ["C"]
+    print("backup_diff self-check passed")
@@ -0,0 +1,160 @@
+"""
+Background verification of the backup files.
+
+A damaged backup used to go unnoticed until someone needed it. A worker
+thread now reads each backup when the app is idle, checks every row with
+CSVManager._validate_row and records the outcome in the backup catalog
+(status, row count, checksum). A backup whose size and modification time
+are those of its last check is skipped without being read; if only those
+changed, its checksum is compared with the one last verified. A pass reads
+the catalog once.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from utils import CSVManager
+from backups import file_checksum
+
+
+def _file_stat(path: str) -> Optional[List[int]]:
+    """Size and modification time of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _checksum(path: str, checksums: Dict[str, str]) -> str:
+    """file_checksum, computed once per pass for a snapshot shared by several deltas"""
+    checksum = checksums.get(path)
+    if checksum is None:
+        checksum = checksums[path] = file_checksum(path)
+    return checksum
+
+
+def verify_backup(csv_manager: CSVManager, name: str, entry: Optional[Dict] = None,
+                  checksums: Optional[Dict[str, str]] = None) -> Dict:
+    """Read one backup, validate its rows and record the result in the catalog.
+
+    Status is "ok", "warning" (readable, but some rows fail validation) or
+    "corrupt" (unreadable, truncated, or a delta whose snapshot is missing).
+    entry is the backup's catalog entry when the caller already read the
+    catalog; checksums keeps the checksums computed during one pass.
+    """
+    store = csv_manager.backups
+    # Entries of the catalog are shared with its cache, so update a copy
+    entry = store.entry(name) if entry is None else dict(entry)
+    checksums = {} if checksums is None else checksums
+    path = store.path(name)
+    stat = _file_stat(path)
+    if stat is None:
+        raise FileNotFoundError(path)
+    # A delta is only as good as its snapshot: re-verify it when either changes
+    if entry.get("base"):
+        stat.append(_file_stat(store.path(entry["base"])))
+    if entry.get("verified") and entry.get("verified_stat") == stat:
+        return entry
+
+    checksum = _checksum(path, checksums)
+    verified_key = checksum
+    if entry.get("base"):
+        try:
+            verified_key += ":" + _checksum(store.path(entry["base"]), checksums)
+        except FileNotFoundError:
+            verified_key += ":missing"
+    if entry.get("verified") == verified_key:
+        # Touched but not changed: remember its new size and time for the next pass
+        entry["verified_stat"] = stat
+        store.update_entry(entry)
+        return entry
+
+    rows = 0
+    invalid_rows = 0
+    error = None
+    try:
+        # A delta is read through its snapshot, so both files are checked
+        for row in store.iter_rows(name):
+            rows += 1
+            # Missing or extra fields: a torn or malformed line
+            if None in row or any(value is None for value in row.values()):
+                invalid_rows += 1
+            elif not csv_manager._validate_row(dict(row)):
+                invalid_rows += 1
+    except Exception as e:
+        # gzip raises EOFError on a truncated file, zlib/csv/json errors on damaged data
+        error = f"{type(e).__name__}: {str(e)}"
+
+    if error:
+        status = "corrupt"
+        logging.error(f"Backup {name} is corrupt: {error}")
+    elif invalid_rows:
+        status = "warning"
+        logging.warning(f"Backup {name} has {invalid_rows} invalid rows")
+    else:
+        status = "ok"
+
+    entry.update({
+        "size": os.path.getsize(path),
+        "records": rows if error is None else entry.get("records"),
+        "checksum": checksum,
+        "verified": verified_key,
+        "verified_stat": stat,
+        "status": status,
+        "invalid_rows": invalid_rows,
+        "error": error,
+        "verified_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    store.update_entry(entry)
+    return entry
+
+
+def verify_backups(csv_manager: CSVManager, pause: float = 0) -> Dict[str, int]:
+    """Verify every backup that changed since it was last verified.
+
+    pause seconds are slept after each file actually read, to stay in the
+    background. Returns the number of backups per status.
+    """
+    counts = {"ok": 0, "warning": 0, "corrupt": 0}
+    store = csv_manager.backups
+    # The catalog is read once per pass, not once per backup
+    entries = {entry["name"]: entry for entry in store.catalog()}
+    checksums = {}
+    for name in store.list():
+        try:
+            entry = entries.get(name)
+            before = entry.get("verified_at") if entry else None
+            entry = verify_backup(csv_manager, name, entry, checksums)
+            counts[entry["status"]] += 1
+            if pause and entry.get("verified_at") != before:
+                time.sleep(pause)
+        except FileNotFoundError:
+            continue  # Removed by compaction meanwhile
+        except Exception as e:
+            logging.error(f"Error verifying backup {name}: {str(e)}")
+    return counts
+
+
+def run_verification(csv_manager: CSVManager, interval: int, pause: float):
+    """Verify the backups now and then every interval seconds"""
+    # Let the app finish starting before reading files
+    time.sleep(60)
+    while True:
+        try:
+            counts = verify_backups(csv_manager, pause)
+            logging.info(f"Backup verification: {counts}")
+        except Exception as e:
+            logging.error(f"Error in backup verification: {str(e)}")
+        time.sleep(interval)
+
+
+def start_verification_thread(csv_manager: CSVManager, interval: int = 60 * 60, pause: float = 1.0):
+    """Start a background thread that verifies the backups."""
+    verification_thread = threading.Thread(
+        target=run_verification, args=(csv_manager, interval, pause), daemon=True
+    )
+    verification_thread.start()
+    logging.info("Backup verification thread started")
@@ -0,0 +1,599 @@
+"""
+Deduplicated, compressed backup store.
+
+A backup used to be a full copy of customers.csv per save, named by the
+second it was taken (so two saves in one second overwrote each other) and
+kept forever. The store in data/backups now holds:
+
+- base_<stamp>.csv.gz: a full snapshot, taken periodically;
+- delta_<stamp>.json.gz: the rows changed or deleted since its base snapshot.
+
+Deltas are cumulative against their base, so any backup is restored from at
+most two files. Each row is hashed, and a backup of data identical to the
+latest backup is skipped. Older uncompressed files (backup_<stamp>.csv full
+copies, base/delta files without .gz) are still listed and restored.
+
+A compaction job (start_compaction_thread) compresses those older files and
+thins old backups following RETENTION: one per hour for a day, one per day
+for a month, one per month after that.
+
+catalog.jsonl describes every backup (time, size, record count, checksum,
+reason), so the restore dialog never has to scan or open the backup files.
+"""
+import os
+import io
+import csv
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Callable
+from storage import atomic_write_csv, fsync_directory
+from concurrency import FileLock
+
+BASE_PREFIX = "base_"
+DELTA_PREFIX = "delta_"
+LEGACY_PREFIX = "backup_"
+STAMP_FORMAT = "%Y%m%d_%H%M%S_%f"
+CATALOG_NAME = "catalog.jsonl"
+
+# (maximum age, bucket format): the newest backup of each bucket is kept.
+# A maximum age of None covers everything older.
+RETENTION = (
+    (timedelta(days=1), "%Y%m%d%H"),   # hourly for a day
+    (timedelta(days=31), "%Y%m%d"),    # daily for a month
+    (None, "%Y%m"),                    # monthly forever
+)
+
+
+def row_hash(row: Dict, columns: List[str]) -> str:
+    """Hash of a row's stored values (as they appear in a CSV file)"""
+    values = ["" if row.get(column) is None else str(row.get(column)) for column in columns]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def content_hash(row_hashes: Dict[str, str]) -> str:
+    """Hash of a whole dataset, independent of row order"""
+    digest = hashlib.sha256()
+    for key, value in sorted(row_hashes.items()):
+        digest.update(f"{key}:{value}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def backup_time(name: str) -> Optional[datetime]:
+    """Time a backup was taken, from its file name"""
+    stamp = name.split(".", 1)[0].split("_", 1)[-1]
+    for stamp_format in (STAMP_FORMAT, "%Y%m%d_%H%M%S"):
+        try:
+            return datetime.strptime(stamp, stamp_format)
+        except ValueError:
+            continue
+    return None
+
+
+def is_backup_name(name: str) -> bool:
+    """Check whether a file name is a snapshot, a delta or an older full copy"""
+    if name.startswith((BASE_PREFIX, LEGACY_PREFIX)):
+        return name.endswith((".csv", ".csv.gz"))
+    if name.startswith(DELTA_PREFIX):
+        return name.endswith((".json", ".json.gz"))
+    return False
+
+
+def file_checksum(path: str) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _open_text(path: str, mode: str = 'r'):
+    """Open a backup file as text, compressed or not"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode=mode + 't', encoding='utf-8', newline='')
+    return open(path, mode=mode, encoding='utf-8', newline='')
+
+
+class BackupStore:
+    """Base snapshots plus cumulative deltas in one folder"""
+
+    def __init__(self, folder: str, columns: List[str], id_column: str,
+                 rebase_ratio: float = 0.25, rebase_min_rows: int = 50, max_deltas: int = 100):
+        self.folder = folder
+        self.columns = columns
+        self.id_column = id_column
+        # A new base snapshot is taken once a delta would carry more than
+        # max(rebase_min_rows, rebase_ratio * base rows) rows, or after
+        # max_deltas deltas on the same base
+        self.rebase_ratio = rebase_ratio
+        self.rebase_min_rows = rebase_min_rows
+        self.max_deltas = max_deltas
+        # Serializes saves and compaction, also with other app instances
+        self._lock = FileLock(os.path.join(folder, ".lock"))
+        # Row hashes of the current base snapshot: (name, {id: hash})
+        self._base: Optional[Tuple[str, Dict[str, str]]] = None
+        # (name, content hash) of the latest backup
+        self._latest: Optional[Tuple[str, str]] = None
+        # Sorted listing, reused while the folder's mtime is unchanged
+        self._listing: Optional[Tuple[int, List[str]]] = None
+        # Parsed catalog, reused while catalog.jsonl is unchanged
+        self._catalog_cache: Optional[Tuple[tuple, List[Dict]]] = None
+
+    def list(self) -> List[str]:
+        """Backup names, newest first"""
+        try:
+            stamp = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        # Adding, removing or renaming a file bumps the folder's mtime
+        if self._listing is None or self._listing[0] != stamp:
+            names = [name for name in os.listdir(self.folder) if is_backup_name(name)]
+            names.sort(key=lambda name: backup_time(name) or datetime.min, reverse=True)
+            self._listing = (stamp, names)
+        return list(self._listing[1])
+
+    def save(self, rows: Iterable[Dict], reason: str = "manual") -> str:
+        """Back up rows; returns the path of the new backup, or of the latest one if nothing changed.
+
+        reason says what triggered the backup and is kept in the catalog.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        rows = list(rows)
+        with self._lock:
+            return self._save_locked(rows, reason)
+
+    def _save_locked(self, rows: List[Dict], reason: str) -> str:
+        keys = [row.get(self.id_column) for row in rows]
+        if not all(keys) or len(set(keys)) != len(keys):
+            # Rows not yet given a Customer_ID cannot be matched across backups
+            return self._write_base(rows, None, reason)
+
+        hashes = {row[self.id_column]: row_hash(row, self.columns) for row in rows}
+        digest = content_hash(hashes)
+
+        latest = self._latest_backup()
+        if latest is not None and latest[1] == digest:
+            logging.info(f"Data unchanged since backup {latest[0]}; skipped")
+            return os.path.join(self.folder, latest[0])
+
+        base = self._current_base()
+        if base is not None:
+            base_name, base_hashes = base
+            changed = [row for row in rows if base_hashes.get(row[self.id_column]) != hashes[row[self.id_column]]]
+            deleted = [key for key in base_hashes if key not in hashes]
+            limit = max(self.rebase_min_rows, int(len(base_hashes) * self.rebase_ratio))
+            if len(changed) + len(deleted) <= limit and self._delta_count(base_name) < self.max_deltas:
+                name = self._new_name(DELTA_PREFIX, ".json.gz")
+                self._write_delta(name, base_name, digest, changed, deleted)
+                self._latest = (name, digest)
+                self._record(self._entry(name, len(rows), digest, reason, base_name))
+                return os.path.join(self.folder, name)
+
+        return self._write_base(rows, (hashes, digest), reason)
+
+    def _write_base(self, rows: List[Dict], hashed: Optional[Tuple[Dict[str, str], str]], reason: str) -> str:
+        """Write a new base snapshot"""
+        name = self._new_name(BASE_PREFIX, ".csv.gz")
+        self._atomic_write(os.path.join(self.folder, name), lambda file: self._write_rows(file, rows))
+        if hashed is not None:
+            self._base = (name, hashed[0])
+            self._latest = (name, hashed[1])
+        self._record(self._entry(name, len(rows), hashed[1] if hashed else None, reason))
+        return os.path.join(self.folder, name)
+
+    def load(self, name: str) -> List[Dict]:
+        """Rows of a backup, with a delta applied to its base snapshot"""
+        return list(self.iter_rows(name))
+
+    def iter_rows(self, name: str) -> Iterator[Dict]:
+        """Stream the rows of a backup; only a delta's own rows are held in memory"""
+        name = self._resolve(name)
+        path = os.path.join(self.folder, name)
+        if not name.startswith(DELTA_PREFIX):
+            with _open_text(path) as file:
+                yield from csv.DictReader(file)
+            return
+
+        delta = self._read_delta(path)
+        changed = {row[self.id_column]: row for row in delta["changed"]}
+        deleted = set(delta["deleted"])
+        with _open_text(os.path.join(self.folder, self._resolve(delta["base"]))) as file:
+            for row in csv.DictReader(file):
+                key = row.get(self.id_column)
+                if key in deleted:
+                    continue
+                yield changed.pop(key, row)
+        # Rows added after the base snapshot
+        yield from changed.values()
+
+    def backup_at(self, when: datetime) -> Optional[str]:
+        """Name of the newest backup taken at or before when"""
+        moment = when.isoformat()
+        for entry in self.catalog():  # Newest first
+            if entry.get("time") and entry["time"] <= moment:
+                return entry["name"]
+        return None
+
+    def export(self, name: str) -> str:
+        """Write a backup as a standalone CSV file; returns a temporary path the caller removes"""
+        fd, path = tempfile.mkstemp(dir=self.folder, prefix="restore_", suffix=".tmp")
+        os.close(fd)
+        atomic_write_csv(path, self.columns, self.load(name))
+        return path
+
+    def exists(self, name: str) -> bool:
+        """Check whether a backup (and the base snapshot it needs) exists"""
+        name = self._resolve(name)
+        path = os.path.join(self.folder, name)
+        if not os.path.exists(path):
+            return False
+        if name.startswith(DELTA_PREFIX):
+            return os.path.exists(os.path.join(self.folder, self._resolve(self._read_delta(path)["base"])))
+        return True
+
+    def catalog(self) -> List[Dict]:
+        """Catalog entries of every backup, newest first.
+
+        Each entry has name, time (ISO format), kind ("snapshot", "delta" or
+        "copy"), size, records, checksum (SHA-256 of the file), content_hash,
+        reason and base (the snapshot a delta applies to). Backups found on
+        disk but never catalogued have records, checksum and reason None.
+        Verified entries also have status ("ok", "warning" or "corrupt"),
+        verified (the checksum that was verified), verified_stat (size and
+        modification time of the file, and of a delta's snapshot, when it was
+        verified), invalid_rows, error and verified_at.
+        """
+        path = os.path.join(self.folder, CATALOG_NAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if not self.list():
+                return []
+            # First run with backups from before the catalog existed
+            with self._lock:
+                self._rewrite_catalog()
+            stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._catalog_cache is None or self._catalog_cache[0] != stamp:
+            entries = sorted(self._read_catalog().values(), key=lambda entry: entry.get("time") or "", reverse=True)
+            self._catalog_cache = (stamp, entries)
+        return self._catalog_cache[1]
+
+    def catalog_page(self, offset: int, limit: int) -> Tuple[List[Dict], int]:
+        """One page of the catalog (newest first) and the total number of backups"""
+        entries = self.catalog()
+        return entries[offset:offset + limit], len(entries)
+
+    def entry(self, name: str) -> Dict:
+        """Catalog entry of one backup (a fresh one if it was never catalogued)"""
+        name = self._resolve(name)
+        entry = self._read_catalog().get(name)
+        return dict(entry) if entry is not None else self._entry(name, checksum=False)
+
+    def update_entry(self, entry: Dict):
+        """Store an updated catalog entry, e.g. verification results (see backup_verifier.py)"""
+        with self._lock:
+            if os.path.exists(os.path.join(self.folder, entry["name"])):
+                self._record(entry)
+
+    def path(self, name: str) -> str:
+        """Path of a backup file"""
+        return os.path.join(self.folder, self._resolve(name))
+
+    def _entry(self, name: str, records: Optional[int] = None, content: Optional[str] = None,
+               reason: Optional[str] = None, base: Optional[str] = None, checksum: bool = True) -> Dict:
+        """Catalog entry of a backup file"""
+        path = os.path.join(self.folder, name)
+        taken = backup_time(name)
+        if name.startswith(DELTA_PREFIX):
+            kind = "delta"
+        elif name.startswith(BASE_PREFIX):
+            kind = "snapshot"
+        else:
+            kind = "copy"
+        return {
+            "name": name,
+            "time": taken.isoformat() if taken else None,
+            "kind": kind,
+            "size": os.path.getsize(path),
+            "records": records,
+            "checksum": file_checksum(path) if checksum else None,
+            "content_hash": content,
+            "reason": reason,
+            "base": base,
+        }
+
+    def _record(self, entry: Dict):
+        """Add an entry to the catalog (called with the folder lock held)"""
+        path = os.path.join(self.folder, CATALOG_NAME)
+        if not os.path.exists(path):
+            self._rewrite_catalog()
+        with open(path, mode='a', encoding='utf-8') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _read_catalog(self) -> Dict[str, Dict]:
+        """Catalog entries by name; a later line for the same name wins"""
+        path = os.path.join(self.folder, CATALOG_NAME)
+        entries = {}
+        if not os.path.exists(path):
+            return entries
+        with open(path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    entries[entry["name"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f"Ignoring invalid backup catalog line in {path}")
+        return entries
+
+    def _rewrite_catalog(self):
+        """Rewrite the catalog to match the backup files on disk (called with the folder lock held)"""
+        old = self._read_catalog()
+        entries = []
+        for name in reversed(self.list()):
+            entry = old.get(name)
+            if entry is None and name.endswith(".gz") and name[:-3] in old:
+                # Compressed by compaction since it was catalogued
+                path = os.path.join(self.folder, name)
+                entry = dict(old[name[:-3]], name=name, size=os.path.getsize(path), checksum=file_checksum(path))
+            if entry is None:
+                entry = self._entry(name, checksum=False)
+            entries.append(entry)
+
+        path = os.path.join(self.folder, CATALOG_NAME)
+        fd, temp_file = tempfile.mkstemp(dir=self.folder, prefix=CATALOG_NAME + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as file:
+                for entry in entries:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_file, path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        fsync_directory(path)
+
+    def report(self) -> Dict:
+        """Counts and sizes of the stored backups, for the backup page"""
+        names = self.list()
+        sizes = {}
+        for name in names:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                continue
+        times = [backup_time(name) for name in sizes if backup_time(name)]
+        try:
+            free_bytes = shutil.disk_usage(self.folder).free
+        except OSError:
+            free_bytes = None
+        statuses = [entry.get("status") for entry in self.catalog() if entry["name"] in sizes]
+        return {
+            "count": len(sizes),
+            "bases": sum(1 for name in sizes if not name.startswith(DELTA_PREFIX)),
+            "deltas": sum(1 for name in sizes if name.startswith(DELTA_PREFIX)),
+            "total_bytes": sum(sizes.values()),
+            "uncompressed": sum(1 for name in sizes if not name.endswith(".gz")),
+            "oldest": min(times) if times else None,
+            "newest": max(times) if times else None,
+            "free_bytes": free_bytes,
+            # Set by the background verifier (see backup_verifier.py)
+            "corrupt": statuses.count("corrupt"),
+            "unverified": statuses.count(None) + len(sizes) - len(statuses),
+        }
+
+    def compact(self, now: Optional[datetime] = None) -> Tuple[int, int]:
+        """Compress uncompressed backups and remove the ones RETENTION does not keep.
+
+        Returns (files compressed, files removed).
+        """
+        if not os.path.exists(self.folder):
+            return 0, 0
+        with self._lock:
+            compressed = 0
+            for name in self.list():
+                if not name.endswith(".gz"):
+                    self._compress(name)
+                    compressed += 1
+
+            names = self.list()
+            keep = self._retained(names, now or datetime.now())
+            removed = 0
+            for name in names:
+                if name in keep:
+                    continue
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass  # Already removed by another app instance
+            if removed:
+                self._listing = None
+                fsync_directory(os.path.join(self.folder, names[0]))
+            if compressed or removed or not os.path.exists(os.path.join(self.folder, CATALOG_NAME)):
+                self._rewrite_catalog()
+            self._clean_temp_files()
+        if compressed or removed:
+            logging.info(f"Backup compaction: {compressed} compressed, {removed} removed")
+        return compressed, removed
+
+    def _retained(self, names: List[str], now: datetime) -> set:
+        """Backups kept by RETENTION, plus the snapshots the kept deltas need"""
+        keep = set(names[:1])  # Always keep the latest backup
+        buckets = set()
+        for name in names:  # Newest first: the first backup seen in a bucket is kept
+            taken = backup_time(name)
+            if taken is None:
+                keep.add(name)
+                continue
+            for max_age, bucket_format in RETENTION:
+                if max_age is None or now - taken <= max_age:
+                    bucket = (bucket_format, taken.strftime(bucket_format))
+                    if bucket not in buckets:
+                        buckets.add(bucket)
+                        keep.add(name)
+                    break
+
+        for name in list(keep):
+            if name.startswith(DELTA_PREFIX):
+                try:
+                    keep.add(self._resolve(self._read_delta(os.path.join(self.folder, name))["base"]))
+                except (OSError, ValueError, KeyError):
+                    logging.warning(f"Unreadable backup delta kept as is: {name}")
+        return keep
+
+    def _compress(self, name: str):
+        """Replace an uncompressed backup with a gzip copy of it"""
+        path = os.path.join(self.folder, name)
+
+        def copy(file):
+            with open(path, mode='r', encoding='utf-8', newline='') as source:
+                for chunk in iter(lambda: source.read(1024 * 1024), ""):
+                    file.write(chunk)
+
+        try:
+            self._atomic_write(path + ".gz", copy)
+            os.remove(path)
+            self._listing = None
+        except FileNotFoundError:
+            pass  # Compressed by another app instance meanwhile
+
+    def _clean_temp_files(self):
+        """Remove temporary files left behind by a crash during a save or restore"""
+        cutoff = time.time() - 60 * 60
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(".tmp") and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _atomic_write(self, path: str, write: Callable):
+        """Write a gzip-compressed text file through a temporary file and a rename"""
+        fd, temp_file = tempfile.mkstemp(dir=self.folder, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode='wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as compressed:
+                    with io.TextIOWrapper(compressed, encoding='utf-8', newline='') as file:
+                        write(file)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(temp_file, path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        finally:
+            # Folder mtimes can be too coarse to see two changes in a row
+            self._listing = None
+        fsync_directory(path)
+
+    def _write_rows(self, file, rows: List[Dict]):
+        writer = csv.DictWriter(file, fieldnames=self.columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    def _write_delta(self, name: str, base_name: str, digest: str, changed: List[Dict], deleted: List[str]):
+        """Write a delta file atomically"""
+        record = {
+            "base": base_name,
+            "hash": digest,
+            "changed": [{column: self._stored(row.get(column)) for column in self.columns} for row in changed],
+            "deleted": deleted,
+        }
+        self._atomic_write(os.path.join(self.folder, name), lambda file: json.dump(record, file, ensure_ascii=False))
+
+    @staticmethod
+    def _stored(value) -> str:
+        """A value the way the CSV file stores it"""
+        return "" if value is None else str(value)
+
+    def _resolve(self, name: str) -> str:
+        """Current file name of a backup; compaction may have compressed it since it was listed"""
+        if name.endswith(".gz") or os.path.exists(os.path.join(self.folder, name)):
+            return name
+        if os.path.exists(os.path.join(self.folder, name + ".gz")):
+            return name + ".gz"
+        return name
+
+    def _read_delta(self, path: str) -> Dict:
+        with _open_text(path) as file:
+            return json.load(file)
+
+    def _read_csv(self, path: str) -> List[Dict]:
+        with _open_text(path) as file:
+            return list(csv.DictReader(file))
+
+    def _current_base(self) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Name and row hashes of the newest base snapshot"""
+        names = [name for name in self.list() if name.startswith(BASE_PREFIX)]
+        if not names:
+            return None
+        if self._base is None or self._base[0] != names[0]:
+            rows = self._read_csv(os.path.join(self.folder, names[0]))
+            self._base = (names[0], {row.get(self.id_column): row_hash(row, self.columns) for row in rows})
+        return self._base
+
+    def _latest_backup(self) -> Optional[Tuple[str, str]]:
+        """Name and content hash of the newest backup"""
+        names = self.list()
+        if not names:
+            return None
+        if self._latest is None or self._latest[0] != names[0]:
+            name = names[0]
+            entry = self._read_catalog().get(name)
+            if entry is not None and entry.get("content_hash"):
+                digest = entry["content_hash"]
+            elif name.startswith(DELTA_PREFIX):
+                digest = self._read_delta(os.path.join(self.folder, name))["hash"]
+            else:
+                rows = self.load(name)
+                digest = content_hash({row.get(self.id_column): row_hash(row, self.columns) for row in rows})
+            self._latest = (name, digest)
+        return self._latest
+
+    def _delta_count(self, base_name: str) -> int:
+        """Number of deltas taken since a base snapshot"""
+        base_time = backup_time(base_name) or datetime.min
+        return sum(
+            1 for name in self.list()
+            if name.startswith(DELTA_PREFIX) and (backup_time(name) or datetime.min) > base_time
+        )
+
+    def _new_name(self, prefix: str, extension: str) -> str:
+        """File name for a backup taken now; never reuses an existing name"""
+        now = datetime.now()
+        while True:
+            name = f"{prefix}{now.strftime(STAMP_FORMAT)}{extension}"
+            if not os.path.exists(os.path.join(self.folder, name)):
+                return name
+            now += timedelta(microseconds=1)
+
+
+def run_compaction(store: BackupStore, interval: int):
+    """Compact the backup store now and then every interval seconds"""
+    while True:
+        try:
+            store.compact()
+        except Exception as e:
+            logging.error(f"Error compacting backups: {str(e)}")
+        time.sleep(interval)
+
+
+def start_compaction_thread(store: BackupStore, interval: int = 6 * 60 * 60):
+    """Start a background thread that compacts the backup store"""
+    compaction_thread = threading.Thread(target=run_compaction, args=(store, interval), daemon=True)
+    compaction_thread.start()
+    logging.info("Backup compaction thread started")
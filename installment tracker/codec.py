@@ -0,0 +1,156 @@
+"""
+Codec for the list/dict columns of a customer row.
+
+Paid_Installments, Notified_Installments and Installment_Values used to be
+written with str() and read back with eval(). They are now written as compact
+JSON. Old files keep working: values written by str() are recognised by a
+strict pattern (a list of quoted strings, or a dict of quoted strings to
+numbers) and never executed.
+"""
+import re
+import json
+import logging
+from typing import Dict, List
+
+DICT_COLUMNS = ("Installment_Values",)
+
+_QUOTED = r"'[^'\\]*'"
+_NUMBER = r"-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?"
+_LEGACY_LIST = re.compile(rf"\[\s*(?:{_QUOTED}\s*(?:,\s*{_QUOTED}\s*)*,?\s*)?\]")
+_LEGACY_DICT = re.compile(
+    rf"\{{\s*(?:{_QUOTED}\s*:\s*{_NUMBER}\s*(?:,\s*{_QUOTED}\s*:\s*{_NUMBER}\s*)*,?\s*)?\}}"
+)
+_LEGACY_ITEM = re.compile(r"'([^'\\]*)'")
+_LEGACY_PAIR = re.compile(rf"'([^'\\]*)'\s*:\s*({_NUMBER})")
+
+
+class CachedRow(dict):
+    """A customer row that remembers its decoded list/dict columns"""
+    __slots__ = ("_decoded",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._decoded = {}
+
+
+class FrozenRow(CachedRow):
+    """A read-only customer row, shared by every snapshot that contains it.
+
+    dict(row) or CachedRow(row) gives a mutable copy to build a changed row.
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("customer rows are read-only; use the CSVManager mutation methods")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+def freeze_row(row: Dict) -> FrozenRow:
+    """Read-only version of a row, keeping its decoded columns"""
+    if isinstance(row, FrozenRow):
+        return row
+    frozen = FrozenRow(row)
+    memo = getattr(row, "_decoded", None)
+    if memo:
+        frozen._decoded.update(memo)
+    return frozen
+
+
+def decode_list(value) -> List[str]:
+    """Decode a list column (JSON or legacy str(list))"""
+    if isinstance(value, list):
+        return value
+    if not value:
+        return []
+    value = value.strip()
+    if value.startswith("[\""):
+        try:
+            decoded = json.loads(value)
+            if isinstance(decoded, list):
+                return [str(item) for item in decoded]
+        except ValueError:
+            pass
+    elif _LEGACY_LIST.fullmatch(value):
+        return _LEGACY_ITEM.findall(value)
+    elif value == "[]":
+        return []
+    logging.warning(f"Invalid list column value: {value!r}")
+    return []
+
+
+def decode_dict(value) -> Dict[str, float]:
+    """Decode a dict column of date -> amount (JSON or legacy str(dict))"""
+    if isinstance(value, dict):
+        return value
+    if not value:
+        return {}
+    value = value.strip()
+    if value.startswith("{\""):
+        try:
+            decoded = json.loads(value)
+            if isinstance(decoded, dict):
+                return {str(key): float(amount) for key, amount in decoded.items()}
+        except (ValueError, TypeError):
+            pass
+    elif _LEGACY_DICT.fullmatch(value):
+        return {key: float(amount) for key, amount in _LEGACY_PAIR.findall(value)}
+    elif value == "{}":
+        return {}
+    logging.warning(f"Invalid dict column value: {value!r}")
+    return {}
+
+
+def encode_list(values: List[str]) -> str:
+    """Encode a list column as compact JSON"""
+    return json.dumps(list(values), ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_dict(values: Dict[str, float]) -> str:
+    """Encode a dict column as compact JSON"""
+    return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_column(row: Dict, column: str):
+    """Decode a list/dict column of a row.
+
+    On a CachedRow the result is remembered until the raw value changes, so
+    repeated reads of an unchanged row are free. Callers must not mutate it.
+    """
+    raw = row.get(column, "")
+    decoder = decode_dict if column in DICT_COLUMNS else decode_list
+    memo = getattr(row, "_decoded", None)
+    if memo is None:
+        return decoder(raw)
+
+    cached = memo.get(column)
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+    decoded = decoder(raw)
+    memo[column] = (raw, decoded)
+    return decoded
+
+
+if __name__ == "__main__":
+    # Micro-benchmark against the eval() path the columns used to be read with
+    import timeit
+
+    dates = [f"2025-{month:02d}-01" for month in range(1, 13)]
+    legacy_list = str(dates)
+    legacy_dict = str({date: 150.0 for date in dates[:4]})
+    json_list = encode_list(dates)
+    row = CachedRow({"Paid_Installments": json_list})
+    runs = 20000
+
+    cases = [
+        ("eval(str(list))", lambda: eval(legacy_list)),
+        ("decode_list(legacy)", lambda: decode_list(legacy_list)),
+        ("decode_list(json)", lambda: decode_list(json_list)),
+        ("decode_column(memoized)", lambda: decode_column(row, "Paid_Installments")),
+        ("eval(str(dict))", lambda: eval(legacy_dict)),
+        ("decode_dict(legacy)", lambda: decode_dict(legacy_dict)),
+    ]
+    for label, case in cases:
+        seconds = timeit.timeit(case, number=runs)
+        print(f"{label:<26} {seconds / runs * 1e6:8.2f} us/call")
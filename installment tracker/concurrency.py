@@ -0,0 +1,149 @@
+"""
+Locking shared by the Tk thread and the notifier thread.
+
+Both threads use the same CSVManager. Reads of the cached data take the
+shared side of an RWLock and run concurrently; anything that replaces cached
+rows or writes to storage takes the exclusive side. Mutations are optimistic:
+CSVManager builds the new row without holding the lock and only swaps it in
+if the row is still the version it was built from (see CSVManager._commit_cas).
+
+Other app instances (desks sharing the data folder) are kept out by a
+FileLock held around every commit.
+"""
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class CommitConflict(Exception):
+    """The row a change was built from was changed by another thread or desk"""
+
+
+class RWLock:
+    """Writer-preferring reader/writer lock.
+
+    A thread holding the write lock may take it again or take the read lock.
+    A thread holding the read lock may take it again, but cannot upgrade to the
+    write lock (that would deadlock against another upgrading reader).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        """Hold the lock shared"""
+        me = threading.get_ident()
+        depth = getattr(self._local, "read_depth", 0)
+        with self._cond:
+            if self._writer != me and depth == 0:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        self._local.read_depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = depth
+            if self._writer != me and depth == 0:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock exclusively"""
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                if getattr(self._local, "read_depth", 0):
+                    raise RuntimeError("Cannot take the write lock while holding the read lock")
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+
+class FileLock:
+    """Advisory lock on a lock file, for several app instances sharing the data folder.
+
+    Uses fcntl.flock on POSIX and msvcrt.locking on Windows. Re-entrant within
+    a process, so nested commits on the same thread do not deadlock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mutex = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._mutex.acquire()
+        try:
+            if not self._depth:
+                self._file = open(self.path, mode='a+')
+                self._lock_file()
+        except Exception:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._mutex.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        try:
+            if not self._depth:
+                self._unlock_file()
+                self._file.close()
+                self._file = None
+        finally:
+            self._mutex.release()
+
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        # LK_LOCK gives up after ten one-second attempts; keep waiting
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,101 @@
+"""
+Due-date index over the installment ledger.
+
+The notifier and the notification and manage pages used to walk every
+customer and parse every installment date to find the few installments due
+soon or overdue. DueIndex keeps the installments sorted by due date (their
+day ordinal, Installment.due_day), once for all installments and once for
+the unpaid ones, so those questions are answered with a bisect and a slice.
+
+Each entry is (ordinal, customer_id, position, installment); position (the
+installment's place in its customer's schedule) keeps entries unique, so an
+entry is found again by bisect when its customer changes.
+"""
+import logging
+from bisect import bisect_left, insort
+from datetime import date
+from typing import Dict, List, Sequence, Set, Tuple
+from ledger import Installment
+
+Entry = Tuple[int, str, int, Installment]
+
+
+class DueIndex:
+    """Installments sorted by due date"""
+
+    def __init__(self):
+        self.built = False
+        self._all: List[Entry] = []
+        self._unpaid: List[Entry] = []
+        self._entries: Dict[str, List[Entry]] = {}
+
+    def build(self, ledger: Dict[str, Sequence[Installment]]):
+        """Index every customer's installments from scratch"""
+        self.clear()
+        for customer_id, installments in ledger.items():
+            self._entries[customer_id] = self._make_entries(customer_id, installments)
+        self._all = sorted(entry for entries in self._entries.values() for entry in entries)
+        self._unpaid = [entry for entry in self._all if not entry[3].paid]
+        self.built = True
+
+    def clear(self):
+        """Drop the index; it is built again on the next query"""
+        self.built = False
+        self._all = []
+        self._unpaid = []
+        self._entries = {}
+
+    def ids(self) -> Set[str]:
+        """Ids of the indexed customers"""
+        return set(self._entries)
+
+    def set(self, customer_id: str, installments: Sequence[Installment]):
+        """Index a new or changed customer (no-op until the index is built)"""
+        if not self.built:
+            return
+        self.remove(customer_id)
+        entries = self._entries[customer_id] = self._make_entries(customer_id, installments)
+        for entry in entries:
+            insort(self._all, entry)
+            if not entry[3].paid:
+                insort(self._unpaid, entry)
+
+    def remove(self, customer_id: str):
+        """Remove a customer's installments from the index"""
+        for entry in self._entries.pop(customer_id, ()):
+            self._discard(self._all, entry)
+            if not entry[3].paid:
+                self._discard(self._unpaid, entry)
+
+    def between(self, start: date, end: date, unpaid_only: bool = False) -> List[Installment]:
+        """Installments due from start to end (both included), by due date"""
+        entries = self._unpaid if unpaid_only else self._all
+        low = bisect_left(entries, (start.toordinal(),))
+        high = bisect_left(entries, (end.toordinal() + 1,))
+        return [entry[3] for entry in entries[low:high]]
+
+    def overdue(self, today: date) -> List[Installment]:
+        """Unpaid installments due before today, oldest first"""
+        high = bisect_left(self._unpaid, (today.toordinal(),))
+        return [entry[3] for entry in self._unpaid[:high]]
+
+    def next_due(self, today: date, count: int) -> List[Installment]:
+        """The next count unpaid installments due from today on"""
+        low = bisect_left(self._unpaid, (today.toordinal(),))
+        return [entry[3] for entry in self._unpaid[low:low + count]]
+
+    @staticmethod
+    def _make_entries(customer_id: str, installments: Sequence[Installment]) -> List[Entry]:
+        entries = []
+        for position, installment in enumerate(installments):
+            if installment.due_day:
+                entries.append((installment.due_day, customer_id, position, installment))
+            else:
+                logging.warning(f"Invalid installment date {installment.due_date} for customer {customer_id}")
+        return entries
+
+    @staticmethod
+    def _discard(entries: List[Entry], entry: Entry):
+        index = bisect_left(entries, entry)
+        if index < len(entries) and entries[index] is entry:
+            del entries[index]
@@ -10,6 +10,7 @@ import re
 import os
 import pandas as pd
 from utils import StyleManager, CSVManager, DatePicker
+from ledger import date_string
 
 
 def refresh_treeview(tree, csv_manager: CSVManager, data=None):
@@ -23,30 +24,97 @@ def refresh_treeview(tree, csv_manager: CSVManager, data=None):
     columns = tree["columns"]
     
     for customer in data:
-        values = []
-        for col in columns:
-            if col == "Paid":
-                installment_dates = customer.get("Installment Dates", "").split(";")
-                first_date = installment_dates[0] if installment_dates else ""
-                paid_installments = eval(customer.get("Paid_Installments", "[]"))
-                is_paid = first_date in paid_installments
-                values.append("نعم" if is_paid else "لا")
-            else:
-                values.append(customer.get(col, ""))
-        
-        item = tree.insert("", "end", values=values)
+        values, tags = treeview_row(columns, csv_manager, customer)
         
-        if "Paid" in columns:
-            if values[columns.index("Paid")] == "نعم":
-                tree.item(item, tags=("paid",))
-            else:
-                tree.item(item, tags=("unpaid",))
+        # The Customer_ID is the row iid, so selections map straight to a customer
+        tree.insert("", "end", iid=customer["Customer_ID"], values=values, tags=tags)
+    
+    # Remembered for patch_treeview
+    tree.shown_rows = {customer["Customer_ID"]: customer for customer in data}
     
     if "Paid" in columns:
         tree.tag_configure("paid", foreground=StyleManager.COLORS["success"])
         tree.tag_configure("unpaid", foreground=StyleManager.COLORS["danger"])
 
 
+# Treeview columns filled from the customer's summary (CSVManager.cached_summary) rather than the row
+SUMMARY_COLUMNS = ("Collected", "Outstanding", "Next Due", "Days Overdue")
+
+
+def summary_value(col, summary, today: int):
+    """Display value of a summary column for a customer summary."""
+    if summary is None:
+        return ""
+    if col == "Collected":
+        return f"{summary.collected:.2f}"
+    if col == "Outstanding":
+        return f"{summary.outstanding:.2f}"
+    if col == "Next Due":
+        next_day = summary.next_due_day(today)
+        return date_string(next_day) if next_day else "-"
+    if col == "Days Overdue":
+        return summary.days_overdue(today)
+    return ""
+
+
+def treeview_row(columns, csv_manager: CSVManager, customer) -> tuple:
+    """Values and tags of a customer's treeview row.
+
+    customer comes from read_data() or search_customers(), which checked the
+    cache once; its installments and summary are read without checking again.
+    """
+    values = []
+    summary = None
+    today = datetime.now().date().toordinal()
+    for col in columns:
+        if col == "Paid":
+            installments = csv_manager.cached_installments(customer["Customer_ID"])
+            is_paid = bool(installments) and installments[0].paid
+            values.append("نعم" if is_paid else "لا")
+        elif col in SUMMARY_COLUMNS:
+            if summary is None:
+                summary = csv_manager.cached_summary(customer["Customer_ID"])
+            values.append(summary_value(col, summary, today))
+        else:
+            values.append(customer.get(col, ""))
+    
+    tags = ()
+    if "Paid" in columns:
+        tags = ("paid",) if values[columns.index("Paid")] == "نعم" else ("unpaid",)
+    return values, tags
+
+
+def patch_treeview(tree, csv_manager: CSVManager, data):
+    """Show data in the treeview, touching only the rows that differ.
+
+    data must keep the order of the rows already shown (e.g. file order).
+    Rows not in data are deleted, missing rows are inserted in place and
+    rows whose customer changed since they were shown are updated; the
+    rest are left alone, so narrowing a search costs only the rows that
+    disappear.
+    """
+    columns = tree["columns"]
+    shown = getattr(tree, "shown_rows", {})
+    wanted = {customer["Customer_ID"] for customer in data}
+    current = tree.get_children()
+    removed = [item for item in current if item not in wanted]
+    if removed:
+        tree.delete(*removed)
+    present = set(current).difference(removed)
+    
+    for index, customer in enumerate(data):
+        customer_id = customer["Customer_ID"]
+        if customer_id not in present:
+            values, tags = treeview_row(columns, csv_manager, customer)
+            tree.insert("", index, iid=customer_id, values=values, tags=tags)
+        elif shown.get(customer_id) is not customer:
+            # Rows are replaced, never modified, on change (see CSVManager.snapshot)
+            values, tags = treeview_row(columns, csv_manager, customer)
+            tree.item(customer_id, values=values, tags=tags)
+    
+    tree.shown_rows = {customer["Customer_ID"]: customer for customer in data}
+
+
 def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_history_views):
     """Show payment history for selected customer."""
     current_frame = None
@@ -71,18 +139,18 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
         
     try:
         item = selected_items[0]
-        customer_name = tree.item(item)["values"][0]
+        # On the manage page an installment row belongs to its customer header
+        if tree.parent(item):
+            item = tree.parent(item)
+        customer_name = str(tree.item(item)["values"][0]).replace("▼ ", "").replace("▶ ", "")
         
-        data = csv_manager.read_data()
-        customer_data = None
-        for customer in data:
-            if customer["Name"] == customer_name:
-                customer_data = customer
-                break
+        # Row iids are Customer_IDs; fall back to the name for other trees
+        customer_data = csv_manager.get_customer(item) or csv_manager.get_customer(customer_name)
                 
         if not customer_data:
             messagebox.showerror("خطأ", "لم يتم العثور على بيانات العميل.")
             return
+        customer_id = customer_data["Customer_ID"]
             
         history_window = CTkToplevel(app)
         history_window.geometry("800x760")
@@ -130,26 +198,21 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
             tree.heading(col, text=column_headers[col])
             
         if customer_data:
-            installment_dates = customer_data["Installment Dates"].split(";")
-            default_value = float(customer_data["Installment Value"])
-            paid_installments = eval(customer_data.get("Paid_Installments", "[]"))
-            
-            try:
-                installment_values = eval(customer_data.get("Installment_Values", "{}"))
-            except:
-                installment_values = {}
+            installments = csv_manager.get_installments(customer_id)
             
             date_to_row_map = {}
-            today = datetime.now().strftime("%Y-%m-%d")
+            # Compared as day ordinals (Installment.due_day), not as strings
+            today = datetime.now().date().toordinal()
             
-            for date in installment_dates:
-                is_paid = date in paid_installments
+            for installment in installments:
+                date = installment.due_date
+                is_paid = installment.paid
                 status = "مدفوع" if is_paid else "غير مدفوع"
                 status_tags = ("paid",) if is_paid else ("unpaid",)
                 
-                value = installment_values.get(date, default_value)
+                value = installment.amount
                 
-                is_future = date > today
+                is_future = installment.due_day > today
                 
                 action = "" if is_paid else "تسجيل كمدفوع" if not is_future else "موعد مستقبلي"
                 
@@ -175,7 +238,7 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
                 date = values[0]
                 
                 if values[3] == "تسجيل كمدفوع":
-                    if csv_manager.mark_installment_as_paid(customer_name, date):
+                    if csv_manager.mark_installment_as_paid(customer_id, date):
                         tree.item(item, values=(date, values[1], "مدفوع", ""), tags=("paid",))
                         messagebox.showinfo("نجاح", "تم تسجيل القسط كمدفوع بنجاح.")
                     else:
@@ -305,13 +368,16 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
                             
                         new_value = float(new_value_str)
                         
-                        if csv_manager.update_installment(customer_name, date, new_date, new_value):
-                            if is_paid != new_paid_status:
+                        # Date, value and paid status are written in one commit
+                        with csv_manager.transaction():
+                            updated = csv_manager.update_installment(customer_id, date, new_date, new_value)
+                            if updated and is_paid != new_paid_status:
                                 if new_paid_status:
-                                    csv_manager.mark_installment_as_paid(customer_name, new_date)
+                                    csv_manager.mark_installment_as_paid(customer_id, new_date)
                                 else:
-                                    csv_manager.unmark_installment_as_paid(customer_name, new_date)
-                                
+                                    csv_manager.unmark_installment_as_paid(customer_id, new_date)
+                        
+                        if updated:
                             messagebox.showinfo("نجاح", "تم تحديث بيانات القسط بنجاح.")
                             edit_window.destroy()
                             history_window.destroy()
@@ -346,12 +412,12 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
         tree.bind("<Button-3>", edit_installment)
         
         if customer_data:
-            total_installments = len(installment_dates)
-            paid_count = len(paid_installments)
+            total_installments = len(installments)
+            paid_count = sum(1 for installment in installments if installment.paid)
             remaining_count = total_installments - paid_count
             
-            total_amount = sum(float(installment_values.get(date, default_value)) for date in installment_dates)
-            paid_amount = sum(float(installment_values.get(date, default_value)) for date in paid_installments)
+            total_amount = sum(installment.amount for installment in installments)
+            paid_amount = sum(installment.amount for installment in installments if installment.paid)
             remaining_amount = total_amount - paid_amount
             
             summary_frame = StyleManager.create_frame(main_frame)
@@ -388,6 +454,74 @@ def show_payment_history(app, frames, csv_manager: CSVManager, refresh_payment_h
         messagebox.showerror("خطأ", f"حدث خطأ أثناء عرض سجل المدفوعات: {str(e)}")
 
 
+def write_excel_sheet(df, excel_filename: str, sheet_name: str, column_widths: dict):
+    """Write a DataFrame to a formatted, right-to-left Excel sheet (xlsxwriter)."""
+    with pd.ExcelWriter(excel_filename, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name=sheet_name, index=False)
+        
+        workbook = writer.book
+        worksheet = writer.sheets[sheet_name]
+        
+        header_format = workbook.add_format({
+            'bold': True,
+            'font_size': 16,
+            'font_name': 'Arial',
+            'align': 'center',
+            'valign': 'vcenter',
+            'bg_color': '#2B7DE9',
+            'font_color': 'white',
+            'border': 2,
+            'text_wrap': True,
+            'border_color': '#1a5fb4'
+        })
+        
+        cell_format = workbook.add_format({
+            'font_size': 14,
+            'font_name': 'Arial',
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1,
+            'text_wrap': True,
+            'border_color': '#666666'
+        })
+        
+        for idx, col in enumerate(df.columns):
+            if col in column_widths:
+                col_width = column_widths[col]
+            else:
+                max_length = max(
+                    df[col].astype(str).apply(len).max(),
+                    len(str(col))
+                )
+                col_width = min(max(max_length + 4, 15), 50)
+            
+            worksheet.set_column(idx, idx, col_width)
+            worksheet.write(0, idx, col, header_format)
+            
+            for row in range(1, len(df) + 1):
+                worksheet.write(row, idx, df.iloc[row-1][col], cell_format)
+        
+        for row_num in range(1, len(df) + 1):
+            row_format = workbook.add_format({
+                'font_size': 14,
+                'font_name': 'Arial',
+                'align': 'center',
+                'valign': 'vcenter',
+                'border': 1,
+                'border_color': '#666666',
+                'text_wrap': True,
+                'bg_color': '#F5F5F5' if row_num % 2 == 0 else 'white'
+            })
+            
+            for col_num in range(len(df.columns)):
+                worksheet.write(row_num, col_num, df.iloc[row_num-1][df.columns[col_num]], row_format)
+        
+        worksheet.set_default_row(45)
+        worksheet.set_row(0, 60)
+        worksheet.freeze_panes(1, 0)
+        worksheet.right_to_left()
+
+
 def export_to_excel(csv_manager: CSVManager):
     """Export customer data to Excel file with enhanced formatting."""
     try:
@@ -423,83 +557,22 @@ def export_to_excel(csv_manager: CSVManager):
             cleaned_data.append(cleaned_row)
         
         df = pd.DataFrame(cleaned_data)
+        # The id and row version are internal bookkeeping, not customer data
+        df = df.drop(columns=[csv_manager.id_column, csv_manager.version_column], errors="ignore")
         df = df.rename(columns=arabic_columns)
         
-        with pd.ExcelWriter(excel_filename, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='بيانات العملاء', index=False)
-            
-            workbook = writer.book
-            worksheet = writer.sheets['بيانات العملاء']
-            
-            header_format = workbook.add_format({
-                'bold': True,
-                'font_size': 16,
-                'font_name': 'Arial',
-                'align': 'center',
-                'valign': 'vcenter',
-                'bg_color': '#2B7DE9',
-                'font_color': 'white',
-                'border': 2,
-                'text_wrap': True,
-                'border_color': '#1a5fb4'
-            })
-            
-            cell_format = workbook.add_format({
-                'font_size': 14,
-                'font_name': 'Arial',
-                'align': 'center',
-                'valign': 'vcenter',
-                'border': 1,
-                'text_wrap': True,
-                'border_color': '#666666'
-            })
-            
-            column_widths = {
-                "اسم العميل": 25,
-                "رقم الهاتف": 20,
-                "المبلغ الإجمالي": 20,
-                "عدد الأقساط": 15,
-                "قيمة القسط": 20,
-                "تاريخ البدء": 20,
-                "تواريخ الأقساط": 40,
-                "تم الإرسال": 15
-            }
-            
-            for idx, col in enumerate(df.columns):
-                if col in column_widths:
-                    col_width = column_widths[col]
-                else:
-                    max_length = max(
-                        df[col].astype(str).apply(len).max(),
-                        len(str(col))
-                    )
-                    col_width = min(max(max_length + 4, 15), 50)
-                
-                worksheet.set_column(idx, idx, col_width)
-                worksheet.write(0, idx, col, header_format)
-                
-                for row in range(1, len(df) + 1):
-                    worksheet.write(row, idx, df.iloc[row-1][col], cell_format)
-            
-            for row_num in range(1, len(df) + 1):
-                row_format = workbook.add_format({
-                    'font_size': 14,
-                    'font_name': 'Arial',
-                    'align': 'center',
-                    'valign': 'vcenter',
-                    'border': 1,
-                    'border_color': '#666666',
-                    'text_wrap': True,
-                    'bg_color': '#F5F5F5' if row_num % 2 == 0 else 'white'
-                })
-                
-                for col_num in range(len(df.columns)):
-                    worksheet.write(row_num, col_num, df.iloc[row_num-1][df.columns[col_num]], row_format)
-            
-            worksheet.set_default_row(45)
-            worksheet.set_row(0, 60)
-            worksheet.freeze_panes(1, 0)
-            worksheet.right_to_left()
+        column_widths = {
+            "اسم العميل": 25,
+            "رقم الهاتف": 20,
+            "المبلغ الإجمالي": 20,
+            "عدد الأقساط": 15,
+            "قيمة القسط": 20,
+            "تاريخ البدء": 20,
+            "تواريخ الأقساط": 40,
+            "تم الإرسال": 15
+        }
+        
+        write_excel_sheet(df, excel_filename, 'بيانات العملاء', column_widths)
         
         messagebox.showinfo("نجاح", f"تم تصدير البيانات إلى ملف Excel: {excel_filename}")
         os.startfile(os.path.abspath(excel_filename))
@@ -0,0 +1,132 @@
+"""
+Append-only journal for the CSV backend.
+
+Rewriting customers.csv for every click costs time proportional to the whole
+dataset. With a journal, each commit appends one JSON line holding its changes
+and fsyncs it; the CSV file is only rewritten at a checkpoint, which folds the
+journal into the file and empties it. Loading the CSV replays any journal left
+behind, so a crash between checkpoints loses nothing that was committed.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import List, Dict, Iterable
+
+
+class Journal:
+    """Durable log of committed changes, one JSON line per commit"""
+
+    def __init__(self, path: str, checkpoint_records: int = 500,
+                 checkpoint_bytes: int = 1024 * 1024, checkpoint_interval: int = 300):
+        self.path = path
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_bytes = checkpoint_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._records = len(self.read())
+        self._last_checkpoint = time.time()
+
+    def append(self, changes: List):
+        """Append one commit (a list of storage.Change) and force it to disk"""
+        line = json.dumps(
+            {"changes": [self._encode(change) for change in changes]},
+            ensure_ascii=False, default=str
+        )
+        with self._lock:
+            # After a torn last line (a process died while appending it), start
+            # on a new line so this record is not glued onto the partial one
+            prefix = "" if self._ends_with_newline() else "\n"
+            with open(self.path, mode='a', encoding='utf-8') as file:
+                file.write(prefix + line + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self._records += 1
+
+    def _ends_with_newline(self) -> bool:
+        """Check whether the journal is empty or its last line is complete"""
+        if not self.size():
+            return True
+        with open(self.path, mode='rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    @staticmethod
+    def _encode(change) -> Dict:
+        """Journal record of a change; installment changes carry the updated row"""
+        return {"op": change.op, "key": change.key, "row": dict(change.row) if change.row is not None else None}
+
+    def read(self) -> List[List[Dict]]:
+        """Read the committed changes as {"op", "key", "row"} records, oldest first.
+
+        A torn line (the process died while appending it) was never
+        acknowledged, so it is skipped; the commits appended after it by
+        other desks are kept.
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        commits = []
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                try:
+                    record = json.loads(line)
+                    commits.append([
+                        {"op": item["op"], "key": item["key"], "row": item["row"]} for item in record["changes"]
+                    ])
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f"Ignoring incomplete journal record at {self.path}:{line_number}")
+                    continue
+        return commits
+
+    def should_checkpoint(self) -> bool:
+        """Check whether the journal is long or old enough to be folded into the file"""
+        if not self._records:
+            return False
+        return (
+            self._records >= self.checkpoint_records
+            or self.size() >= self.checkpoint_bytes
+            or time.time() - self._last_checkpoint >= self.checkpoint_interval
+        )
+
+    def size(self) -> int:
+        """Journal size in bytes"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def truncate(self):
+        """Empty the journal after its changes reached the main file"""
+        with self._lock:
+            with open(self.path, mode='w', encoding='utf-8') as file:
+                file.flush()
+                os.fsync(file.fileno())
+            self._records = 0
+            self._last_checkpoint = time.time()
+
+    def __len__(self) -> int:
+        return self._records
+
+
+def replay(rows: Iterable[Dict], commits: List[List[Dict]], id_column: str) -> List[Dict]:
+    """Apply journaled commits to rows loaded from the main file"""
+    rows = list(rows)
+    positions = {row.get(id_column): index for index, row in enumerate(rows)}
+    deleted = set()
+
+    for changes in commits:
+        for change in changes:
+            key = change["key"]
+            index = positions.get(key)
+            if change["op"] == "delete":
+                if index is not None:
+                    deleted.add(index)
+                    del positions[key]
+            elif index is None:
+                # Inserts, and updates of rows the file does not have yet
+                positions[key] = len(rows)
+                rows.append(change["row"])
+            else:
+                # Updates and installment changes carry the whole updated row
+                rows[index] = change["row"]
+
+    return [row for index, row in enumerate(rows) if index not in deleted]
@@ -0,0 +1,161 @@
+"""
+Installment ledger: typed installment records parsed once from customer rows.
+
+A customer row stores its schedule in string columns ("Installment Dates"
+joined with ";", and the Paid_Installments, Notified_Installments and
+Installment_Values columns handled by codec.py). CSVManager parses those
+columns once when the data is loaded and keeps the resulting records, so the
+pages and the notifier never split or decode the strings themselves.
+
+Each due date is parsed once into a day ordinal (date.toordinal()), so
+sorting, filtering and day arithmetic work on integers. Parsed dates are
+cached by string, and every installment due on the same day shares one
+string object.
+"""
+from bisect import bisect_left
+from datetime import date, datetime
+from typing import List, Dict, NamedTuple, Sequence, Tuple
+from codec import decode_column, encode_list, encode_dict
+
+# Date string -> (day ordinal, shared copy of the string); 0 marks an invalid date
+_PARSED_DATES: Dict[str, Tuple[int, str]] = {}
+# Day ordinal -> "%Y-%m-%d" string
+_DATE_STRINGS: Dict[int, str] = {}
+# Bounds the cache if a file holds many distinct invalid dates
+_MAX_CACHED_DATES = 100000
+
+
+class Installment(NamedTuple):
+    """One scheduled installment of a customer"""
+    customer_id: str  # Customer_ID of the owning customer row
+    due_date: str     # "%Y-%m-%d"
+    amount: float
+    paid: bool
+    notified: bool
+    due_day: int = 0  # date.toordinal() of due_date, 0 if due_date is not a valid date
+
+
+def parse_date(text: str) -> Tuple[int, str]:
+    """Day ordinal of a "%Y-%m-%d" date (0 if invalid) and the shared copy of text"""
+    parsed = _PARSED_DATES.get(text)
+    if parsed is None:
+        try:
+            day = date.fromisoformat(text).toordinal()
+        except ValueError:
+            try:
+                # Dates typed without leading zeros ("2025-1-5") are valid too
+                day = datetime.strptime(text, "%Y-%m-%d").toordinal()
+            except ValueError:
+                day = 0
+        parsed = (day, text)
+        if len(_PARSED_DATES) < _MAX_CACHED_DATES:
+            _PARSED_DATES[text] = parsed
+    return parsed
+
+
+def date_ordinal(text: str) -> int:
+    """Day ordinal of a "%Y-%m-%d" date, 0 if it is not a valid date"""
+    return parse_date(text)[0]
+
+
+def date_string(day: int) -> str:
+    """The "%Y-%m-%d" string of a day ordinal"""
+    text = _DATE_STRINGS.get(day)
+    if text is None:
+        text = _DATE_STRINGS[day] = date.fromordinal(day).isoformat()
+    return text
+
+
+class CustomerSummary(NamedTuple):
+    """Payment totals of one customer, derived from its installment records"""
+    paid_count: int
+    unpaid_count: int
+    collected: float    # Sum of the paid installments
+    outstanding: float  # Sum of the unpaid installments
+    unpaid_days: Tuple[int, ...]  # Sorted due_day of the unpaid installments with a valid date
+
+    def next_due_day(self, today: int) -> int:
+        """Day ordinal of the first unpaid installment due from today on, 0 if none"""
+        index = bisect_left(self.unpaid_days, today)
+        return self.unpaid_days[index] if index < len(self.unpaid_days) else 0
+
+    def overdue_count(self, today: int) -> int:
+        """Number of unpaid installments due before today"""
+        return bisect_left(self.unpaid_days, today)
+
+    def days_overdue(self, today: int) -> int:
+        """Days since the oldest unpaid installment was due, 0 if none is overdue"""
+        if self.unpaid_days and self.unpaid_days[0] < today:
+            return today - self.unpaid_days[0]
+        return 0
+
+
+def summarize_installments(installments: Sequence["Installment"]) -> CustomerSummary:
+    """Payment totals of a customer's installment records"""
+    paid_count = 0
+    collected = 0.0
+    outstanding = 0.0
+    unpaid_days = []
+    for installment in installments:
+        if installment.paid:
+            paid_count += 1
+            collected += installment.amount
+        else:
+            outstanding += installment.amount
+            if installment.due_day:
+                unpaid_days.append(installment.due_day)
+    unpaid_days.sort()
+    return CustomerSummary(paid_count, len(installments) - paid_count, collected, outstanding, tuple(unpaid_days))
+
+
+def _default_amount(row: Dict) -> float:
+    """The customer's regular installment value"""
+    try:
+        return float(row.get("Installment Value", 0))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def parse_installments(customer_id: str, row: Dict) -> List[Installment]:
+    """Build the installment records of a customer row, in schedule order"""
+    dates_str = row.get("Installment Dates", "") or ""
+    dates = [date.strip() for date in dates_str.split(";") if date.strip()]
+    paid = set(decode_column(row, "Paid_Installments"))
+    notified = set(decode_column(row, "Notified_Installments"))
+    values = decode_column(row, "Installment_Values")
+    default = _default_amount(row)
+
+    installments = []
+    for due_date in dates:
+        try:
+            amount = float(values.get(due_date, default))
+        except (ValueError, TypeError):
+            amount = default
+        due_day, due_date = parse_date(due_date)
+        installments.append(Installment(customer_id, due_date, amount, due_date in paid, due_date in notified, due_day))
+    return installments
+
+
+def encode_installments(row: Dict, installments: List[Installment]):
+    """Write installment records back into the string columns of a row.
+
+    Amounts equal to the customer's Installment Value are left implicit, the
+    same way rows created by the add page carry an empty Installment_Values.
+    """
+    default = _default_amount(row)
+    row["Installment Dates"] = ";".join(installment.due_date for installment in installments)
+    row["Paid_Installments"] = encode_list([installment.due_date for installment in installments if installment.paid])
+    row["Notified_Installments"] = encode_list([installment.due_date for installment in installments if installment.notified])
+    row["Installment_Values"] = encode_dict({
+        installment.due_date: installment.amount
+        for installment in installments
+        if installment.amount != default
+    })
+
+
+def find_installment(installments: Sequence[Installment], due_date: str) -> int:
+    """Index of the installment due on due_date, or -1"""
+    for index, installment in enumerate(installments):
+        if installment.due_date == due_date:
+            return index
+    return -1
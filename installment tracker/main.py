@@ -35,6 +35,8 @@ from pages.home_page import setup_home_page
 
 # Import notification module
 from notifications import start_notification_thread
+from backups import start_compaction_thread
+from backup_verifier import start_verification_thread
 
 # Global variables
 app = None
@@ -43,7 +45,22 @@ frames = {}
 # Initialize managers
 csv_filename = "data/customers.csv"
 backup_folder = "data/backups"
-csv_manager = CSVManager(csv_filename, backup_folder)
+
+# Storage backend: "csv" keeps data in customers.csv, "sqlite" uses data/customers.db
+# (created from customers.csv the first time it is selected)
+storage_backend = "csv"
+sqlite_filename = "data/customers.db"
+
+# CSV backend only: append each change to data/customers.journal and rewrite
+# customers.csv at checkpoints instead of on every save
+use_journal = True
+
+# Saves are atomic (temp file + rename); set to True to also copy the data to
+# data/backups before every save
+backup_on_save = False
+
+csv_manager = CSVManager(csv_filename, backup_folder, backend=storage_backend, db_file=sqlite_filename,
+                         journal=use_journal, backup_on_save=backup_on_save)
 file_manager = FileManager("data/customer_files")
 
 
@@ -90,6 +107,12 @@ def show_frame(frame):
     frame.grid()
 
 
+def on_close():
+    """Fold the data journal into the data file before the window closes"""
+    csv_manager.checkpoint()
+    app.destroy()
+
+
 def main():
     """Main application entry point with error handling"""
     global app
@@ -97,6 +120,7 @@ def main():
         logging.info("Application starting...")
         if not app:
             app = initialize_app()
+        app.protocol("WM_DELETE_WINDOW", on_close)
         app.mainloop()
     except Exception as e:
         logging.critical(f"Critical error in main: {str(e)}\n{traceback.format_exc()}")
@@ -112,6 +136,7 @@ if __name__ == "__main__":
         from pages.manage_page import setup_manage_installments_page
         from pages.backup_page import setup_backup_restore_page
         from pages.notifications_page import setup_send_notification_page
+        from pages.aging_page import setup_aging_page
         
         # Initialize the application
         app = initialize_app()
@@ -134,7 +159,7 @@ if __name__ == "__main__":
         container.grid_rowconfigure(0, weight=1)
         
         # Create frames
-        page_names = ["home", "add", "view", "manage", "backup_restore", "send_notification"]
+        page_names = ["home", "add", "view", "manage", "backup_restore", "send_notification", "aging"]
         
         for name in page_names:
             try:
@@ -150,12 +175,13 @@ if __name__ == "__main__":
         
         # Setup all pages with error handling
         setup_functions = [
-            ("setup_home_page", lambda: setup_home_page(frames["home"], frames, show_frame)),
+            ("setup_home_page", lambda: setup_home_page(frames["home"], frames, show_frame, csv_manager)),
             ("setup_add_page", lambda: setup_add_page(frames["add"], frames, show_frame, app, csv_manager, file_manager)),
             ("setup_view_page", lambda: setup_view_page(frames["view"], frames, show_frame, app, csv_manager)),
             ("setup_manage_installments_page", lambda: setup_manage_installments_page(frames["manage"], frames, show_frame, app, csv_manager)),
             ("setup_backup_restore_page", lambda: setup_backup_restore_page(frames["backup_restore"], frames, show_frame, csv_manager)),
-            ("setup_send_notification_page", lambda: setup_send_notification_page(frames["send_notification"], frames, show_frame, app, csv_manager))
+            ("setup_send_notification_page", lambda: setup_send_notification_page(frames["send_notification"], frames, show_frame, app, csv_manager)),
+            ("setup_aging_page", lambda: setup_aging_page(frames["aging"], frames, show_frame, csv_manager))
         ]
         
         for func_name, func in setup_functions:
@@ -171,6 +197,10 @@ if __name__ == "__main__":
         # Show home frame and start notification thread
         show_frame(frames["home"])
         start_notification_thread(csv_manager)
+        # Compress and thin old backups in the background (see backups.RETENTION)
+        start_compaction_thread(csv_manager.backups)
+        # Check that every backup can be read and restored (see backup_verifier.py)
+        start_verification_thread(csv_manager)
         
         # Start the main loop
         main()
@@ -0,0 +1,92 @@
+"""
+Normalization of the text customers are searched and looked up by.
+
+Arabic names are written several ways: with or without hamza on the alef,
+with a final ى or ي, ة or ه, with diacritics or tatweel, and digits may be
+typed as Arabic-Indic (٠١٢) or Western (012). normalize_text folds all of
+these to one form, so a query matches however either side was typed.
+
+Phone numbers are stored in one canonical E.164 form (see normalize_phone),
+so a phone lookup is a plain dictionary lookup; local numbers get the
+configured country code (DEFAULT_COUNTRY_CODE).
+"""
+import re
+from typing import Dict, Optional
+
+# Single characters folded to a common form (None removes the character)
+_FOLDED: Dict[str, Optional[str]] = {
+    # Alef with hamza or madda, and alef wasla -> bare alef
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    # Hamza on waw / yaa -> the bare letter
+    "ؤ": "و", "ئ": "ي",
+    # Alef maksura -> yaa, taa marbuta -> haa
+    "ى": "ي", "ة": "ه",
+    # Tatweel
+    "ـ": None,
+    # Superscript alef
+    "ٰ": None,
+}
+# Quranic annotation signs and harakat (fatha, damma, kasra, shadda, sukun, tanween, ...)
+_FOLDED.update({chr(code): None for code in range(0x0610, 0x061B)})
+_FOLDED.update({chr(code): None for code in range(0x064B, 0x0660)})
+# Arabic-Indic and Extended (Persian) digits -> 0-9
+_FOLDED.update({chr(0x0660 + digit): str(digit) for digit in range(10)})
+_FOLDED.update({chr(0x06F0 + digit): str(digit) for digit in range(10)})
+
+_TRANSLATION = str.maketrans(_FOLDED)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase text and fold Arabic spelling variants, diacritics and digits"""
+    return text.lower().translate(_TRANSLATION)
+
+
+# Separators people type inside phone numbers
+_PHONE_SEPARATORS = re.compile(r"[\s\-().]")
+_PHONE_DIGITS = re.compile(r"[0-9]+")
+
+# Country code given to local numbers (typed without an international prefix)
+DEFAULT_COUNTRY_CODE = "974"
+# Length of a local number without trunk prefix (8 in Qatar); a bare number
+# of at most this many digits is local, a longer one has its country code
+NATIONAL_NUMBER_DIGITS = 8
+
+
+def normalize_phone(phone, country_code: Optional[str] = None) -> str:
+    """Canonical E.164 form of a phone number: "+", the country code and the number.
+
+    Spaces, dashes, dots and brackets are dropped, Arabic-Indic digits are
+    folded and a 00 international prefix becomes "+". Local numbers get
+    country_code (DEFAULT_COUNTRY_CODE by default): those with a trunk "0"
+    (0501234567) lose it, and bare numbers of up to NATIONAL_NUMBER_DIGITS
+    digits get it in front. A "+0" number (stored before local numbers were
+    recognized) is read as a trunk "0". A value that still is not a number is
+    returned stripped, for the phone validation to reject.
+    """
+    country_code = DEFAULT_COUNTRY_CODE if country_code is None else country_code
+    text = _PHONE_SEPARATORS.sub("", str(phone).translate(_TRANSLATION))
+    if text.startswith("00"):
+        digits = text[2:]
+    elif text.startswith("+") and not text.startswith("+0"):
+        digits = text[1:]
+    else:
+        local = text.lstrip("+")
+        if not _PHONE_DIGITS.fullmatch(local):
+            return str(phone).strip()
+        if local.startswith("0"):
+            digits = country_code + local[1:]
+        elif len(local) <= NATIONAL_NUMBER_DIGITS:
+            digits = country_code + local
+        else:
+            # Already has its country code, just not the "+"
+            digits = local
+    if not _PHONE_DIGITS.fullmatch(digits):
+        return str(phone).strip()
+    return f"+{digits}"
+
+
+def local_phone(phone: str, country_code: Optional[str] = None) -> str:
+    """National form ("0" and the number) of a normalized phone in the default
+    country, the way it is usually typed; "" for phones of other countries"""
+    prefix = "+" + (DEFAULT_COUNTRY_CODE if country_code is None else country_code)
+    return "0" + phone[len(prefix):] if phone.startswith(prefix) else ""
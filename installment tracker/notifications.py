@@ -5,7 +5,7 @@ import threading
 import time
 import logging
 import pywhatkit as kit
-from datetime import datetime
+from datetime import datetime, timedelta
 from utils import CSVManager
 
 notification_enabled = True  # Enable notifications by default
@@ -20,106 +20,96 @@ def check_due_installments(csv_manager: CSVManager):
         try:
             logging.info("Starting automatic installment check")
             
-            data = csv_manager.read_data()
-            if not data:
-                logging.info("No customer data found for notifications")
-                time.sleep(60 * 60)
-                continue
-                
             today = datetime.now()
             notification_window = 3
             
+            # Only the installments in the window are read, from the due-date index.
+            # (date - now).days counted whole days from now, so installments due
+            # today were already past and the window ends notification_window + 1
+            # days ahead; the range below keeps that.
+            start = today.date() + timedelta(days=1)
+            end = start + timedelta(days=notification_window)
+            due = csv_manager.installments_due_between(start, end, unpaid_only=True)
+            due_by_customer = {}
+            for installment in due:
+                if not installment.notified:
+                    due_by_customer.setdefault(installment.customer_id, []).append(installment)
+            
             success_count = 0
             fail_count = 0
             skip_count = 0
             
-            logging.info(f"Checking notifications for {len(data)} customers")
+            logging.info(f"Checking notifications for {len(due_by_customer)} customers with installments due")
             
-            for customer in data:
+            for customer_id, installments in due_by_customer.items():
+                customer = csv_manager.get_customer(customer_id)
+                if customer is None:
+                    continue  # Deleted meanwhile
                 try:
-                    dates_str = customer.get("Installment Dates", "")
-                    if not dates_str:
-                        logging.warning(f"Customer {customer['Name']} has no installment dates")
-                        continue
-                        
-                    try:
-                        paid_installments = eval(customer.get("Paid_Installments", "[]"))
-                    except:
-                        paid_installments = []
+                    # Each reminder is recorded right after it is sent (mark_installment_as_notified
+                    # below), never held in a transaction across the WhatsApp I/O: a crash or exit
+                    # mid-run cannot lose the record of a message already sent
+                    for installment in installments:
+                        date_str = installment.due_date
+                        if installment.paid or installment.notified:
+                            continue
                         
-                    try:
-                        notified_installments = eval(customer.get("Notified_Installments", "[]"))
-                    except:
-                        notified_installments = []
+                        # Day ordinals parsed at load (Installment.due_day)
+                        days_until_due = installment.due_day - today.toordinal()
                         
-                    installment_dates = dates_str.split(";")
-                    
-                    for date_str in installment_dates:
-                        try:
-                            if date_str in paid_installments or date_str in notified_installments:
-                                continue
+                        logging.info(f"Found upcoming payment for {customer['Name']} due in {days_until_due} days")
                                 
-                            date = datetime.strptime(date_str.strip(), "%Y-%m-%d")
-                            days_until_due = (date - today).days
-                            
-                            if 0 <= days_until_due <= notification_window:
-                                logging.info(f"Found upcoming payment for {customer['Name']} due in {days_until_due} days")
+                        message = (
+                            f"مرحبًا {customer['Name']},\n"
+                            f"تذكير بدفع قسط بقيمة {installment.amount} ريال "
+                            f"في تاريخ {date_str}.\n"
+                            f"شكرًا لتعاملك معنا!"
+                        )
                                 
-                                message = (
-                                    f"مرحبًا {customer['Name']},\n"
-                                    f"تذكير بدفع قسط بقيمة {customer['Installment Value']} ريال "
-                                    f"في تاريخ {date_str}.\n"
-                                    f"شكرًا لتعاملك معنا!"
-                                )
-                                
-                                phone = customer["Phone"]
-                                if not phone.startswith("+"):
-                                    phone = "+" + phone
+                        phone = customer["Phone"]
+                        if not phone.startswith("+"):
+                            phone = "+" + phone
                                 
-                                time.sleep(2)
+                        time.sleep(2)
                                 
-                                max_retries = 2
-                                retry_count = 0
-                                success = False
-                                last_error = None
+                        max_retries = 2
+                        retry_count = 0
+                        success = False
+                        last_error = None
                                 
-                                while retry_count < max_retries and not success:
-                                    retry_count += 1
-                                    try:
-                                        logging.info(f"Attempt {retry_count} to send notification to {customer['Name']} at {phone}")
+                        while retry_count < max_retries and not success:
+                            retry_count += 1
+                            try:
+                                logging.info(f"Attempt {retry_count} to send notification to {customer['Name']} at {phone}")
                                         
-                                        kit.sendwhatmsg_instantly(
-                                            phone_no=phone,
-                                            message=message,
-                                            wait_time=30,
-                                            tab_close=True,
-                                            close_time=20
-                                        )
+                                kit.sendwhatmsg_instantly(
+                                    phone_no=phone,
+                                    message=message,
+                                    wait_time=30,
+                                    tab_close=True,
+                                    close_time=20
+                                )
                                         
-                                        time.sleep(5)
+                                time.sleep(5)
                                         
-                                        notified_installments.append(date_str)
-                                        customer["Notified_Installments"] = str(notified_installments)
-                                        csv_manager.save_data(data)
-                                        logging.info(f"Automatic notification sent to {customer['Name']} at {phone} for installment {date_str}")
-                                        success = True
-                                        success_count += 1
+                                # Persist only this installment instead of saving the stale snapshot
+                                if not csv_manager.mark_installment_as_notified(customer["Customer_ID"], date_str):
+                                    logging.error(f"Notification sent to {customer['Name']} but not recorded for installment {date_str}")
+                                logging.info(f"Automatic notification sent to {customer['Name']} at {phone} for installment {date_str}")
+                                success = True
+                                success_count += 1
                                         
-                                    except Exception as e:
-                                        last_error = str(e)
-                                        logging.error(f"Error sending WhatsApp message to {customer['Name']} at {phone} (Attempt {retry_count}): {last_error}")
+                            except Exception as e:
+                                last_error = str(e)
+                                logging.error(f"Error sending WhatsApp message to {customer['Name']} at {phone} (Attempt {retry_count}): {last_error}")
                                         
-                                        if retry_count < max_retries:
-                                            time.sleep(10)
+                                if retry_count < max_retries:
+                                    time.sleep(10)
                                 
-                                if not success:
-                                    fail_count += 1
-                                    logging.error(f"Failed to send notification to {customer['Name']} after {max_retries} attempts. Last error: {last_error}")
+                        if not success:
+                            fail_count += 1
+                            logging.error(f"Failed to send notification to {customer['Name']} after {max_retries} attempts. Last error: {last_error}")
                                     
-                        except ValueError as e:
-                            logging.error(f"Error parsing date {date_str} for customer {customer['Name']}: {str(e)}")
-                            continue
-                            
                 except Exception as e:
                     logging.error(f"Error processing customer {customer.get('Name', 'unknown')}: {str(e)}")
                     
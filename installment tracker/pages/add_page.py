@@ -7,6 +7,7 @@ import logging
 from datetime import datetime, timedelta
 from utils import StyleManager, CSVManager, FileManager, DatePicker
 from helpers import refresh_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
+from normalize import normalize_phone
 
 def validate_and_save(name_entry, phone_entry, amount_entry, installments_entry, start_date_entry, file_list, csv_manager, file_manager):
     """Validate and save customer data"""
@@ -21,10 +22,20 @@ def validate_and_save(name_entry, phone_entry, amount_entry, installments_entry,
             messagebox.showerror("خطأ", "جميع الحقول مطلوبة.")
             return False
 
+        # Spaces, dashes, a 00 prefix and local numbers are accepted; the phone is stored in E.164 form
+        phone = normalize_phone(phone)
         if not re.match(r"^\+?\d{10,15}$", phone):
             messagebox.showerror("خطأ", "رقم الهاتف غير صالح.")
             return False
 
+        # Warn before adding a second customer with the same phone
+        existing = csv_manager.find_customers(phone=phone)
+        if existing and not messagebox.askyesno(
+            "تنبيه",
+            f"رقم الهاتف مسجل مسبقاً للعميل: {existing[0]['Name']}\nهل تريد المتابعة؟"
+        ):
+            return False
+
         if not re.match(r"^\d+(\.\d{1,2})?$", amount):
             messagebox.showerror("خطأ", "المبلغ يجب أن يكون رقمًا صالحًا.")
             return False
@@ -0,0 +1,174 @@
+"""
+Aging report page: unpaid installments by how many days overdue they are.
+"""
+import os
+import logging
+from datetime import datetime
+from tkinter import ttk, messagebox
+import pandas as pd
+from utils import StyleManager, CSVManager
+from helpers import write_excel_sheet
+from aging import AgingReport, AGING_BUCKETS
+
+# Column headers of the report (Name, Phone, one column per bucket, Total)
+AGING_HEADERS = {
+    "Name": "اسم العميل",
+    "Phone": "رقم الهاتف",
+    "current": "غير متأخر",
+    "1-30": "1-30 يوماً",
+    "31-60": "31-60 يوماً",
+    "61-90": "61-90 يوماً",
+    "90+": "أكثر من 90 يوماً",
+    "Total": "الإجمالي",
+}
+
+
+def aging_rows(csv_manager: CSVManager, rows: dict) -> list:
+    """Report rows as (name, phone, amount per bucket..., total), most overdue first"""
+    # Names and phones from one snapshot rather than one get_customer() per row
+    customers = {customer["Customer_ID"]: customer for customer in csv_manager.read_data()}
+    table = []
+    for customer_id, amounts in rows.items():
+        customer = customers.get(customer_id)
+        if customer is None:
+            continue
+        table.append((customer["Name"], customer["Phone"], *amounts, sum(amounts)))
+    # Largest amounts in the oldest bucket first
+    table.sort(key=lambda row: row[2:-1][::-1], reverse=True)
+    return table
+
+
+def export_aging_to_excel(csv_manager: CSVManager, report: AgingReport):
+    """Export the aging report through the same Excel writer as the customer export"""
+    try:
+        rows, totals = report.report()
+        if not rows:
+            messagebox.showerror("خطأ", "لا توجد أقساط غير مدفوعة للتصدير.")
+            return
+
+        table = aging_rows(csv_manager, rows)
+        table.append(("الإجمالي", "", *totals, sum(totals)))
+        df = pd.DataFrame(table, columns=list(AGING_HEADERS.values()))
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        excel_filename = f"aging_report_{timestamp}.xlsx"
+        write_excel_sheet(df, excel_filename, "أعمار الديون", {"اسم العميل": 25, "رقم الهاتف": 20})
+
+        messagebox.showinfo("نجاح", f"تم تصدير التقرير إلى ملف Excel: {excel_filename}")
+        os.startfile(os.path.abspath(excel_filename))
+
+    except ImportError:
+        messagebox.showerror("خطأ", "الرجاء التأكد من تثبيت حزمة xlsxwriter")
+        logging.error("xlsxwriter package not installed")
+    except Exception as e:
+        logging.error(f"Error exporting aging report: {str(e)}")
+        messagebox.showerror("خطأ", "حدث خطأ أثناء تصدير التقرير.")
+
+
+def setup_aging_page(frame, frames, show_frame, csv_manager):
+    """Setup the aging report page"""
+    report = AgingReport(csv_manager)
+    frame.grid_rowconfigure(0, weight=0)  # Header
+    frame.grid_rowconfigure(1, weight=1)  # Table
+    frame.grid_rowconfigure(2, weight=0)  # Buttons
+
+    header_frame = StyleManager.create_frame(frame)
+    header_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=(20, 20))
+    header_frame.grid_columnconfigure(0, weight=1)
+
+    StyleManager.create_label(
+        header_frame,
+        text="تقرير أعمار الديون",
+        font_style="heading"
+    ).grid(row=0, column=0, pady=(20, 10))
+
+    # Totals per bucket
+    totals_label = StyleManager.create_label(
+        header_frame,
+        text="",
+        font_style="body",
+        text_color=StyleManager.COLORS["text_secondary"]
+    )
+    totals_label.grid(row=1, column=0, pady=(0, 10))
+
+    # Create table container
+    table_frame = StyleManager.create_frame(frame)
+    table_frame.grid(row=1, column=0, sticky="nsew", padx=20, pady=20)
+    table_frame.grid_columnconfigure(0, weight=1)
+    table_frame.grid_rowconfigure(0, weight=1)
+
+    columns = ("Name", "Phone", *AGING_BUCKETS, "Total")
+    tree = ttk.Treeview(
+        table_frame,
+        columns=columns,
+        show="headings",
+        style="Custom.Treeview"
+    )
+    for col in columns:
+        tree.column(col, width=150 if col == "Name" else 110, anchor="center")
+        tree.heading(col, text=AGING_HEADERS[col])
+    tree.grid(row=0, column=0, sticky="nsew")
+
+    scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+    scrollbar.grid(row=0, column=1, sticky="ns")
+    tree.configure(yscrollcommand=scrollbar.set)
+
+    # Store the Treeview widget as an attribute of the frame
+    frame.tree = tree
+
+    def load_data():
+        """Show the report; it is computed once a day and then updated per change"""
+        try:
+            for row in tree.get_children():
+                tree.delete(row)
+
+            rows, totals = report.report()
+            for values in aging_rows(csv_manager, rows):
+                # Any amount past due (the buckets after "current", before the total)
+                tags = ("overdue",) if any(values[3:-1]) else ()
+                tree.insert("", "end", values=[
+                    value if isinstance(value, str) else f"{value:,.2f}" for value in values
+                ], tags=tags)
+            tree.tag_configure("overdue", foreground=StyleManager.COLORS["danger"])
+
+            totals_label.configure(text="   |   ".join(
+                f"{AGING_HEADERS[bucket]}: {amount:,.2f}" for bucket, amount in zip(AGING_BUCKETS, totals)
+            ))
+        except Exception as e:
+            logging.error(f"Error loading aging report: {str(e)}")
+            messagebox.showerror("خطأ", "حدث خطأ أثناء تحميل التقرير.")
+
+    # Refreshed each time show_frame shows the page
+    tree.bind("<Map>", lambda event: load_data())
+
+    # Buttons Container
+    buttons_frame = StyleManager.create_frame(frame)
+    buttons_frame.grid(row=2, column=0, sticky="ew", padx=20, pady=20)
+    buttons_frame.grid_columnconfigure(0, weight=1)
+    buttons_frame.grid_columnconfigure(1, weight=1)
+    buttons_frame.grid_columnconfigure(2, weight=1)
+
+    # Refresh button
+    StyleManager.create_button(
+        buttons_frame,
+        text="تحديث البيانات",
+        width=200,
+        command=load_data
+    ).grid(row=0, column=0, padx=10, pady=10)
+
+    # Export button
+    StyleManager.create_button(
+        buttons_frame,
+        text="تصدير إلى Excel",
+        width=200,
+        command=lambda: export_aging_to_excel(csv_manager, report)
+    ).grid(row=0, column=1, padx=10, pady=10)
+
+    # Back button
+    StyleManager.create_button(
+        buttons_frame,
+        text="العودة",
+        style="secondary",
+        width=200,
+        command=lambda: show_frame(frames["home"])
+    ).grid(row=0, column=2, padx=10, pady=10)
@@ -1,5 +1,5 @@
-from customtkinter import CTkFrame, CTkButton, CTkLabel, CTkEntry, CTkToplevel, CTkTextbox, CTkCheckBox, CTkScrollableFrame, CTkRadioButton
-from tkinter import ttk, messagebox, filedialog, StringVar, BooleanVar
+from customtkinter import CTkFrame, CTkButton, CTkLabel, CTkEntry, CTkToplevel, CTkTextbox, CTkCheckBox
+from tkinter import ttk, messagebox, filedialog, BooleanVar
 import tkinter as tk
 import os
 import re
@@ -9,6 +9,74 @@ from utils import StyleManager, CSVManager, FileManager, DatePicker
 from helpers import refresh_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
 
 
+def format_size(size: int) -> str:
+    """Human readable file size"""
+    for unit in ("بايت", "كيلوبايت", "ميجابايت", "جيجابايت"):
+        if size < 1024 or unit == "جيجابايت":
+            return f"{size:.0f} {unit}" if unit == "بايت" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def backup_report_text(csv_manager) -> str:
+    """Summary of the backup folder shown on the backup page"""
+    report = csv_manager.backups.report()
+    if not report["count"]:
+        return "لا توجد نسخ احتياطية بعد"
+    lines = [
+        f"عدد النسخ: {report['count']} (لقطات كاملة: {report['bases']}، تغييرات: {report['deltas']})",
+        f"الحجم الكلي: {format_size(report['total_bytes'])}",
+        f"من {report['oldest']:%Y-%m-%d %H:%M} إلى {report['newest']:%Y-%m-%d %H:%M}",
+    ]
+    if report["corrupt"]:
+        lines.append(f"⚠ نسخ تالفة لا يمكن استعادتها: {report['corrupt']}")
+    if report["unverified"]:
+        lines.append(f"نسخ لم يتم فحصها بعد: {report['unverified']}")
+    if report["uncompressed"]:
+        lines.append(f"نسخ غير مضغوطة بانتظار الضغط: {report['uncompressed']}")
+    if report["free_bytes"] is not None:
+        lines.append(f"المساحة المتاحة على القرص: {format_size(report['free_bytes'])}")
+    return "\n".join(lines)
+
+
+INSTALLMENT_CHANGE_LABELS = {
+    "added": "قسط جديد",
+    "removed": "قسط محذوف",
+    "paid": "تم الدفع",
+    "unpaid": "إلغاء الدفع",
+    "notified": "تم الإشعار",
+    "amount": "تغيير المبلغ",
+}
+
+
+def format_backup_diff(diff) -> str:
+    """Text shown in the backup comparison window"""
+    if diff.is_empty():
+        return "لا توجد اختلافات"
+    lines = []
+    if diff.matched_by == "contact":
+        # Legacy backups have no Customer_ID
+        lines += ["النسخة لا تحتوي على معرفات العملاء؛ تمت المطابقة بالاسم ورقم الهاتف", ""]
+    lines += [
+        f"عملاء جدد: {len(diff.added)}",
+        f"عملاء محذوفون: {len(diff.removed)}",
+        f"عملاء معدلون: {len(diff.changed)}",
+        "",
+    ]
+    for row in diff.added:
+        lines.append(f"+ {row.get('Name', '')} ({row.get('Phone', '')})")
+    for row in diff.removed:
+        lines.append(f"- {row.get('Name', '')} ({row.get('Phone', '')})")
+    for change in diff.changed:
+        lines.append(f"* {change.name}")
+        for column, (old, new) in change.fields.items():
+            lines.append(f"    {column}: {old} ← {new}")
+        for installment in change.installments:
+            label = INSTALLMENT_CHANGE_LABELS.get(installment.kind, installment.kind)
+            amounts = f" ({installment.old} ← {installment.new})" if installment.kind == "amount" else ""
+            lines.append(f"    {installment.due_date}: {label}{amounts}")
+    return "\n".join(lines)
+
+
 def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
     header_frame = StyleManager.create_frame(frame)
     header_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=(20, 40))
@@ -63,6 +131,7 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
     def create_backup():
         try:
             backup_file = csv_manager.create_backup()
+            refresh_report()
             if backup_file:
                 messagebox.showinfo("نجاح", f"تم إنشاء نسخة احتياطية في: {backup_file}")
             else:
@@ -108,14 +177,18 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
     
     def restore_backup():
         try:
-            backup_files = csv_manager.get_backup_files()
-            if not backup_files:
+            # The catalog describes every backup; no file is opened or listed here
+            page_size = 50
+            page = {"offset": 0}
+            _, total = csv_manager.get_backup_catalog(0, page_size)
+            if not total:
                 messagebox.showerror("خطأ", "لا توجد نسخ احتياطية متاحة.")
                 return
             
-            # Create restore window
+            # Create restore window (the page's own toplevel window owns it)
+            app = frame.winfo_toplevel()
             restore_window = CTkToplevel(app)
-            restore_window.geometry("600x400")
+            restore_window.geometry("800x600")
             restore_window.title("استعادة نسخة احتياطية")
             restore_window.transient(app)  # Make window modal
             restore_window.grab_set()  # Make window modal
@@ -134,52 +207,118 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
                 text_color=StyleManager.COLORS["text_secondary"]
             ).pack(pady=(0, 20))
             
-            # Create list of backups
+            # One page of the catalog at a time in a Treeview
             backup_frame = StyleManager.create_frame(restore_window)
-            backup_frame.pack(fill="both", expand=True, padx=20, pady=20)
+            backup_frame.pack(fill="both", expand=True, padx=20, pady=(0, 10))
+            backup_frame.grid_columnconfigure(0, weight=1)
+            backup_frame.grid_rowconfigure(0, weight=1)
             
-            # Create scrollable frame for backups
-            backup_list = CTkScrollableFrame(backup_frame)
-            backup_list.pack(fill="both", expand=True)
+            column_headers = {
+                "time": "التاريخ",
+                "kind": "النوع",
+                "records": "عدد العملاء",
+                "size": "الحجم",
+                "reason": "السبب",
+                "status": "الفحص",
+            }
+            backup_tree = ttk.Treeview(
+                backup_frame,
+                columns=list(column_headers.keys()),
+                show="headings",
+                selectmode="extended",
+                style="Custom.Treeview"
+            )
+            for col, header in column_headers.items():
+                backup_tree.column(col, width=200 if col == "time" else 120, minwidth=80)
+                backup_tree.heading(col, text=header)
+            backup_tree.grid(row=0, column=0, sticky="nsew")
             
-            selected_backup = StringVar()
+            y_scrollbar = ttk.Scrollbar(backup_frame, orient="vertical", command=backup_tree.yview)
+            y_scrollbar.grid(row=0, column=1, sticky="ns")
+            backup_tree.configure(yscrollcommand=y_scrollbar.set)
             
-            for backup in sorted(backup_files, reverse=True):  # Show newest first
-                # Create a radio button for each backup
-                backup_date = backup.replace("backup_", "").replace(".csv", "")
-                try:
-                    formatted_date = datetime.strptime(backup_date, "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    formatted_date = backup_date  # Fallback if date parsing fails
-                
-                radio = CTkRadioButton(
-                    backup_list,
-                    text=f"نسخة {formatted_date}",
-                    variable=selected_backup,
-                    value=backup,
-                    font=StyleManager.FONTS["body"]
-                )
-                radio.pack(pady=5, padx=10, anchor="w")
-            
-            # Set default selection to newest backup
-            if backup_files:
-                selected_backup.set(backup_files[0])
+            kind_labels = {"snapshot": "كاملة", "delta": "تغييرات", "copy": "نسخة قديمة"}
+            reason_labels = {
+                "manual": "يدوي",
+                "before_save": "قبل الحفظ",
+                "before_restore": "قبل الاستعادة",
+            }
+            status_labels = {"ok": "✓ سليمة", "warning": "⚠ بيانات ناقصة", "corrupt": "✗ تالفة"}
+            entries_by_name = {}
+            
+            pager_frame = CTkFrame(restore_window, fg_color="transparent")
+            pager_frame.pack(fill="x", padx=20)
+            pager_frame.grid_columnconfigure(1, weight=1)
+            page_label = StyleManager.create_label(pager_frame, text="", font_style="body")
+            page_label.grid(row=0, column=1)
+            
+            def show_page(offset):
+                page_entries, page_total = csv_manager.get_backup_catalog(offset, page_size)
+                page["offset"] = offset
+                backup_tree.delete(*backup_tree.get_children())
+                entries_by_name.clear()
+                for entry in page_entries:
+                    entries_by_name[entry["name"]] = entry
+                    taken_at = entry.get("time")
+                    backup_tree.insert("", "end", iid=entry["name"], values=(
+                        taken_at.replace("T", " ")[:19] if taken_at else entry["name"],
+                        kind_labels.get(entry.get("kind"), entry.get("kind") or "-"),
+                        entry["records"] if entry.get("records") is not None else "-",
+                        format_size(entry["size"]) if entry.get("size") is not None else "-",
+                        reason_labels.get(entry.get("reason"), entry.get("reason") or "-"),
+                        status_labels.get(entry.get("status"), "-"),
+                    ))
+                # Default selection: the newest backup on the page
+                children = backup_tree.get_children()
+                if children:
+                    backup_tree.selection_set(children[0])
+                last_page = max(page_total - 1, 0) // page_size
+                page_label.configure(text=f"صفحة {offset // page_size + 1} من {last_page + 1} ({page_total} نسخة)")
+                previous_button.configure(state="normal" if offset > 0 else "disabled")
+                next_button.configure(state="normal" if offset + page_size < page_total else "disabled")
+            
+            previous_button = StyleManager.create_button(
+                pager_frame,
+                text="السابق",
+                style="secondary",
+                width=120,
+                command=lambda: show_page(max(page["offset"] - page_size, 0))
+            )
+            previous_button.grid(row=0, column=0, padx=10)
+            next_button = StyleManager.create_button(
+                pager_frame,
+                text="التالي",
+                style="secondary",
+                width=120,
+                command=lambda: show_page(page["offset"] + page_size)
+            )
+            next_button.grid(row=0, column=2, padx=10)
+            
+            show_page(0)
             
             # Buttons frame
             buttons_frame = StyleManager.create_frame(restore_window)
             buttons_frame.pack(fill="x", padx=20, pady=20)
             buttons_frame.grid_columnconfigure(0, weight=1)
             buttons_frame.grid_columnconfigure(1, weight=1)
+            buttons_frame.grid_columnconfigure(2, weight=1)
             
             def confirm_restore():
                 try:
-                    selected = selected_backup.get()
-                    if not selected:
-                        messagebox.showerror("خطأ", "يرجى اختيار نسخة احتياطية.")
+                    selection = backup_tree.selection()
+                    if len(selection) != 1:
+                        messagebox.showerror("خطأ", "يرجى اختيار نسخة احتياطية واحدة.")
+                        return
+                    selected = selection[0]
+                    
+                    if entries_by_name.get(selected, {}).get("status") == "corrupt" and not messagebox.askyesno(
+                        "تحذير", "تم اكتشاف تلف في هذه النسخة وقد تفشل استعادتها. هل تريد المتابعة؟"
+                    ):
                         return
                         
                     if messagebox.askyesno("تأكيد", "هل أنت متأكد من استعادة هذه النسخة؟ سيتم استبدال البيانات الحالية."):
                         if csv_manager.restore_backup(selected):
+                            refresh_report()
                             messagebox.showinfo("نجاح", "تم استعادة النسخة الاحتياطية بنجاح.")
                             restore_window.destroy()
                         else:
@@ -188,6 +327,58 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
                     logging.error(f"Error restoring backup: {str(e)}")
                     messagebox.showerror("خطأ", "حدث خطأ أثناء استعادة النسخة الاحتياطية.")
             
+            def compare_backups():
+                try:
+                    # Rows are listed newest first: one selection is compared
+                    # with the current data, two with each other
+                    selection = backup_tree.selection()
+                    if len(selection) == 1:
+                        diff = csv_manager.diff_backups(selection[0])
+                        title = "مقارنة النسخة بالبيانات الحالية"
+                    elif len(selection) == 2:
+                        diff = csv_manager.diff_backups(selection[1], selection[0])
+                        title = "مقارنة نسختين احتياطيتين"
+                    else:
+                        messagebox.showerror("خطأ", "يرجى اختيار نسخة أو نسختين للمقارنة.")
+                        return
+                    if diff is None:
+                        messagebox.showerror("خطأ", "فشل مقارنة النسخ الاحتياطية.")
+                        return
+                    
+                    diff_window = CTkToplevel(restore_window)
+                    diff_window.geometry("700x500")
+                    diff_window.title(title)
+                    diff_window.transient(restore_window)
+                    diff_text = CTkTextbox(diff_window, font=StyleManager.FONTS["body"])
+                    diff_text.pack(fill="both", expand=True, padx=20, pady=20)
+                    diff_text.insert("1.0", format_backup_diff(diff))
+                    diff_text.configure(state="disabled")
+                except Exception as e:
+                    logging.error(f"Error comparing backups: {str(e)}")
+                    messagebox.showerror("خطأ", "حدث خطأ أثناء مقارنة النسخ الاحتياطية.")
+            
+            def restore_to_time():
+                try:
+                    when = datetime.strptime(time_entry.get().strip(), "%Y-%m-%d %H:%M")
+                except ValueError:
+                    messagebox.showerror("خطأ", "يرجى إدخال الوقت بالصيغة YYYY-MM-DD HH:MM")
+                    return
+                try:
+                    backup_file = csv_manager.backups.backup_at(when)
+                    if backup_file is None:
+                        messagebox.showerror("خطأ", "لا توجد نسخة احتياطية قبل هذا الوقت.")
+                        return
+                    if messagebox.askyesno("تأكيد", f"سيتم استعادة البيانات كما كانت في {when:%Y-%m-%d %H:%M}. هل أنت متأكد؟"):
+                        if csv_manager.restore_to_time(when):
+                            refresh_report()
+                            messagebox.showinfo("نجاح", "تم استعادة البيانات بنجاح.")
+                            restore_window.destroy()
+                        else:
+                            messagebox.showerror("خطأ", "فشل استعادة البيانات.")
+                except Exception as e:
+                    logging.error(f"Error restoring to point in time: {str(e)}")
+                    messagebox.showerror("خطأ", "حدث خطأ أثناء استعادة البيانات.")
+            
             # Confirm button
             StyleManager.create_button(
                 buttons_frame,
@@ -196,6 +387,15 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
                 command=confirm_restore
             ).grid(row=0, column=0, padx=10)
             
+            # Compare button
+            StyleManager.create_button(
+                buttons_frame,
+                text="مقارنة",
+                style="secondary",
+                width=200,
+                command=compare_backups
+            ).grid(row=0, column=1, padx=10)
+            
             # Cancel button
             StyleManager.create_button(
                 buttons_frame,
@@ -203,7 +403,23 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
                 style="secondary",
                 width=200,
                 command=restore_window.destroy
-            ).grid(row=0, column=1, padx=10)
+            ).grid(row=0, column=2, padx=10)
+            
+            # Point-in-time restore
+            time_entry = CTkEntry(
+                buttons_frame,
+                placeholder_text="YYYY-MM-DD HH:MM",
+                font=StyleManager.FONTS["body"],
+                width=200
+            )
+            time_entry.grid(row=1, column=0, padx=10, pady=(10, 0))
+            StyleManager.create_button(
+                buttons_frame,
+                text="استعادة إلى وقت محدد",
+                style="secondary",
+                width=200,
+                command=restore_to_time
+            ).grid(row=1, column=1, padx=10, pady=(10, 0))
             
         except Exception as e:
             logging.error(f"Error in restore backup window: {str(e)}")
@@ -216,6 +432,50 @@ def setup_backup_restore_page(frame, frames, show_frame, csv_manager):
         command=restore_backup
     ).grid(row=0, column=2, padx=20)
     
+    # Storage report section
+    report_section = StyleManager.create_frame(content_frame)
+    report_section.grid(row=2, column=0, sticky="ew", pady=(20, 0))
+    report_section.grid_columnconfigure(1, weight=1)
+    
+    StyleManager.create_label(
+        report_section,
+        text="📊",
+        font=("Arial", 36)
+    ).grid(row=0, column=0, padx=(20, 10), pady=20)
+    
+    report_label = StyleManager.create_label(
+        report_section,
+        text="",
+        font_style="body",
+        text_color=StyleManager.COLORS["text_secondary"]
+    )
+    report_label.grid(row=0, column=1, sticky="w", pady=20)
+    
+    def refresh_report():
+        try:
+            report_label.configure(text=backup_report_text(csv_manager))
+        except Exception as e:
+            logging.error(f"Error reading backup report: {str(e)}")
+            report_label.configure(text="تعذر قراءة حجم النسخ الاحتياطية")
+    
+    def compact_backups():
+        try:
+            compressed, removed = csv_manager.backups.compact()
+            refresh_report()
+            messagebox.showinfo("نجاح", f"تم ضغط {compressed} نسخة وحذف {removed} نسخة قديمة.")
+        except Exception as e:
+            logging.error(f"Error compacting backups: {str(e)}")
+            messagebox.showerror("خطأ", "حدث خطأ أثناء تنظيف النسخ الاحتياطية.")
+    
+    StyleManager.create_button(
+        report_section,
+        text="ضغط وتنظيف النسخ القديمة",
+        width=200,
+        command=compact_backups
+    ).grid(row=0, column=2, padx=20)
+    
+    refresh_report()
+    
     # Back button container
     back_frame = StyleManager.create_frame(frame)
     back_frame.grid(row=2, column=0, sticky="ew", padx=20, pady=20)
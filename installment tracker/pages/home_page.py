@@ -2,11 +2,96 @@
 Home page module for the Installment Tracker application.
 """
 import os
+import queue
+import logging
+import threading
 from customtkinter import CTkFrame, CTkButton
 from utils import StyleManager
+from analytics import PortfolioAnalytics, CASH_HORIZONS
 
+# How often the page checks for KPIs computed by the worker thread
+KPI_POLL_MS = 50
 
-def setup_home_page(frame, frames, show_frame):
+
+def format_amount(value: float) -> str:
+    """Amount with thousands separators"""
+    return f"{value:,.2f}"
+
+
+def kpi_cards(kpis=None) -> list:
+    """(title, value) of each KPI card; values are "..." until kpis are computed"""
+    titles = ["إجمالي المستحقات", "المتأخرات", "المحصّل حتى الآن", "نسبة التحصيل"]
+    titles += [f"المتوقع خلال {horizon} يوماً" for horizon in CASH_HORIZONS]
+    if kpis is None:
+        return [(title, "...") for title in titles]
+    
+    # Latest month with installments due
+    rates = [month for month in kpis["collection_rate"] if month["rate"] is not None]
+    current_rate = f"{rates[-1]['rate']:.0%} ({rates[-1]['month']})" if rates else "-"
+    values = [
+        format_amount(kpis["receivable"]),
+        f"{format_amount(kpis['overdue'])} ({kpis['overdue_customers']} عميل)",
+        format_amount(kpis["collected"]),
+        current_rate,
+    ]
+    values += [format_amount(kpis["expected_cash"][horizon]) for horizon in CASH_HORIZONS]
+    return list(zip(titles, values))
+
+
+def setup_kpi_panel(frame, csv_manager, row: int):
+    """Portfolio KPIs (see analytics.py), refreshed whenever the page is shown"""
+    analytics = PortfolioAnalytics(csv_manager)
+    results = queue.Queue()
+    state = {"running": False}
+    
+    panel = StyleManager.create_frame(frame)
+    panel.grid(row=row, column=0, columnspan=2, sticky="ew", padx=30, pady=(0, 20))
+    
+    value_labels = []
+    for index, (title, value) in enumerate(kpi_cards()):
+        card_row, card_col = divmod(index, 4)
+        panel.grid_columnconfigure(card_col, weight=1)
+        card = CTkFrame(panel, fg_color=StyleManager.COLORS["surface"], corner_radius=10)
+        card.grid(row=card_row, column=card_col, padx=8, pady=8, sticky="nsew")
+        StyleManager.create_label(
+            card,
+            text=title,
+            font_style="small",
+            text_color=StyleManager.COLORS["text_secondary"]
+        ).pack(padx=10, pady=(8, 0))
+        value_label = StyleManager.create_label(card, text=value, font_style="body_bold")
+        value_label.pack(padx=10, pady=(0, 8))
+        value_labels.append(value_label)
+    
+    def compute():
+        """Worker thread: the ledger arrays are rebuilt only if the data changed"""
+        results.put(analytics.kpis())
+    
+    def poll():
+        try:
+            kpis = results.get_nowait()
+        except queue.Empty:
+            panel.after(KPI_POLL_MS, poll)
+            return
+        state["running"] = False
+        if kpis is None:
+            return
+        for label, (_, value) in zip(value_labels, kpi_cards(kpis)):
+            label.configure(text=value)
+    
+    def refresh(event=None):
+        if state["running"]:
+            return
+        state["running"] = True
+        threading.Thread(target=compute, daemon=True).start()
+        panel.after(KPI_POLL_MS, poll)
+    
+    # <Map> fires each time show_frame shows the home page
+    panel.bind("<Map>", refresh)
+    refresh()
+
+
+def setup_home_page(frame, frames, show_frame, csv_manager=None):
     """Setup the home page with a modern dashboard layout"""
     frame.grid_columnconfigure(0, weight=1)
     frame.grid_columnconfigure(1, weight=1)
@@ -14,6 +99,8 @@ def setup_home_page(frame, frames, show_frame):
     frame.grid_rowconfigure(1, weight=1)
     frame.grid_rowconfigure(2, weight=1)
     frame.grid_rowconfigure(3, weight=1)
+    frame.grid_rowconfigure(4, weight=1)
+    frame.grid_rowconfigure(5, weight=0)
     
     header_frame = StyleManager.create_frame(frame)
     header_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=20, pady=(20, 40))
@@ -62,6 +149,12 @@ def setup_home_page(frame, frames, show_frame):
             "command": lambda: os.startfile("data/customer_files"),
             "icon": "📁",
             "color": "#607D8B"
+        },
+        {
+            "text": "أعمار الديون",
+            "command": lambda: show_frame(frames["aging"]),
+            "icon": "📊",
+            "color": "#795548"
         }
     ]
     
@@ -94,4 +187,10 @@ def setup_home_page(frame, frames, show_frame):
         
         button.bind("<Enter>", on_enter)
         button.bind("<Leave>", on_leave)
-
+    
+    # Portfolio KPIs below the menu (two buttons per row)
+    if csv_manager is not None:
+        try:
+            setup_kpi_panel(frame, csv_manager, row=(len(menu_items) + 1) // 2 + 1)
+        except Exception as e:
+            logging.error(f"Error setting up KPI panel: {str(e)}")
@@ -9,6 +9,14 @@ from utils import StyleManager, CSVManager, FileManager, DatePicker
 from helpers import refresh_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
 
 
+class InstallmentNotMarked(Exception):
+    """An installment of a batch could not be marked as paid; the batch is rolled back"""
+
+    def __init__(self, customer_name: str):
+        super().__init__(customer_name)
+        self.customer_name = customer_name
+
+
 def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
     header_frame = StyleManager.create_frame(frame)
     header_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=(20, 40))
@@ -83,58 +91,48 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
             data = csv_manager.read_data()
             today = datetime.now().date()
             
-            # Group installments by customer
+            # Overdue (unpaid, due before today) installments, from the due-date index
+            overdue = {
+                (installment.customer_id, installment.due_date)
+                for installment in csv_manager.overdue_installments(today)
+            }
+            
+            # Group installments by customer (customers sharing a name stay separate)
             customer_installments = {}
             
             for customer in data:
-                customer_name = customer["Name"]
-                customer_phone = customer["Phone"]
-                installment_dates = customer["Installment Dates"].split(";")
-                paid_installments = eval(customer.get("Paid_Installments", "[]"))
+                customer_id = customer["Customer_ID"]
                 
-                # Get individual installment values
-                try:
-                    installment_values = eval(customer.get("Installment_Values", "{}"))
-                    if not isinstance(installment_values, dict):
-                        installment_values = {}
-                except:
-                    installment_values = {}
-                
-                # Create customer group
-                if customer_name not in customer_installments:
-                    customer_installments[customer_name] = {
-                        "phone": customer_phone,
-                        "installments": []
-                    }
+                # Installment records are parsed once by the CSV manager; read_data()
+                # above checked the cache, so no check per customer
+                installments = csv_manager.cached_installments(customer_id)
                 
-                # Add installments to customer group
-                for date in installment_dates:
-                    date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-                    is_paid = date in paid_installments
-                    value = installment_values.get(date, customer["Installment Value"])
-                    
-                    customer_installments[customer_name]["installments"].append({
-                        "date": date_obj,
-                        "date_str": date,
-                        "value": value,
-                        "is_paid": is_paid
-                    })
+                customer_installments[customer_id] = {
+                    "name": customer["Name"],
+                    "phone": customer["Phone"],
+                    "installments": installments
+                }
             
             # Sort customers by name
-            sorted_customers = sorted(customer_installments.items())
+            sorted_customers = sorted(customer_installments.items(), key=lambda x: x[1]["name"])
             
             # Insert into tree
-            for customer_name, customer_data in sorted_customers:
-                # Sort installments by date
-                installments = sorted(customer_data["installments"], key=lambda x: x["date"])
+            for customer_id, customer_data in sorted_customers:
+                customer_name = customer_data["name"]
+                # Sort installments by date (day ordinals parsed at load)
+                installments = sorted(customer_data["installments"], key=lambda x: x.due_day)
                 
-                # Calculate payment summary
+                # Payment summary maintained by the CSV manager
+                summary = csv_manager.cached_summary(customer_id)
                 total_installments = len(installments)
-                paid_count = sum(1 for i in installments if i["is_paid"])
+                paid_count = summary.paid_count if summary else sum(1 for i in installments if i.paid)
                 payment_status = f"مدفوع: {paid_count}/{total_installments}"
+                overdue_count = summary.overdue_count(today.toordinal()) if summary else 0
+                if overdue_count:
+                    payment_status += f" - متأخر: {overdue_count}"
                 
-                # Insert customer header with arrow and payment status
-                header_item = tree.insert("", "end", values=(
+                # Insert customer header with arrow and payment status (its iid is the Customer_ID)
+                header_item = tree.insert("", "end", iid=customer_id, values=(
                     f"▼ {customer_name}",  # Add arrow to indicate expandable
                     customer_data["phone"],
                     payment_status,  # Show payment status in date column
@@ -147,16 +145,18 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
                     values = (
                         "",  # Empty name (will be indented)
                         "",  # Empty phone
-                        installment["date_str"],
-                        installment["value"],
-                        "نعم" if installment["is_paid"] else "لا"
+                        installment.due_date,
+                        installment.amount,
+                        "نعم" if installment.paid else "لا"
                     )
                     
                     item = tree.insert(header_item, "end", values=values)
                     
                     # Add tag for paid/unpaid status
-                    if installment["is_paid"]:
+                    if installment.paid:
                         tree.item(item, tags=("paid",))
+                    elif (customer_id, installment.due_date) in overdue:
+                        tree.item(item, tags=("overdue",))
                     else:
                         tree.item(item, tags=("unpaid",))
                 
@@ -176,6 +176,10 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
                 foreground=StyleManager.COLORS["danger"],
                 font=StyleManager.FONTS["body"]
             )
+            tree.tag_configure("overdue", 
+                foreground=StyleManager.COLORS["danger"],
+                font=StyleManager.FONTS["body_bold"]
+            )
             
             # Add click handler for headers
             def on_header_click(event):
@@ -227,22 +231,29 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
             return
         
         try:
-            for item in selected_items:
-                # Skip if header item is selected
-                if "header" in tree.item(item)["tags"]:
-                    continue
+            marked_items = []
+            # All selected installments are written in a single commit; raising
+            # inside the block rolls back the ones already queued
+            with csv_manager.transaction():
+                for item in selected_items:
+                    # Skip if header item is selected
+                    if "header" in tree.item(item)["tags"]:
+                        continue
+                        
+                    values = tree.item(item)["values"]
+                    parent = tree.parent(item)
+                    customer_id = parent
+                    customer_name = tree.item(parent)["values"][0].replace("▼ ", "").replace("▶ ", "")
+                    installment_date = values[2]
                     
-                values = tree.item(item)["values"]
-                parent = tree.parent(item)
-                customer_name = tree.item(parent)["values"][0].replace("▼ ", "").replace("▶ ", "")
-                installment_date = values[2]
-                
-                if csv_manager.mark_installment_as_paid(customer_name, installment_date):
-                    tree.set(item, "Paid", "نعم")
-                    tree.item(item, tags=("paid",))
-                else:
-                    messagebox.showerror("خطأ", f"فشل في تمييز القسط كمدفوع للعميل {customer_name}")
-                    return
+                    if not csv_manager.mark_installment_as_paid(customer_id, installment_date):
+                        raise InstallmentNotMarked(customer_name)
+                    marked_items.append(item)
+            
+            # Only shown as paid once the whole batch is committed
+            for item in marked_items:
+                tree.set(item, "Paid", "نعم")
+                tree.item(item, tags=("paid",))
             
             messagebox.showinfo("نجاح", "تم تمييز الأقساط المحددة كمُدفوعة.")
             load_data()  # Refresh the view to ensure consistency
@@ -251,6 +262,8 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
             if "view" in frames:
                 refresh_treeview(frames["view"].tree, csv_manager)
                 
+        except InstallmentNotMarked as e:
+            messagebox.showerror("خطأ", f"فشل في تمييز القسط كمدفوع للعميل {e.customer_name}")
         except Exception as e:
             logging.error(f"Error marking installments as paid: {str(e)}")
             messagebox.showerror("خطأ", "حدث خطأ أثناء تمييز الأقساط كمدفوعة.")
@@ -282,6 +295,7 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
                 
             values = tree.item(item)["values"]
             parent = tree.parent(item)
+            customer_id = parent
             customer_name = tree.item(parent)["values"][0].replace("▼ ", "").replace("▶ ", "")
             customer_phone = tree.item(parent)["values"][1]
             installment_date = values[2]
@@ -417,15 +431,17 @@ def setup_manage_installments_page(frame, frames, show_frame, app, csv_manager):
                         
                     new_value = float(new_value_str)
                     
-                    # Update installment in database
-                    if csv_manager.update_installment(customer_name, installment_date, new_date, new_value):
+                    # Update installment in database (date, value and paid status in one commit)
+                    with csv_manager.transaction():
+                        updated = csv_manager.update_installment(customer_id, installment_date, new_date, new_value)
                         # Update paid status if needed
-                        if is_paid != new_paid_status:
+                        if updated and is_paid != new_paid_status:
                             if new_paid_status:
-                                csv_manager.mark_installment_as_paid(customer_name, new_date)
+                                csv_manager.mark_installment_as_paid(customer_id, new_date)
                             else:
-                                csv_manager.unmark_installment_as_paid(customer_name, new_date)
-                            
+                                csv_manager.unmark_installment_as_paid(customer_id, new_date)
+                    
+                    if updated:
                         messagebox.showinfo("نجاح", "تم تحديث بيانات القسط بنجاح.")
                         edit_window.destroy()
                         load_data()  # Refresh the view
@@ -4,7 +4,7 @@ import tkinter as tk
 import os
 import re
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from utils import StyleManager, CSVManager, FileManager, DatePicker
 from helpers import refresh_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
 
@@ -72,26 +72,32 @@ def setup_send_notification_page(frame, frames, show_frame, app, csv_manager):
     frame.tree = tree
     
     # Load data into the Treeview
+    # Tree item -> Customer_ID (a customer has one row per upcoming installment)
+    row_customer_ids = {}
+    
     def load_data():
         for row in tree.get_children():
             tree.delete(row)
+        row_customer_ids.clear()
             
-        data = csv_manager.read_data()
         today = datetime.now().date()
         
-        for customer in data:
-            installment_dates = customer["Installment Dates"].split(";")
-            for date in installment_dates:
-                date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-                # Only show upcoming installments
-                if date_obj >= today:
-                    values = (
-                        customer["Name"],
-                        customer["Phone"],
-                        date,
-                        customer["Installment Value"]
-                    )
-                    tree.insert("", "end", values=values)
+        # Customers looked up in one snapshot rather than one get_customer() per installment
+        customers = {customer["Customer_ID"]: customer for customer in csv_manager.read_data()}
+        
+        # Only show upcoming installments, soonest first (a range of the due-date index)
+        for installment in csv_manager.installments_due_between(today, date.max):
+            customer = customers.get(installment.customer_id)
+            if customer is None:
+                continue
+            values = (
+                customer["Name"],
+                customer["Phone"],
+                installment.due_date,
+                installment.amount
+            )
+            item = tree.insert("", "end", values=values)
+            row_customer_ids[item] = customer["Customer_ID"]
         
         # Configure sent notification style
         tree.tag_configure("sent", foreground=StyleManager.COLORS["success"])
@@ -114,6 +120,7 @@ def setup_send_notification_page(frame, frames, show_frame, app, csv_manager):
             
         item = tree.item(selected_item[0])  # Get the first selected item
         values = item["values"]
+        customer_id = row_customer_ids.get(selected_item[0])
         name = values[0]
         phone = str(values[1])
         installment_date = values[2]
@@ -284,16 +291,8 @@ def setup_send_notification_page(frame, frames, show_frame, app, csv_manager):
                         except Exception as e:
                             raise Exception(f"فشل في إرسال الرسالة: {str(e)}")
                         
-                        # Update notification status
-                        data = csv_manager.read_data()
-                        updated = False
-                        for customer in data:
-                            if customer["Name"] == name:
-                                customer["Notification Sent"] = True
-                                updated = True
-                                break
-                        
-                        if updated and csv_manager.save_data(data):
+                        # Update notification status of this customer only
+                        if csv_manager.set_notification_sent(customer_id):
                             success = True
                             
                             # Check if window still exists before updating it
@@ -4,9 +4,17 @@ import tkinter as tk
 import os
 import re
 import logging
+import queue
+import threading
 from datetime import datetime, timedelta
 from utils import StyleManager, CSVManager, FileManager, DatePicker
-from helpers import refresh_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
+from helpers import refresh_treeview, patch_treeview, show_payment_history, export_to_excel, refresh_payment_history_views
+from normalize import normalize_phone, normalize_text
+
+# Live search waits this long after the last keystroke before searching
+SEARCH_DELAY_MS = 250
+# How often the page checks for results from the search thread
+SEARCH_POLL_MS = 20
 
 
 def setup_view_page(frame, frames, show_frame, app, csv_manager):
@@ -46,17 +54,89 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
     )
     search_entry.grid(row=0, column=1, padx=(0, 10), pady=5, sticky="ew")
     
-    def perform_search():
+    # Live search: keystrokes are debounced, the query runs on a worker thread
+    # and only the rows that change are patched in the table. A query that
+    # extends the previous one only re-checks the previous results, as long
+    # as the data did not change meanwhile (same csv_manager.snapshot()).
+    search_state = {
+        "after_id": None,   # Pending debounced search
+        "sequence": 0,      # Number of the latest search started
+        "pending": 0,       # Searches still running
+        "started": None,    # Text of the latest search started
+        "query": None,      # Normalized query, results and snapshot of the last search shown
+        "ids": None,
+        "snapshot": None,
+    }
+    search_results = queue.Queue()
+    
+    def run_search(sequence, query, within, normalized, snapshot):
+        """Worker thread: search and hand the results to the UI thread"""
+        try:
+            results = csv_manager.search_customers(query, within)
+        except Exception as e:
+            logging.error(f"Error in live search: {str(e)}")
+            results = None
+        search_results.put((sequence, normalized, snapshot, results))
+    
+    def poll_search_results():
+        """Show the results of the latest search; older ones are dropped"""
+        while True:
+            try:
+                sequence, normalized, snapshot, results = search_results.get_nowait()
+            except queue.Empty:
+                break
+            search_state["pending"] -= 1
+            if sequence != search_state["sequence"] or results is None:
+                continue
+            search_state.update(query=normalized, snapshot=snapshot,
+                                ids={customer["Customer_ID"] for customer in results})
+            patch_treeview(frame.tree, csv_manager, results)
+            
+            # Update status message with search results
+            result_count = len(results)
+            status_label.configure(text=f"العملاء: {result_count}")
+        if search_state["pending"] > 0:
+            frame.after(SEARCH_POLL_MS, poll_search_results)
+    
+    def start_search():
+        """Start searching for the current text on a worker thread"""
+        search_state["after_id"] = None
         query = search_entry.get().strip()
-        results = csv_manager.search_customers(query)
-        refresh_treeview(frame.tree, csv_manager, results)
+        search_state["started"] = query
+        normalized = normalize_text(query)
+        snapshot = csv_manager.snapshot()
+        within = None
+        if (search_state["query"] is not None and search_state["query"] in normalized
+                and search_state["snapshot"] is snapshot):
+            within = search_state["ids"]
         
-        # Update status message with search results
-        result_count = len(results)
-        status_label.configure(text=f"العملاء: {result_count}")
+        search_state["sequence"] += 1
+        search_state["pending"] += 1
+        threading.Thread(
+            target=run_search,
+            args=(search_state["sequence"], query, within, normalized, snapshot),
+            daemon=True
+        ).start()
+        if search_state["pending"] == 1:
+            frame.after(SEARCH_POLL_MS, poll_search_results)
+    
+    def schedule_search(event=None):
+        """Debounce keystrokes: search once typing pauses"""
+        if search_entry.get().strip() == search_state["started"]:
+            return  # Cursor movement and the like
+        if search_state["after_id"] is not None:
+            frame.after_cancel(search_state["after_id"])
+        search_state["after_id"] = frame.after(SEARCH_DELAY_MS, start_search)
+    
+    def perform_search():
+        """Search now (Enter or the search button)"""
+        if search_state["after_id"] is not None:
+            frame.after_cancel(search_state["after_id"])
+        start_search()
     
     # Add keyboard binding for Enter key
     search_entry.bind("<Return>", lambda event: perform_search())
+    search_entry.bind("<KeyRelease>", schedule_search)
     
     search_button = StyleManager.create_button(
         search_frame,
@@ -111,7 +191,10 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
         "Amount": "المبلغ",
         "Installments": "عدد الأقساط",
         "Installment Value": "قيمة القسط",
-        "Start Date": "تاريخ البدء"
+        "Start Date": "تاريخ البدء",
+        # Filled from the customer summary kept by CSVManager
+        "Outstanding": "المتبقي",
+        "Next Due": "القسط القادم"
     }
     
     # Create Treeview with responsive columns
@@ -124,12 +207,14 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
     
     # Configure column proportions
     column_weights = {
-        "Name": 25,
-        "Phone": 20,
-        "Amount": 15,
-        "Installments": 15,
-        "Installment Value": 15,
-        "Start Date": 10
+        "Name": 20,
+        "Phone": 15,
+        "Amount": 12,
+        "Installments": 10,
+        "Installment Value": 12,
+        "Start Date": 10,
+        "Outstanding": 11,
+        "Next Due": 10
     }
     
     # Set dynamic column widths and headers
@@ -166,14 +251,14 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
             messagebox.showerror("خطأ", "يرجى تحديد عميل للتعديل.")
             return
             
-        # Get selected customer data
-        item = tree.item(selected_items[0])
+        # Get selected customer data (row iids are Customer_IDs)
+        customer_id = selected_items[0]
+        item = tree.item(customer_id)
         values = item["values"]
         customer_name = values[0]
         
         # Get full customer data
-        data = csv_manager.read_data()
-        customer = next((c for c in data if c["Name"] == customer_name), None)
+        customer = csv_manager.get_customer(customer_id)
         
         if not customer:
             messagebox.showerror("خطأ", "لم يتم العثور على بيانات العميل.")
@@ -266,7 +351,7 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
             
             # Get values from entries
             name = entries["Name"].get().strip()
-            phone = entries["Phone"].get().strip()
+            phone = normalize_phone(entries["Phone"].get().strip())
             amount = entries["Amount"].get().strip()
             installments = entries["Installments"].get().strip()
             start_date = entries["Start Date"].get().strip()
@@ -318,28 +403,15 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
                     "Installment Dates": ";".join(installment_dates)
                 }
                 
-                # If name changed, delete old record and create new one
-                if customer_name != name:
-                    if csv_manager.delete_customer(customer_name) and csv_manager.append_customer({
-                        **updated_data,
-                        "Notification Sent": customer.get("Notification Sent", False),
-                        "Paid_Installments": customer.get("Paid_Installments", "[]")
-                    }):
-                        messagebox.showinfo("نجاح", "تم تحديث بيانات العميل بنجاح!")
-                        edit_window.destroy()
-                        refresh_treeview(tree, csv_manager)
-                        refresh_payment_history_views(app)  # Refresh payment history views
-                    else:
-                        messagebox.showerror("خطأ", "فشل في تحديث بيانات العميل.")
+                # The Customer_ID stays the same when the name changes, so a
+                # rename is a plain update instead of delete + append
+                if csv_manager.update_customer(customer_id, updated_data):
+                    messagebox.showinfo("نجاح", "تم تحديث بيانات العميل بنجاح!")
+                    edit_window.destroy()
+                    refresh_treeview(tree, csv_manager)
+                    refresh_payment_history_views(app)  # Refresh payment history views
                 else:
-                    # Update existing record
-                    if csv_manager.update_customer(customer_name, updated_data):
-                        messagebox.showinfo("نجاح", "تم تحديث بيانات العميل بنجاح!")
-                        edit_window.destroy()
-                        refresh_treeview(tree, csv_manager)
-                        refresh_payment_history_views(app)  # Refresh payment history views
-                    else:
-                        messagebox.showerror("خطأ", "فشل في تحديث بيانات العميل.")
+                    messagebox.showerror("خطأ", "فشل في تحديث بيانات العميل.")
                 
             except ValueError as e:
                 messagebox.showerror("خطأ", f"خطأ في البيانات المدخلة: {str(e)}")
@@ -375,14 +447,15 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
             messagebox.showerror("خطأ", "يرجى تحديد عميل للحذف.")
             return
             
-        # Get selected customer data
-        item = tree.item(selected_items[0])
+        # Get selected customer data (row iids are Customer_IDs)
+        customer_id = selected_items[0]
+        item = tree.item(customer_id)
         values = item["values"]
         customer_name = values[0]
         
         # Confirm deletion
         if messagebox.askyesno("تأكيد الحذف", f"هل أنت متأكد من حذف العميل {customer_name}؟\nلا يمكن التراجع عن هذه العملية."):
-            if csv_manager.delete_customer(customer_name):
+            if csv_manager.delete_customer(customer_id):
                 messagebox.showinfo("نجاح", f"تم حذف العميل {customer_name} بنجاح.")
                 refresh_treeview(tree, csv_manager)
             else:
@@ -417,7 +490,7 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
         left_buttons,
         text="سجل الدفع",
         width=120,
-        command=show_payment_history
+        command=lambda: show_payment_history(app, frames, csv_manager, refresh_payment_history_views)
     )
     history_btn.pack(side="left", padx=(0, 10), pady=10)
 
@@ -425,7 +498,7 @@ def setup_view_page(frame, frames, show_frame, app, csv_manager):
         left_buttons,
         text="تصدير Excel",
         width=120,
-        command=export_to_excel
+        command=lambda: export_to_excel(csv_manager)
     )
     export_btn.pack(side="left", padx=(0, 10), pady=10)
     
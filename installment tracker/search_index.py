@@ -0,0 +1,150 @@
+"""
+Substring search index for CSVManager.search_customers.
+
+search_customers used to lowercase every field of every row for each query.
+The index keeps, per customer, its searchable text (the lowercased fields
+joined by a separator) and a posting list of the customers containing each
+character trigram. A query of three characters or more only checks the
+customers listed under its rarest trigram; shorter queries scan the stored
+texts, which are already lowercased. Either way the result is exactly the
+customers with a field containing the query.
+
+Posting lists are arrays of document numbers. A changed customer gets a new
+document number and the old one is marked dead; the lists are compacted
+once dead entries outnumber live ones.
+"""
+from array import array
+from typing import Dict, List, Optional, Set, Tuple, Iterable
+
+# Joins the fields of a customer; never typed in a query, so no match spans two fields
+FIELD_SEPARATOR = "\x00"
+
+
+def trigrams(text: str) -> Set[str]:
+    """Distinct trigrams of a text, except those spanning two fields"""
+    grams = set()
+    for field in text.split(FIELD_SEPARATOR):
+        grams.update(field[index:index + 3] for index in range(len(field) - 2))
+    return grams
+
+
+def _field_trigrams(text: str, cache: Dict[str, frozenset]) -> Set[str]:
+    """trigrams() with the grams of each field memoized in cache.
+
+    Amounts, dates and flags repeat across customers, so a build computes the
+    grams of each distinct value once. Date lists are unique per customer but
+    made of repeating dates, so they are memoized date by date and only the
+    grams spanning a ";" are computed per customer.
+    """
+    grams = set()
+    for field in text.split(FIELD_SEPARATOR):
+        pieces = field.split(";")
+        if any(len(piece) < 2 for piece in pieces):
+            # A gram could span two ";": index the field as a whole
+            pieces = [field]
+        for piece in pieces:
+            piece_grams = cache.get(piece)
+            if piece_grams is None:
+                piece_grams = cache[piece] = frozenset(piece[index:index + 3] for index in range(len(piece) - 2))
+            grams |= piece_grams
+        for index in range(1, len(pieces)):
+            # Grams spanning the ";" between two pieces
+            joined = pieces[index - 1][-2:] + ";" + pieces[index][:2]
+            grams.update(joined[start:start + 3] for start in range(len(joined) - 2))
+    return grams
+
+
+class SearchIndex:
+    """Trigram index over the searchable text of each customer"""
+
+    def __init__(self):
+        self.built = False
+        # Document number -> (customer id, text), None once replaced or removed
+        self._docs: List[Optional[Tuple[str, str]]] = []
+        self._doc_of: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._dead = 0
+
+    def build(self, documents: Iterable[Tuple[str, str]]):
+        """Index (customer id, text) pairs from scratch"""
+        self.clear()
+        cache: Dict[str, frozenset] = {}
+        for customer_id, text in documents:
+            self._add(customer_id, text, _field_trigrams(text, cache))
+        self.built = True
+
+    def clear(self):
+        """Drop the index; it is built again on the next search"""
+        self.built = False
+        self._docs = []
+        self._doc_of = {}
+        self._postings = {}
+        self._dead = 0
+
+    def add(self, customer_id: str, text: str):
+        """Index a new or changed customer (no-op until the index is built)"""
+        if self.built:
+            self.remove(customer_id)
+            self._add(customer_id, text)
+
+    def remove(self, customer_id: str):
+        """Remove a customer from the index"""
+        doc = self._doc_of.pop(customer_id, None)
+        if doc is None:
+            return
+        self._docs[doc] = None
+        self._dead += 1
+        if self._dead > 1000 and self._dead > len(self._doc_of):
+            self.build(self.documents())
+
+    def ids(self) -> Set[str]:
+        """Ids of the indexed customers"""
+        return set(self._doc_of)
+
+    def documents(self) -> List[Tuple[str, str]]:
+        """Live (customer id, text) pairs"""
+        return [doc for doc in self._docs if doc is not None]
+
+    def search(self, query: str, within: Optional[Iterable[str]] = None) -> Set[str]:
+        """Ids of the customers whose text contains query (already normalized).
+
+        within restricts the search to those ids, e.g. the results of a
+        query contained in this one (search-as-you-type narrowing).
+        """
+        if FIELD_SEPARATOR in query:
+            return set()
+        if within is not None:
+            matches = set()
+            for customer_id in within:
+                doc = self._doc_of.get(customer_id)
+                if doc is not None and query in self._docs[doc][1]:
+                    matches.add(customer_id)
+            return matches
+        if len(query) < 3:
+            return {customer_id for customer_id, text in self.documents() if query in text}
+
+        postings = []
+        for gram in trigrams(query):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        # The rarest trigram bounds the candidates; the substring check is exact
+        candidates = min(postings, key=len)
+        matches = set()
+        for doc in candidates:
+            entry = self._docs[doc]
+            if entry is not None and query in entry[1]:
+                matches.add(entry[0])
+        return matches
+
+    def _add(self, customer_id: str, text: str, grams: Optional[Set[str]] = None):
+        doc = len(self._docs)
+        self._docs.append((customer_id, text))
+        self._doc_of[customer_id] = doc
+        postings = self._postings
+        for gram in trigrams(text) if grams is None else grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array('I')
+            posting.append(doc)
@@ -0,0 +1,588 @@
+"""
+Storage backends used by CSVManager.
+
+CSVManager keeps its public API and in-memory cache; the backend only decides
+how rows reach the disk. Mutations are described as a list of changes so that
+a backend able to touch a single record (SQLite) does not have to rewrite the
+whole dataset the way the CSV file does.
+"""
+import os
+import csv
+import shutil
+import sqlite3
+import uuid
+import logging
+import tempfile
+import threading
+from contextlib import nullcontext
+from typing import List, Dict, Optional, NamedTuple, Iterable
+from ledger import Installment, parse_installments, encode_installments
+from journal import Journal, replay
+from concurrency import FileLock
+
+
+class Change(NamedTuple):
+    """A single mutation.
+
+    op is "insert", "update" or "delete" for a whole customer row, or
+    "installment" when only one installment record of the customer changed
+    (old_date is set when the installment was moved to another date).
+    key is the Customer_ID of the row.
+    """
+    op: str
+    key: str
+    row: Optional[Dict] = None
+    installment: Optional[Installment] = None
+    old_date: Optional[str] = None
+
+
+def new_customer_id() -> str:
+    """Generate a Customer_ID for a new customer row"""
+    return uuid.uuid4().hex[:12]
+
+
+def fsync_directory(path: str):
+    """Flush a directory entry change (a rename) to disk. Not supported on Windows."""
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_csv(path: str, columns: List[str], rows: Iterable[Dict]):
+    """Write a CSV file so that a crash leaves either the old file or the new one.
+
+    The rows go to a temporary file next to path, which is fsync'd and then
+    renamed over path with os.replace; the directory is fsync'd so the rename
+    itself survives a power loss.
+    """
+    fd, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            # mkstemp creates the file as 0o600; keep the permissions of the
+            # file it replaces so other desks sharing the folder can still open it
+            shutil.copymode(path, temp_file)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    fsync_directory(path)
+
+
+def atomic_copy(source: str, path: str):
+    """Copy a file with the same guarantee as atomic_write_csv()"""
+    fd, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode='wb') as file, open(source, mode='rb') as source_file:
+            shutil.copyfileobj(source_file, file)
+            file.flush()
+            os.fsync(file.fileno())
+        shutil.copystat(source, temp_file)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    fsync_directory(path)
+
+
+class StorageBackend:
+    """Interface shared by all storage backends"""
+    name = "base"
+    # Transactional backends never leave a half-written dataset behind,
+    # so CSVManager skips the safety backup before each save for them
+    transactional = False
+    # Cross-process lock held by CSVManager around commits (see lock())
+    file_lock: Optional[FileLock] = None
+
+    def lock(self):
+        """Context manager excluding other app instances while committing"""
+        return self.file_lock if self.file_lock is not None else nullcontext()
+
+    def exists(self) -> bool:
+        """Check whether there is stored data to back up"""
+        raise NotImplementedError
+
+    def ensure_exists(self):
+        """Create the underlying file/schema if it is missing"""
+        raise NotImplementedError
+
+    def load(self) -> List[Dict]:
+        """Return every customer row keyed by the CSV column names"""
+        raise NotImplementedError
+
+    def commit(self, rows: List[Dict], changes: Optional[List[Change]] = None):
+        """Persist a mutation.
+
+        rows is the full dataset after the mutation; changes lists what changed.
+        When changes is None the whole dataset is replaced.
+        """
+        raise NotImplementedError
+
+    def export_csv(self, path: str):
+        """Write the stored data to a CSV file (used for backups)"""
+        raise NotImplementedError
+
+    def import_csv(self, path: str):
+        """Replace the stored data with the contents of a CSV file"""
+        raise NotImplementedError
+
+    def checkpoint(self):
+        """Fold pending journaled changes into the main store (no-op by default)"""
+        pass
+
+    def fingerprint(self):
+        """A cheap value that changes whenever the stored data changes.
+
+        CSVManager keeps its cache while the fingerprint stays the same.
+        None means the backend cannot tell (the cache then expires after a delay).
+        """
+        return None
+
+
+def journal_path(csv_file: str) -> str:
+    """Journal file kept next to a CSV file"""
+    return os.path.splitext(csv_file)[0] + ".journal"
+
+
+class CSVStorage(StorageBackend):
+    """Stores customers in a single CSV file.
+
+    With a journal file, commits are appended to the journal (see journal.py)
+    and the CSV file is only rewritten at checkpoints.
+    """
+    name = "csv"
+
+    def __init__(self, csv_file: str, columns: List[str], journal_file: Optional[str] = None):
+        self.csv_file = csv_file
+        self.columns = columns
+        self.journal = Journal(journal_file) if journal_file else None
+        self.file_lock = FileLock(csv_file + ".lock")
+        # A journaled commit is a single fsync'd append and rewrites go
+        # through atomic_write_csv(), so there is never a half-written file
+        # to protect with a backup before each save
+        self.transactional = True
+
+    def exists(self) -> bool:
+        """Check whether the CSV file exists"""
+        return os.path.exists(self.csv_file)
+
+    def fingerprint(self):
+        """(st_mtime_ns, st_size, st_ino) of the CSV file and of its journal"""
+        stamps = []
+        for path in (self.csv_file, self.journal.path if self.journal is not None else None):
+            try:
+                stat = os.stat(path) if path else None
+            except OSError:
+                stat = None
+            stamps.append((stat.st_mtime_ns, stat.st_size, stat.st_ino) if stat else None)
+        return tuple(stamps)
+
+    def ensure_exists(self):
+        """Create empty CSV file with headers if it is missing and recover a leftover journal"""
+        if not os.path.exists(self.csv_file):
+            self.create_empty()
+        if self.journal is not None and self.journal.size():
+            # Changes committed before the last exit/crash that never reached the CSV file
+            logging.info(f"Replaying {len(self.journal)} journaled commits into {self.csv_file}")
+            with self.file_lock:
+                self.checkpoint()
+
+    def create_empty(self):
+        """Create empty CSV file with headers."""
+        atomic_write_csv(self.csv_file, self.columns, [])
+
+    def load(self) -> List[Dict]:
+        """Read all rows from the CSV file, with pending journaled changes applied"""
+        # Under the file lock: another desk may be rewriting the file or
+        # folding its journal into it
+        with self.file_lock:
+            with open(self.csv_file, mode='r', encoding='utf-8') as file:
+                rows = list(csv.DictReader(file))
+            # size(), not len(): other app instances may have appended records
+            if self.journal is not None and self.journal.size():
+                rows = replay(rows, self.journal.read(), "Customer_ID")
+        return rows
+
+    def commit(self, rows: List[Dict], changes: Optional[List[Change]] = None):
+        """Journal the changes, append new rows, otherwise rewrite the whole file.
+
+        A single installment cannot be updated in place in a CSV file, so
+        without a journal installment changes also rewrite the file (rows
+        already carry them).
+        """
+        if changes and self.journal is not None:
+            self.journal.append(changes)
+            if self.journal.should_checkpoint():
+                self._checkpoint(rows)
+        elif changes and all(change.op == "insert" for change in changes) and self._header_matches():
+            self._append([change.row for change in changes])
+        else:
+            self._checkpoint(rows)
+
+    def checkpoint(self):
+        """Rewrite the CSV file with the journaled changes and empty the journal"""
+        if self.journal is not None:
+            self._checkpoint(self.load())
+
+    def _checkpoint(self, rows: List[Dict]):
+        """Write rows as the new CSV file, then drop the journal they include"""
+        # A crash leaves either the old file plus its journal or the new file
+        self._write_all(rows)
+        if self.journal is None:
+            return
+        self.journal.truncate()
+        logging.debug(f"Checkpointed journal into {self.csv_file}")
+
+    def _header_matches(self) -> bool:
+        """Check that the file has the current columns (files from older versions lack some)"""
+        if not os.path.exists(self.csv_file) or not os.path.getsize(self.csv_file):
+            return True
+        with open(self.csv_file, mode='r', encoding='utf-8') as file:
+            return next(csv.reader(file), []) == self.columns
+
+    def _append(self, rows: List[Dict]):
+        """Append rows at the end of the CSV file"""
+        file_exists = os.path.exists(self.csv_file) and os.path.getsize(self.csv_file) > 0
+
+        with open(self.csv_file, mode='a', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=self.columns)
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(rows)
+            # A crash can only tear the rows being added, never existing ones
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _write_all(self, rows: List[Dict]):
+        """Rewrite the CSV file with the given rows (atomically)"""
+        atomic_write_csv(self.csv_file, self.columns, rows)
+
+    def export_csv(self, path: str):
+        """Copy the CSV file (after folding in the journal)"""
+        if self.journal is not None and self.journal.size():
+            self.checkpoint()
+        atomic_copy(self.csv_file, path)
+
+    def import_csv(self, path: str):
+        """Overwrite the CSV file with another CSV file"""
+        if self.journal is not None and self.journal.size():
+            # Journaled changes belong to the replaced data; fold them in first
+            # so they can never be replayed on top of the imported file
+            self.checkpoint()
+        atomic_copy(path, self.csv_file)
+
+
+class SQLiteStorage(StorageBackend):
+    """Stores customers in an SQLite database (WAL mode).
+
+    Customers and their installments live in separate tables, so marking one
+    installment as paid updates a single installments record.
+    """
+    name = "sqlite"
+    transactional = True
+    schema_version = 4
+
+    # CSV column -> SQL column of the customers table
+    SQL_COLUMNS = {
+        "Name": "name",
+        "Phone": "phone",
+        "Amount": "amount",
+        "Installments": "installments",
+        "Installment Value": "installment_value",
+        "Start Date": "start_date",
+        "Notification Sent": "notification_sent",
+        "Customer_ID": "uid",
+        "Row_Version": "row_version"
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT,
+            amount REAL,
+            installments INTEGER,
+            installment_value REAL,
+            start_date TEXT,
+            notification_sent INTEGER DEFAULT 0,
+            uid TEXT,
+            row_version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name);
+        CREATE TABLE IF NOT EXISTS installments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL REFERENCES customers (id),
+            due_date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            paid INTEGER NOT NULL DEFAULT 0,
+            notified INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_installments_customer ON installments (customer_id, due_date);
+    """
+
+    # Created after the upgrades, once every customer has a uid
+    UID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_uid ON customers (uid)"
+
+    # Row id of the customer with a given Customer_ID
+    CUSTOMER_ID = "SELECT id FROM customers WHERE uid = ?"
+
+    def __init__(self, db_file: str, columns: List[str]):
+        self.db_file = db_file
+        self.columns = columns
+        self._lock = threading.Lock()
+        self.file_lock = FileLock(db_file + ".lock")
+        # The notifier thread shares the manager with the UI thread
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.ensure_exists()
+
+    def exists(self) -> bool:
+        """The database is created on open"""
+        return True
+
+    def fingerprint(self):
+        """PRAGMA data_version: changes when another connection commits.
+
+        Commits made through this connection do not change it; CSVManager
+        already has those in its cache.
+        """
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def ensure_exists(self):
+        """Create the tables if they are missing and upgrade older schemas"""
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            has_customers = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customers'"
+            ).fetchone() is not None
+
+            if has_customers and version < 2:
+                self._upgrade_to_v2()
+            else:
+                self._conn.executescript(self.SCHEMA)
+            if has_customers and version < 3:
+                self._upgrade_to_v3()
+            if has_customers and version < 4:
+                self._upgrade_to_v4()
+            self._conn.execute(self.UID_INDEX)
+            self._conn.execute(f"PRAGMA user_version = {self.schema_version}")
+
+    def _upgrade_to_v2(self):
+        """Move the string installment columns of a version 1 database into the installments table"""
+        legacy_columns = ["id", "installment_value", "installment_dates", "paid_installments",
+                          "notified_installments", "installment_values"]
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+            records = self._conn.execute(f"SELECT {', '.join(legacy_columns)} FROM customers").fetchall()
+            for record in records:
+                legacy_row = dict(zip(["id", "Installment Value", "Installment Dates", "Paid_Installments",
+                                       "Notified_Installments", "Installment_Values"], record))
+                self._insert_installments(legacy_row["id"], parse_installments(legacy_row["id"], legacy_row))
+            for column in legacy_columns[2:]:
+                self._conn.execute(f"UPDATE customers SET {column} = NULL")
+        logging.info(f"Upgraded {self.db_file} to schema version 2 ({len(records)} customers)")
+
+    def _upgrade_to_v3(self):
+        """Add the uid column (Customer_ID) and give every existing customer one"""
+        with self._conn:
+            columns = [record[1] for record in self._conn.execute("PRAGMA table_info(customers)")]
+            if "uid" not in columns:
+                self._conn.execute("ALTER TABLE customers ADD COLUMN uid TEXT")
+            ids = [record[0] for record in self._conn.execute("SELECT id FROM customers WHERE uid IS NULL")]
+            self._conn.executemany("UPDATE customers SET uid = ? WHERE id = ?", [(new_customer_id(), row_id) for row_id in ids])
+        logging.info(f"Upgraded {self.db_file} to schema version 3 ({len(ids)} customer ids assigned)")
+
+    def _upgrade_to_v4(self):
+        """Add the row_version column (Row_Version)"""
+        with self._conn:
+            columns = [record[1] for record in self._conn.execute("PRAGMA table_info(customers)")]
+            if "row_version" not in columns:
+                self._conn.execute("ALTER TABLE customers ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+        logging.info(f"Upgraded {self.db_file} to schema version 4")
+
+    def load(self) -> List[Dict]:
+        """Read all customers ordered by insertion"""
+        sql_columns = ", ".join(self.SQL_COLUMNS.values())
+        with self._lock:
+            customers = self._conn.execute(f"SELECT id, {sql_columns} FROM customers ORDER BY id").fetchall()
+            installment_records = self._conn.execute(
+                "SELECT customer_id, due_date, amount, paid, notified FROM installments ORDER BY id"
+            ).fetchall()
+
+        schedules = {}
+        for customer_id, due_date, amount, paid, notified in installment_records:
+            schedules.setdefault(customer_id, []).append((due_date, amount, bool(paid), bool(notified)))
+
+        rows = []
+        for record in customers:
+            row = self._from_sql(record[1:])
+            installments = [
+                Installment(row["Customer_ID"], *installment) for installment in schedules.get(record[0], [])
+            ]
+            encode_installments(row, installments)
+            rows.append(row)
+        return rows
+
+    def _from_sql(self, record) -> Dict:
+        """Convert a database record to a CSV-shaped row"""
+        row = {}
+        for column, value in zip(self.SQL_COLUMNS, record):
+            row[column] = "" if value is None else value
+        row["Notification Sent"] = "True" if row["Notification Sent"] else "False"
+        return row
+
+    def _to_sql(self, row: Dict) -> List:
+        """Convert a CSV-shaped row to database values in SQL_COLUMNS order"""
+        values = []
+        for column in self.SQL_COLUMNS:
+            value = row.get(column, "")
+            if column == "Notification Sent":
+                value = 1 if str(value).lower() in ("true", "1") else 0
+            elif column == "Customer_ID" and not value:
+                value = new_customer_id()
+            elif column == "Row_Version":
+                value = int(value or 0)
+            values.append(value)
+        return values
+
+    def _insert_customer(self, row: Dict):
+        """Insert a customer and its installments"""
+        sql_columns = list(self.SQL_COLUMNS.values())
+        cursor = self._conn.execute(
+            f"INSERT INTO customers ({', '.join(sql_columns)}) "
+            f"VALUES ({', '.join('?' for _ in sql_columns)})",
+            self._to_sql(row)
+        )
+        self._insert_installments(cursor.lastrowid, parse_installments(row.get("Customer_ID", ""), row))
+
+    def _insert_installments(self, customer_id: int, installments: List[Installment]):
+        """Insert installment records for a customer id"""
+        self._conn.executemany(
+            "INSERT INTO installments (customer_id, due_date, amount, paid, notified) VALUES (?, ?, ?, ?, ?)",
+            [
+                (customer_id, installment.due_date, installment.amount, int(installment.paid), int(installment.notified))
+                for installment in installments
+            ]
+        )
+
+    def commit(self, rows: List[Dict], changes: Optional[List[Change]] = None):
+        """Apply the changes inside a single transaction"""
+        with self._lock, self._conn:
+            if changes is None:
+                self._conn.execute("DELETE FROM installments")
+                self._conn.execute("DELETE FROM customers")
+                seen_ids = set()
+                for row in rows:
+                    # Rows from old CSV files may lack an id; duplicates would break the unique index
+                    if not row.get("Customer_ID") or row["Customer_ID"] in seen_ids:
+                        row = dict(row, Customer_ID=new_customer_id())
+                    seen_ids.add(row["Customer_ID"])
+                    self._insert_customer(row)
+                return
+
+            for change in changes:
+                if change.op == "insert":
+                    self._insert_customer(change.row)
+                elif change.op == "update":
+                    customer_id = self._conn.execute(self.CUSTOMER_ID, (change.key,)).fetchone()
+                    if customer_id is None:
+                        continue
+                    self._conn.execute(
+                        f"UPDATE customers SET {', '.join(f'{column} = ?' for column in self.SQL_COLUMNS.values())} "
+                        f"WHERE id = ?",
+                        self._to_sql(change.row) + [customer_id[0]]
+                    )
+                    self._conn.execute("DELETE FROM installments WHERE customer_id = ?", customer_id)
+                    self._insert_installments(customer_id[0], parse_installments(change.key, change.row))
+                elif change.op == "delete":
+                    self._conn.execute(
+                        f"DELETE FROM installments WHERE customer_id = ({self.CUSTOMER_ID})", (change.key,)
+                    )
+                    self._conn.execute("DELETE FROM customers WHERE uid = ?", (change.key,))
+                elif change.op == "installment":
+                    installment = change.installment
+                    self._conn.execute(
+                        "UPDATE installments SET due_date = ?, amount = ?, paid = ?, notified = ? "
+                        "WHERE id = (SELECT id FROM installments "
+                        f"WHERE customer_id = ({self.CUSTOMER_ID}) AND due_date = ? ORDER BY id LIMIT 1)",
+                        (installment.due_date, installment.amount, int(installment.paid), int(installment.notified),
+                         change.key, change.old_date or installment.due_date)
+                    )
+                    # Other app instances compare row versions to find changed customers
+                    self._conn.execute(
+                        "UPDATE customers SET row_version = ? WHERE uid = ?",
+                        (int(change.row.get("Row_Version", 0) or 0), change.key)
+                    )
+                else:
+                    raise ValueError(f"Unknown change operation: {change.op}")
+
+    def export_csv(self, path: str):
+        """Dump all customers to a CSV file"""
+        atomic_write_csv(path, self.columns, self.load())
+
+    def import_csv(self, path: str):
+        """Replace all customers with the rows of a CSV file"""
+        with open(path, mode='r', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+        self.commit(rows)
+
+
+def migrate_csv_to_sqlite(csv_file: str, storage: SQLiteStorage) -> int:
+    """Copy every row of a CSV file into an SQLite store. Returns the row count."""
+    journal_file = journal_path(csv_file)
+    rows = CSVStorage(csv_file, storage.columns, journal_file if os.path.exists(journal_file) else None).load()
+    storage.commit(rows)
+    logging.info(f"Migrated {len(rows)} customers from {csv_file} to {storage.db_file}")
+    return len(rows)
+
+
+def create_storage(backend: str, csv_file: str, columns: List[str], db_file: Optional[str] = None,
+                   journal: bool = True) -> StorageBackend:
+    """Create the storage backend selected in main.py ("csv" or "sqlite").
+
+    journal enables the append-only journal of the CSV backend.
+    """
+    if backend == "csv":
+        return CSVStorage(csv_file, columns, journal_path(csv_file) if journal else None)
+
+    if backend == "sqlite":
+        db_file = db_file or os.path.splitext(csv_file)[0] + ".db"
+        first_run = not os.path.exists(db_file)
+        storage = SQLiteStorage(db_file, columns)
+        # One-shot migration: a new database is seeded from the existing CSV
+        if first_run and os.path.exists(csv_file):
+            migrate_csv_to_sqlite(csv_file, storage)
+        return storage
+
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <customers.csv> <customers.db>")
+        sys.exit(1)
+
+    with open(sys.argv[1], mode='r', encoding='utf-8') as file:
+        csv_columns = next(csv.reader(file))
+
+    count = migrate_csv_to_sqlite(sys.argv[1], SQLiteStorage(sys.argv[2], csv_columns))
+    print(f"Migrated {count} customers")
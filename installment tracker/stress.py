@@ -0,0 +1,141 @@
+"""
+Concurrency stress check for CSVManager.
+
+Several processes (desks) share one data folder, and each runs two threads
+on its own CSVManager, like the app does:
+- a notifier thread that marks installments as notified in transactions it
+  keeps open for a while, the way a batch stays open across slow I/O;
+- a UI thread that marks installments as paid one commit at a time and
+  renames customers.
+
+Every desk owns a different set of installment months, so no change is
+supposed to conflict with another. At the end every installment must be paid
+and notified and every customer renamed; anything else is a lost update.
+
+    python stress.py                      # csv + journal, csv, sqlite
+    python stress.py --backend sqlite --desks 6 --customers 20
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from typing import List, Tuple
+from utils import CSVManager
+from concurrency import CommitConflict
+
+MONTHS = 12
+# (backend, journal) of each configuration checked by default
+CONFIGURATIONS = (("csv", True), ("csv", False), ("sqlite", True))
+
+
+def customer_row(index: int) -> dict:
+    """A customer with one installment per month"""
+    dates = [f"2025-{month:02d}-01" for month in range(1, MONTHS + 1)]
+    return {
+        "Name": f"Customer {index}", "Phone": f"+9745500{index:04d}", "Amount": 100.0 * MONTHS,
+        "Installments": MONTHS, "Installment Value": 100.0, "Start Date": dates[0],
+        "Installment Dates": ";".join(dates), "Notification Sent": False, "Paid_Installments": "[]",
+        "Notified_Installments": "[]", "Installment_Values": "{}", "Customer_ID": f"c{index}",
+    }
+
+
+def open_manager(folder: str, backend: str, journal: bool) -> CSVManager:
+    return CSVManager(os.path.join(folder, "customers.csv"), os.path.join(folder, "backups"),
+                      backend=backend, db_file=os.path.join(folder, "customers.db"), journal=journal)
+
+
+def desk(args: Tuple[str, str, bool, int, int, int]) -> List[str]:
+    """Run one desk's notifier and UI threads; returns the errors they hit"""
+    folder, backend, journal, desk_index, desks, customers = args
+    manager = open_manager(folder, backend, journal)
+    dates = [f"2025-{month:02d}-01" for month in range(desk_index + 1, MONTHS + 1, desks)]
+    errors = []
+
+    def notifier():
+        for index in range(customers):
+            for attempt in range(20):
+                try:
+                    with manager.transaction():
+                        for date in dates:
+                            if not manager.mark_installment_as_notified(f"c{index}", date):
+                                errors.append(f"desk {desk_index}: notify c{index} {date} failed")
+                        # Keep the batch open while the other thread and desks commit
+                        time.sleep(random.uniform(0, 0.02))
+                    break
+                except CommitConflict:
+                    time.sleep(random.uniform(0, 0.01))
+            else:
+                errors.append(f"desk {desk_index}: notify c{index} kept conflicting")
+
+    def ui():
+        for index in range(customers):
+            for date in dates:
+                if not manager.mark_installment_as_paid(f"c{index}", date):
+                    errors.append(f"desk {desk_index}: pay c{index} {date} failed")
+            if desk_index == 0 and not manager.update_customer(f"c{index}", {"Name": f"Renamed {index}"}):
+                errors.append(f"desk {desk_index}: rename c{index} failed")
+            manager.read_data()
+
+    threads = [threading.Thread(target=target) for target in (notifier, ui)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def run(backend: str, journal: bool, desks: int, customers: int) -> List[str]:
+    """Run the desks on a fresh data folder; returns the errors and lost updates"""
+    with tempfile.TemporaryDirectory() as folder:
+        if not open_manager(folder, backend, journal).save_data([customer_row(i) for i in range(customers)]):
+            return ["could not create the data"]
+
+        with multiprocessing.Pool(desks) as pool:
+            results = pool.map(desk, [(folder, backend, journal, i, desks, customers) for i in range(desks)])
+        errors = [error for result in results for error in result]
+
+        # A fresh manager reads what really reached the disk
+        manager = open_manager(folder, backend, journal)
+        for index in range(customers):
+            customer = manager.get_customer(f"c{index}")
+            if customer is None:
+                errors.append(f"c{index} lost")
+                continue
+            if customer["Name"] != f"Renamed {index}":
+                errors.append(f"c{index}: rename lost")
+            for installment in manager.get_installments(f"c{index}"):
+                if not (installment.paid and installment.notified):
+                    errors.append(f"c{index} {installment.due_date}: paid={installment.paid} "
+                                  f"notified={installment.notified}")
+        return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrency stress check for CSVManager")
+    parser.add_argument("--backend", choices=("csv", "sqlite"), help="only this backend (default: all)")
+    parser.add_argument("--no-journal", action="store_true", help="csv backend without its journal")
+    parser.add_argument("--desks", type=int, default=4, help="processes sharing the data folder")
+    parser.add_argument("--customers", type=int, default=10)
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    configurations = CONFIGURATIONS if options.backend is None else ((options.backend, not options.no_journal),)
+    failed = False
+    for backend, journal in configurations:
+        started = time.time()
+        errors = run(backend, journal, options.desks, options.customers)
+        label = f"{backend}{' + journal' if backend == 'csv' and journal else ''}"
+        print(f"{label:<14} {'FAILED' if errors else 'ok'} ({time.time() - started:.1f}s)")
+        for error in errors[:20]:
+            print(f"    {error}")
+        failed = failed or bool(errors)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
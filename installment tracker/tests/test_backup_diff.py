@@ -0,0 +1,67 @@
+"""
+Backup diffs against legacy-format backups report only real changes.
+"""
+import csv
+
+from backups import BackupStore
+from backup_diff import diff_rows
+
+COLUMNS = ["Name", "Phone", "Amount", "Installments", "Installment Value", "Start Date", "Installment Dates",
+           "Notification Sent", "Paid_Installments", "Notified_Installments", "Installment_Values",
+           "Customer_ID", "Row_Version"]
+LEGACY_COLUMNS = COLUMNS[:-2]
+DATES = "2025-01-01;2025-02-01;2025-03-01"
+
+
+def legacy_row(name, phone, paid="[]", values="{}"):
+    """A row the way backups were written before ids, JSON columns and phone normalization"""
+    return {"Name": name, "Phone": phone, "Amount": "300", "Installments": "3", "Installment Value": "100",
+            "Start Date": "2025-01-01", "Installment Dates": DATES, "Notification Sent": "False",
+            "Paid_Installments": paid, "Notified_Installments": "[]", "Installment_Values": values}
+
+
+def current_row(name, phone, customer_id, paid="[]", values="{}"):
+    """A row the way CSVManager writes it today"""
+    return {"Name": name, "Phone": phone, "Amount": 300.0, "Installments": 3, "Installment Value": 100.0,
+            "Start Date": "2025-01-01", "Installment Dates": DATES, "Notification Sent": False,
+            "Paid_Installments": paid, "Notified_Installments": "[]", "Installment_Values": values,
+            "Customer_ID": customer_id, "Row_Version": "4"}
+
+
+def test_legacy_backup_shows_only_real_changes(tmp_path):
+    with open(tmp_path / "backup_20240101_000000.csv", mode='w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=LEGACY_COLUMNS)
+        writer.writeheader()
+        writer.writerow(legacy_row("A", "97431663542", "['2025-01-01']", "{'2025-03-01': 150}"))
+        writer.writerow(legacy_row("B", "0501234567", "['2025-01-01']"))
+        writer.writerow(legacy_row("C", "55123456"))
+    store = BackupStore(str(tmp_path), COLUMNS, "Customer_ID")
+
+    current = [
+        # Same data, written in today's formats
+        current_row("A", "+97431663542", "a", '["2025-01-01"]', '{"2025-03-01":150.0}'),
+        # One more installment paid
+        current_row("B", "+974501234567", "b", '["2025-01-01","2025-02-01"]'),
+        # Phone really changed
+        current_row("C", "+97455999999", "c"),
+    ]
+    diff = diff_rows(lambda: store.iter_rows("backup_20240101_000000.csv"), lambda: current,
+                     COLUMNS, "Customer_ID")
+
+    assert diff.matched_by == "contact"
+    assert [row["Name"] for row in diff.added] == ["C"]
+    assert [row["Name"] for row in diff.removed] == ["C"]
+    assert [(change.name, change.fields, [(i.due_date, i.kind) for i in change.installments])
+            for change in diff.changed] == [("B", {}, [("2025-02-01", "paid")])]
+
+
+def test_reformatted_values_are_not_changes():
+    old = [current_row("A", "+97431663542", "a", '["2025-02-01","2025-01-01"]')]
+    new = [dict(old[0], Amount="300.00", Phone="974 3166 3542", Paid_Installments="['2025-01-01', '2025-02-01']",
+                Row_Version="5")]
+    new[0]["Notification Sent"] = "false"
+    assert diff_rows(lambda: old, lambda: new, COLUMNS, "Customer_ID").is_empty()
+
+    new[0]["Amount"] = "350"
+    diff = diff_rows(lambda: old, lambda: new, COLUMNS, "Customer_ID")
+    assert [change.fields for change in diff.changed] == [{"Amount": ("300.0", "350")}]
@@ -0,0 +1,42 @@
+"""
+Journal durability: commits appended after a torn line survive replay.
+"""
+from journal import Journal, replay
+from storage import Change
+
+
+def customer(key, paid):
+    return {"Customer_ID": key, "Name": key, "Paid_Installments": paid}
+
+
+def test_append_after_torn_tail_keeps_later_commits(tmp_path):
+    path = str(tmp_path / "customers.journal")
+    journal = Journal(path)
+    journal.append([Change("update", "a", customer("a", '["2025-01-01"]'))])
+
+    # A desk died halfway through appending its record
+    with open(path, mode='a', encoding='utf-8') as file:
+        file.write('{"changes": [{"op": "update", "key": "a", "ro')
+
+    # Another desk keeps committing
+    other_desk = Journal(path)
+    other_desk.append([Change("update", "b", customer("b", '["2025-02-01"]'))])
+    other_desk.append([Change("insert", "c", customer("c", "[]"))])
+
+    commits = Journal(path).read()
+    assert [[change["key"] for change in changes] for changes in commits] == [["a"], ["b"], ["c"]]
+
+    rows = replay([customer("a", "[]"), customer("b", "[]")], commits, "Customer_ID")
+    assert [(row["Customer_ID"], row["Paid_Installments"]) for row in rows] == [
+        ("a", '["2025-01-01"]'), ("b", '["2025-02-01"]'), ("c", "[]")
+    ]
+
+
+def test_complete_journal_gets_no_blank_lines(tmp_path):
+    path = str(tmp_path / "customers.journal")
+    journal = Journal(path)
+    for key in "ab":
+        journal.append([Change("delete", key)])
+    with open(path, encoding='utf-8') as file:
+        assert all(line.strip() for line in file)
+    assert len(Journal(path)) == 2
@@ -0,0 +1,15 @@
+"""
+No lost updates when several desks share one data folder (see stress.py).
+"""
+import pytest
+
+# CSVManager lives in utils, which needs the GUI packages
+pytest.importorskip("customtkinter")
+pytest.importorskip("tkcalendar")
+
+import stress  # noqa: E402
+
+
+@pytest.mark.parametrize("backend, journal", stress.CONFIGURATIONS)
+def test_concurrent_desks_lose_no_updates(backend, journal):
+    assert stress.run(backend, journal, desks=2, customers=3) == []
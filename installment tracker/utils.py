@@ -5,13 +5,24 @@ import customtkinter
 from customtkinter import CTkFrame, CTkButton, CTkLabel, CTkEntry, CTkToplevel
 from tkinter import ttk, messagebox
 import os
-import csv
 import re
 import shutil
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, date
+from typing import List, Dict, Optional, Tuple, Sequence, Set
 from tkcalendar import Calendar
+from storage import Change, create_storage, new_customer_id
+from ledger import Installment, parse_installments, encode_installments, find_installment, parse_date
+from ledger import CustomerSummary, summarize_installments
+from codec import CachedRow, freeze_row
+from concurrency import RWLock, CommitConflict
+from backups import BackupStore
+from backup_diff import BackupDiff, diff_rows
+from search_index import SearchIndex, FIELD_SEPARATOR
+from due_index import DueIndex
+from normalize import normalize_text, normalize_phone, local_phone
 
 
 class StyleManager:
@@ -300,47 +311,431 @@ class FileManager:
 
 
 class CSVManager:
-    """Handles all CSV file operations with caching and optimized data handling"""
-    def __init__(self, csv_file: str, backup_folder: str):
+    """Handles all customer data operations with caching and optimized data handling.
+
+    The rows live in a pluggable storage backend (see storage.py): the original
+    CSV file or an SQLite database selected with the backend argument. The CSV
+    backend journals each commit (see journal.py) unless journal is False.
+    Every customer carries a generated Customer_ID; the cache is keyed by it
+    and indexed by name and phone, so single-customer operations are
+    dictionary lookups. Methods taking a customer_name accept an id as well.
+    """
+    def __init__(self, csv_file: str, backup_folder: str, backend: str = "csv", db_file: Optional[str] = None,
+                 journal: bool = True, backup_on_save: bool = False):
         self.csv_file = csv_file
         self.backup_folder = backup_folder
         self.columns = ["Name", "Phone", "Amount", "Installments", 
                        "Installment Value", "Start Date", "Installment Dates", 
                        "Notification Sent", "Paid_Installments", "Notified_Installments",
-                       "Installment_Values"]
-        self._cache = {}
+                       "Installment_Values", "Customer_ID", "Row_Version"]
+        self.id_column = "Customer_ID"
+        # Bumped on every write of a row; checked at commit time so desks
+        # sharing the data folder do not overwrite each other's changes
+        self.version_column = "Row_Version"
+        self.storage = create_storage(backend, csv_file, self.columns, db_file, journal=journal)
+        # Base snapshots plus deltas in backup_folder (see backups.py)
+        self.backups = BackupStore(backup_folder, self.columns, self.id_column)
+        # Every backend now commits atomically, so the full copy to the backup
+        # folder before each save is only made when asked for
+        self.backup_on_save = backup_on_save
+        # Customer rows keyed by Customer_ID, in file order
+        self._cache: Dict[str, Dict] = {}
+        self._ledger: Dict[str, Tuple[Installment, ...]] = {}
+        # Payment totals per customer, recomputed with its ledger entry
+        self._summaries: Dict[str, CustomerSummary] = {}
+        # Bumped by every change to the cache; read_data() shares one
+        # immutable snapshot per version instead of copying the rows
+        self._version = 0
+        self._snapshot: Optional[Tuple[Dict, ...]] = None
+        # Secondary indexes: name -> ids and phone -> ids
+        self._ids_by_name: Dict[str, List[str]] = {}
+        self._ids_by_phone: Dict[str, List[str]] = {}
+        # Trigram index behind search_customers, built on the first search
+        # and then kept up to date with the cache (see search_index.py)
+        self._search_index = SearchIndex()
+        # Installments sorted by due date, built on the first due-date query
+        # and then kept up to date with the ledger (see due_index.py)
+        self._due_index = DueIndex()
         self._cache_timestamp = None
+        # Only used for backends that cannot tell whether their data changed
         self._cache_duration = 60
+        # Storage fingerprint the cache matches (see StorageBackend.fingerprint)
+        self._fingerprint = None
+        # Raw stored values of each row at the last load (see _load_data_locked)
+        self._raw_signatures: Dict[str, tuple] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Open transaction() of each thread: its queued changes, seen only by
+        # that thread until the commit (the cache only holds committed rows)
+        self._local = threading.local()
+        # Shared by the Tk thread and the notifier thread (see concurrency.py)
+        self._rwlock = RWLock()
+        self._cas_retries = 5
         self._ensure_files_exist()
         
     def _is_cache_valid(self) -> bool:
-        """Check if cache is valid"""
-        if not self._cache or not self._cache_timestamp:
+        """Check if cache is valid.
+
+        The cache is valid while the storage fingerprint (for the CSV file
+        its mtime, size and inode) matches the one seen when it was loaded
+        or last written, so the check is one os.stat and the data is only
+        re-parsed after it really changed.
+        """
+        if not self._cache_timestamp:
             return False
-        return (datetime.now() - self._cache_timestamp).seconds < self._cache_duration
+            
+        # Shared lock: a commit in progress on another thread has already
+        # touched the file but not yet recorded its fingerprint
+        with self._rwlock.read():
+            fingerprint = self.storage.fingerprint()
+            if fingerprint is None:
+                valid = (datetime.now() - self._cache_timestamp).total_seconds() < self._cache_duration
+            else:
+                valid = fingerprint == self._fingerprint
+            
+        if valid:
+            self._cache_hits += 1
+        else:
+            self._cache_misses += 1
+        return valid
+        
+    def cache_stats(self) -> Dict[str, int]:
+        """Cache validity checks that reused the cache (hits) or needed a reload (misses)"""
+        return {"hits": self._cache_hits, "misses": self._cache_misses}
+        
+    def _write(self, rows, changes: Optional[List[Change]] = None):
+        """Commit to the storage backend and remember the resulting fingerprint,
+        so our own writes do not invalidate the cache"""
+        self.storage.commit(rows, changes)
+        self._fingerprint = self.storage.fingerprint()
         
     def _update_cache(self, data: List[Dict]):
-        """Update cache with new data"""
-        self._cache = data
+        """Rebuild the cache, the installment ledger and the indexes from a full dataset"""
+        old_cache, old_ledger, old_summaries = self._cache, self._ledger, self._summaries
+        changed = sum(1 for row in data if old_cache.get(row[self.id_column]) is not row)
+        if changed > 1000:
+            # Cheaper to sort everything again on the next query than to insert one by one
+            self._due_index.clear()
+        self._cache = {}
+        self._ledger = {}
+        self._summaries = {}
+        self._ids_by_name = {}
+        self._ids_by_phone = {}
+        for row in data:
+            customer_id = row[self.id_column]
+            if old_cache.get(customer_id) is row:
+                # A row kept by an incremental reload keeps its parsed ledger
+                self._cache[customer_id] = row
+                self._ledger[customer_id] = old_ledger[customer_id]
+                self._summaries[customer_id] = old_summaries[customer_id]
+                self._index_row(customer_id, row)
+            else:
+                self._add_to_cache(row)
+        for customer_id in self._search_index.ids() - self._cache.keys():
+            self._search_index.remove(customer_id)
+        for customer_id in self._due_index.ids() - self._cache.keys():
+            self._due_index.remove(customer_id)
+        self._new_version()
+        
+    def _new_version(self):
+        """Record that the cache changed; the next read builds a new snapshot"""
+        self._version += 1
+        self._snapshot = None
         self._cache_timestamp = datetime.now()
         
-    def read_data(self) -> List[Dict]:
-        """Read data from CSV file with caching"""
-        try:
-            if self._is_cache_valid():
-                return self._cache.copy()
+    @property
+    def version(self) -> int:
+        """Version of the cached data, bumped by every mutation or reload"""
+        return self._version
+        
+    def snapshot(self) -> Tuple[Dict, ...]:
+        """Immutable snapshot of every customer row.
+
+        The rows are read-only (codec.FrozenRow) and the tuple is shared by
+        all readers until the next mutation, so nothing is copied per read and
+        a snapshot held by another thread never changes underneath it.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._rwlock.read():
+                snapshot = self._snapshot = tuple(self._cache.values())
+        return snapshot
+        
+    @staticmethod
+    def _phone_key(phone) -> str:
+        """Phone as stored in the cache (canonical E.164, see normalize_phone)"""
+        return normalize_phone(phone)
+        
+    def _index_row(self, customer_id: str, row: Dict):
+        """Add a row to the name and phone indexes"""
+        self._ids_by_name.setdefault(row["Name"], []).append(customer_id)
+        self._ids_by_phone.setdefault(self._phone_key(row["Phone"]), []).append(customer_id)
+        
+    def _unindex_row(self, customer_id: str, row: Dict):
+        """Remove a row from the name and phone indexes"""
+        for index, key in ((self._ids_by_name, row["Name"]), (self._ids_by_phone, self._phone_key(row["Phone"]))):
+            ids = index.get(key, [])
+            if customer_id in ids:
+                ids.remove(customer_id)
+            if not ids:
+                index.pop(key, None)
                 
+    def _search_text(self, row: Dict) -> str:
+        """What search_customers matches a query against: every field but the id and version, normalized"""
+        # Normalized once here, so a search never normalizes the stored data.
+        # Phones also match in their local form (0551...), as stored ones are E.164
+        return normalize_text(FIELD_SEPARATOR.join(
+            [str(value) for key, value in row.items() if key not in (self.id_column, self.version_column)]
+            + [local_phone(str(row.get("Phone", "")))]
+        ))
+        
+    def _add_to_cache(self, row: Dict):
+        """Add one row to the cache, the ledger and the indexes"""
+        customer_id = row[self.id_column]
+        row = freeze_row(row)
+        self._cache[customer_id] = row
+        self._ledger[customer_id] = tuple(parse_installments(customer_id, row))
+        self._summaries[customer_id] = summarize_installments(self._ledger[customer_id])
+        self._index_row(customer_id, row)
+        self._search_index.add(customer_id, self._search_text(row))
+        self._due_index.set(customer_id, self._ledger[customer_id])
+        
+    def _apply_to_cache(self, changes: List[Change]):
+        """Apply changes to the cache; only the changed customers are re-parsed and re-indexed"""
+        for change in changes:
+            old_row = self._cache.get(change.key)
+            if change.op == "insert":
+                self._add_to_cache(change.row)
+            elif change.op == "delete":
+                if old_row is not None:
+                    del self._cache[change.key]
+                    self._ledger.pop(change.key, None)
+                    self._summaries.pop(change.key, None)
+                    self._unindex_row(change.key, old_row)
+                    self._search_index.remove(change.key)
+                    self._due_index.remove(change.key)
+            elif change.op == "installment":
+                self._cache[change.key] = freeze_row(change.row)
+                installments = self._ledger.get(change.key, ())
+                index = find_installment(installments, change.old_date or change.installment.due_date)
+                if index >= 0:
+                    # Ledger entries are tuples too: replace instead of mutating
+                    self._ledger[change.key] = installments[:index] + (change.installment,) + installments[index + 1:]
+                    self._summaries[change.key] = summarize_installments(self._ledger[change.key])
+                    self._due_index.set(change.key, self._ledger[change.key])
+                self._search_index.add(change.key, self._search_text(change.row))
+            else:
+                if old_row is not None:
+                    self._unindex_row(change.key, old_row)
+                # Assigning an existing key keeps the row at its position
+                row = freeze_row(change.row)
+                self._cache[change.key] = row
+                self._ledger[change.key] = tuple(parse_installments(change.key, row))
+                self._summaries[change.key] = summarize_installments(self._ledger[change.key])
+                self._index_row(change.key, row)
+                self._search_index.add(change.key, self._search_text(row))
+                self._due_index.set(change.key, self._ledger[change.key])
+        self._new_version()
+        
+    def _undo_changes(self, changes: List[Change]) -> List[Change]:
+        """Build the changes that revert changes on the current cache"""
+        undo = []
+        for change in reversed(changes):
+            old_row = self._cache.get(change.key)
+            if old_row is None:
+                undo.append(Change("delete", change.key))
+            elif change.op == "insert":
+                undo.append(Change("update", change.key, old_row))
+            elif change.op == "delete":
+                undo.append(Change("insert", change.key, old_row))
+            else:
+                undo.append(Change("update", change.key, old_row))
+        return undo
+        
+    def _resolve_ids(self, customer_key: str) -> List[str]:
+        """Ids of the customers matching a Customer_ID or a name"""
+        self._ensure_cache()
+        with self._rwlock.read():
+            if self._current_row(customer_key) is not None:
+                return [customer_key]
+            return list(self._ids_by_name.get(customer_key, []))
+        
+    def _resolve_id(self, customer_key: str) -> Optional[str]:
+        """Id of the customer matching a Customer_ID or a name (first match)"""
+        ids = self._resolve_ids(customer_key)
+        if len(ids) > 1:
+            logging.warning(f"Several customers are named {customer_key}; using the first one")
+        return ids[0] if ids else None
+        
+    def get_customer(self, customer_key: str) -> Optional[Dict]:
+        """Get a customer row by Customer_ID or name"""
+        customer_id = self._resolve_id(customer_key)
+        return self._current_row(customer_id) if customer_id else None
+        
+    def find_customers(self, name: Optional[str] = None, phone: Optional[str] = None) -> List[Dict]:
+        """Get the customers with an exact name and/or phone"""
+        self._ensure_cache()
+        with self._rwlock.read():
+            ids = None
+            if name is not None:
+                ids = self._ids_by_name.get(name, [])
+            if phone is not None:
+                phone_ids = self._ids_by_phone.get(self._phone_key(phone), [])
+                ids = phone_ids if ids is None else [customer_id for customer_id in ids if customer_id in phone_ids]
+            return [self._cache[customer_id] for customer_id in ids or []]
+            
+    def duplicate_phones(self) -> Dict[str, List[Dict]]:
+        """Get the customers sharing a phone number, by normalized phone"""
+        self._ensure_cache()
+        with self._rwlock.read():
+            return {
+                phone: [self._cache[customer_id] for customer_id in ids]
+                for phone, ids in self._ids_by_phone.items()
+                if len(ids) > 1
+            }
+        
+    def _ready_due_index(self) -> DueIndex:
+        """The due-date index, built on first use; query it under the read lock"""
+        self._ensure_cache()
+        if not self._due_index.built:
+            with self._rwlock.write():
+                if not self._due_index.built:
+                    self._due_index.build(self._ledger)
+        return self._due_index
+        
+    def installments_due_between(self, start: date, end: date, unpaid_only: bool = False) -> List[Installment]:
+        """Get the installments due from start to end (both included), by due date"""
+        try:
+            due_index = self._ready_due_index()
+            with self._rwlock.read():
+                return due_index.between(start, end, unpaid_only)
+        except Exception as e:
+            logging.error(f"Error querying installments due: {str(e)}")
+            return []
+            
+    def overdue_installments(self, today: Optional[date] = None) -> List[Installment]:
+        """Get the unpaid installments due before today, oldest first"""
+        try:
+            due_index = self._ready_due_index()
+            with self._rwlock.read():
+                return due_index.overdue(today or date.today())
+        except Exception as e:
+            logging.error(f"Error querying overdue installments: {str(e)}")
+            return []
+            
+    def next_due_installments(self, count: int, today: Optional[date] = None) -> List[Installment]:
+        """Get the next count unpaid installments due from today on"""
+        try:
+            due_index = self._ready_due_index()
+            with self._rwlock.read():
+                return due_index.next_due(today or date.today(), count)
+        except Exception as e:
+            logging.error(f"Error querying next installments due: {str(e)}")
+            return []
+        
+    def get_ledger(self) -> Tuple[int, Dict[str, Tuple[Installment, ...]]]:
+        """Get the data version and a copy of the Customer_ID -> installments mapping"""
+        self._ensure_cache()
+        with self._rwlock.read():
+            return self._version, dict(self._ledger)
+        
+    def get_customer_summary(self, customer_key: str) -> Optional[CustomerSummary]:
+        """Get the payment totals of a customer by Customer_ID or name.
+
+        Kept up to date by every mutation (only the changed customer is
+        recomputed), so reading it costs a dictionary lookup.
+        """
+        customer_id = self._resolve_id(customer_key)
+        return self._summaries.get(customer_id) if customer_id else None
+        
+    def get_installments(self, customer_name: str) -> Tuple[Installment, ...]:
+        """Get the parsed installment records of a customer, in schedule order"""
+        customer_id = self._resolve_id(customer_name)
+        return self._current_ledger(customer_id) if customer_id else ()
+        
+    def cached_installments(self, customer_id: str) -> Tuple[Installment, ...]:
+        """Installments of a Customer_ID as cached, without checking the storage.
+
+        For loops over the rows of a read_data() or search_customers() result,
+        which already made sure the cache is current; get_installments would
+        stat the data file again for every row.
+        """
+        return self._ledger.get(customer_id, ())
+        
+    def cached_summary(self, customer_id: str) -> Optional[CustomerSummary]:
+        """Payment totals of a Customer_ID as cached, without checking the storage (see cached_installments)"""
+        return self._summaries.get(customer_id)
+        
+    def read_data(self) -> Sequence[Dict]:
+        """Read data from CSV file with caching.
+
+        Returns the shared immutable snapshot (see snapshot()); change data
+        with the mutation methods (update_customer, mark_installment_as_paid...).
+        """
+        if self._is_cache_valid():
+            return self.snapshot()
+        return self._load_data()
+        
+    def _ensure_cache(self):
+        """Reload the cache only if the stored data changed"""
+        if not self._is_cache_valid():
+            self._load_data()
+            
+    def _load_data(self) -> Sequence[Dict]:
+        """Load every row from the storage backend into the cache"""
+        with self._rwlock.write():
+            return self._load_data_locked()
+            
+    def _load_data_locked(self) -> Sequence[Dict]:
+        """Body of _load_data(), run while holding the write lock.
+
+        Rows whose raw values did not change since the last load keep their
+        parsed row and ledger, so a reload after another desk's commit only
+        re-parses the rows that desk changed.
+        """
+        try:
+            # Taken before loading: a change made during the load forces another reload
+            fingerprint = self.storage.fingerprint()
             data = []
-            with open(self.csv_file, mode='r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
+            seen_ids = set()
+            signatures = {}
+            assigned_ids = False
+            for row in self.storage.load():
+                customer_id = row.get(self.id_column)
+                signature = self._raw_signature(row)
+                loaded = self._raw_signatures.get(customer_id)
+                # Reuse only the very row parsed from that data: rows changed
+                # in the cache since (commits, open transactions) are re-parsed
+                if loaded is not None and loaded[0] == signature and customer_id not in seen_ids \
+                        and self._cache.get(customer_id) is loaded[1]:
+                    cleaned_row = loaded[1]
+                else:
                     cleaned_row = self._clean_row_data(row)
                     if "Notified_Installments" not in cleaned_row:
                         cleaned_row["Notified_Installments"] = "[]"
-                    data.append(cleaned_row)
+                    if not cleaned_row.get(self.id_column) or cleaned_row[self.id_column] in seen_ids:
+                        cleaned_row[self.id_column] = new_customer_id()
+                        assigned_ids = True
+                        signature = None
+                    # Frozen here so the cache keeps this very object (see _add_to_cache)
+                    cleaned_row = freeze_row(cleaned_row)
+                if signature is not None:
+                    signatures[cleaned_row[self.id_column]] = (signature, cleaned_row)
+                seen_ids.add(cleaned_row[self.id_column])
+                data.append(cleaned_row)
+            self._fingerprint = fingerprint
+            self._raw_signatures = signatures
+                
+            if assigned_ids:
+                # Persist generated ids right away so they stay stable across reloads
+                if self._backup_before_save():
+                    self.create_backup(reason="before_save")
+                with self.storage.lock():
+                    self._write(data)
+                logging.info("Assigned customer ids to rows without one")
                     
             self._update_cache(data)
-            return data
+            return self.snapshot()
         except FileNotFoundError:
             logging.error(f"CSV file not found: {self.csv_file}")
             self._create_empty_csv()
@@ -349,17 +744,24 @@ class CSVManager:
             logging.error(f"Error reading CSV file: {str(e)}")
             return []
             
+    def _raw_signature(self, row: Dict) -> tuple:
+        """Raw stored values of a row, to tell whether it changed between loads"""
+        return tuple(str(row.get(column, "")) for column in self.columns)
+        
     def _clean_row_data(self, row: Dict) -> Dict:
         """Clean and validate row data"""
-        cleaned_row = row.copy()
+        # CachedRow memoizes the decoded list/dict columns (see codec.py)
+        cleaned_row = CachedRow(row)
         
         if "Phone" in cleaned_row:
-            cleaned_row["Phone"] = f"+{cleaned_row['Phone']}" if not cleaned_row['Phone'].startswith("+") else cleaned_row['Phone']
+            # Rows written before phones were normalized are normalized on read
+            cleaned_row["Phone"] = normalize_phone(cleaned_row["Phone"])
             
         try:
             cleaned_row["Amount"] = float(cleaned_row.get("Amount", 0))
             cleaned_row["Installment Value"] = float(cleaned_row.get("Installment Value", 0))
             cleaned_row["Installments"] = int(cleaned_row.get("Installments", 0))
+            cleaned_row["Row_Version"] = int(cleaned_row.get("Row_Version") or 0)
         except (ValueError, TypeError):
             logging.warning(f"Invalid numeric values in row: {row}")
             
@@ -377,25 +779,309 @@ class CSVManager:
         """Save data to CSV file with backup"""
         try:
             validated_data = []
+            seen_ids = set()
             for row in data:
+                # Rows from read_data() are read-only; work on a copy
+                row = CachedRow(row)
+                if "Phone" in row:
+                    row["Phone"] = normalize_phone(row["Phone"])
                 if self._validate_row(row):
+                    if not row.get(self.id_column) or row[self.id_column] in seen_ids:
+                        row[self.id_column] = new_customer_id()
+                    seen_ids.add(row[self.id_column])
                     validated_data.append(row)
                 else:
                     logging.warning(f"Invalid row data skipped: {row}")
             
-            self.create_backup()
+            if self._backup_before_save():
+                self.create_backup(reason="before_save")
+            
+            with self._rwlock.write(), self.storage.lock():
+                self._write(validated_data)
+                self._update_cache(validated_data)
+            return True
+        except Exception as e:
+            logging.error(f"Error saving data: {str(e)}")
+            return False
+            
+    def _backup_before_save(self) -> bool:
+        """Whether a save first copies the data to the backup folder"""
+        return self.backup_on_save or not self.storage.transactional
+        
+    def _in_transaction(self) -> bool:
+        """Check whether the calling thread has an open transaction()"""
+        return getattr(self._local, "changes", None) is not None
+        
+    def _current_row(self, customer_id: str) -> Optional[Dict]:
+        """Row of a customer as the calling thread sees it: the cached row,
+        or the row its open transaction() changed it to (None once deleted)"""
+        if self._in_transaction() and customer_id in self._local.rows:
+            return self._local.rows[customer_id]
+        return self._cache.get(customer_id)
+        
+    def _current_ledger(self, customer_id: str) -> Tuple[Installment, ...]:
+        """Installments of a customer as the calling thread sees them (see _current_row)"""
+        if self._in_transaction() and customer_id in self._local.ledgers:
+            return self._local.ledgers[customer_id]
+        return self._ledger.get(customer_id, ())
+        
+    @contextmanager
+    def transaction(self):
+        """Group mutations so they reach the storage backend in a single commit.
+
+        Inside the block, mutations are only queued. The calling thread sees
+        them right away (get_customer, get_installments and later mutations
+        build on them); the cache, other threads and the storage backend only
+        see them once the block exits and they are written with one backup
+        and one storage commit. If another thread or desk changed one of the
+        queued rows meanwhile, CommitConflict is raised. If the block raises
+        or the commit fails, the queued changes are dropped and the exception
+        propagates. Nested transactions join the outer one.
+
+            with csv_manager.transaction():
+                for date in dates:
+                    csv_manager.mark_installment_as_paid(customer_id, date)
+        """
+        if self._in_transaction():
+            yield self
+            return
+            
+        self._local.changes = []
+        # (change, build) of each queued change: build (see _commit_cas), if
+        # any, rebuilds the change on a newer row at commit time
+        self._local.queued = []
+        # Rows and ledgers as changed by the queued changes, and the cached
+        # rows they were built from (checked again at commit time)
+        self._local.rows = {}
+        self._local.ledgers = {}
+        self._local.base_rows = {}
+        try:
+            yield self
+            changes = self._local.changes
+            if changes:
+                if self._backup_before_save():
+                    self.create_backup(reason="before_save")
+                with self._rwlock.write(), self.storage.lock():
+                    # Reload what other desks committed, then replay the queued changes on top
+                    self._refresh_locked()
+                    self._write_changes(self._rebase_queue())
+        except Exception as e:
+            # Nothing reached the cache or the storage; dropping the queue is the rollback
+            logging.error(f"Transaction rolled back: {str(e)}")
+            raise
+        finally:
+            self._local.changes = None
+            self._local.queued = None
+            self._local.rows = None
+            self._local.ledgers = None
+            self._local.base_rows = None
             
-            with open(self.csv_file, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=self.columns)
-                writer.writeheader()
-                writer.writerows(validated_data)
+    batch = transaction
+            
+    def _persist(self, changes: List[Change], expected: Optional[Dict[str, Dict]] = None, build=None):
+        """Apply changes to the cache and the storage backend, reverting the cache if the write fails.
+
+        The backend receives the updated rows as a view of the cache: the CSV
+        backend rewrites them, backends that can update a single record
+        (SQLite) only use the changes. Inside a transaction() the changes are
+        only queued (see _queue); build is the function of _commit_cas that
+        made the change, used to rebuild it if its row changes before the
+        transaction commits.
+        
+        expected maps customer ids to the cached rows the changes were built
+        from; if one of them changed meanwhile (in this process or on another
+        desk), CommitConflict is raised and nothing is applied. Every written
+        row gets its Row_Version bumped.
+        """
+        with self._rwlock.write():
+            if self._in_transaction():
+                self._queue(changes, expected, build)
+                return
+            # Outside a transaction this is the commit itself: hold the
+            # cross-process lock and catch up with other desks first
+            with self.storage.lock():
+                self._refresh_locked()
+                if expected and any(self._row_changed(key, row) for key, row in expected.items()):
+                    raise CommitConflict()
+                self._bump_versions(changes)
+                self._write_changes(changes)
+                
+    def _queue(self, changes: List[Change], expected: Optional[Dict[str, Dict]] = None, build=None):
+        """Queue changes in the calling thread's transaction() without touching the cache"""
+        if expected and any(self._row_changed(key, row) for key, row in expected.items()):
+            raise CommitConflict()
+        for change in changes:
+            self._local.base_rows.setdefault(change.key, self._cache.get(change.key))
+        self._bump_versions(changes)
+        for change in changes:
+            if change.row is None:
+                self._local.rows[change.key] = None
+                self._local.ledgers[change.key] = ()
+            else:
+                row = self._local.rows[change.key] = freeze_row(change.row)
+                self._local.ledgers[change.key] = tuple(parse_installments(change.key, row))
+            self._local.queued.append((change, build))
+        self._local.changes.extend(changes)
+        
+    def _rebase_queue(self) -> List[Change]:
+        """The calling thread's queued changes, rebuilt on the cached rows if those changed.
+
+        Runs at commit time, after _refresh_locked(). When another thread or
+        desk committed one of the queued rows since the transaction began,
+        each change is built again by its build function on the committed row,
+        the way _commit_cas retries, so both sides' changes are kept. A change
+        that cannot be rebuilt (its customer or installment is gone) raises
+        CommitConflict.
+        """
+        if not any(self._rows_differ(self._cache.get(key), row) for key, row in self._local.base_rows.items()):
+            return self._local.changes
+            
+        logging.info("Rows changed since the transaction began; rebuilding its changes on the committed rows")
+        queued = self._local.queued
+        self._local.changes, self._local.queued = [], []
+        self._local.rows, self._local.ledgers, self._local.base_rows = {}, {}, {}
+        for change, build in queued:
+            if build is not None:
+                row = self._current_row(change.key)
+                change = build(row, self._current_ledger(change.key)) if row is not None else None
+                if change is None or (change.row is not None and not self._validate_row(change.row)):
+                    raise CommitConflict()
+            self._queue([change], build=build)
+        return self._local.changes
+        
+    def _bump_versions(self, changes: List[Change]):
+        """Give every row written by changes the next Row_Version"""
+        for change in changes:
+            if change.row is not None:
+                change.row[self.version_column] = self._row_version(change.key) + 1
+                
+    def _write_changes(self, changes: List[Change]):
+        """Apply changes to the cache and write them, reverting the cache if the write fails.
+
+        Runs with the write lock and the storage lock held. The undo is built
+        right before applying, from the rows the write replaces.
+        """
+        undo = self._undo_changes(changes)
+        self._apply_to_cache(changes)
+        try:
+            self._write(self._cache.values(), changes)
+        except Exception:
+            self._apply_to_cache(undo)
+            raise
+            
+    def _row_version(self, customer_id: str) -> int:
+        """Row_Version of a row as the calling thread sees it (0 for rows written before versions existed)"""
+        row = self._current_row(customer_id)
+        try:
+            return int(row.get(self.version_column, 0) or 0) if row is not None else 0
+        except (ValueError, TypeError):
+            return 0
+            
+    def _row_changed(self, customer_id: str, base_row: Dict) -> bool:
+        """Check whether the row the calling thread sees differs from the row a change was built from"""
+        current = self._current_row(customer_id)
+        if current is None:
+            return True
+        return self._rows_differ(current, base_row)
+        
+    def _rows_differ(self, current: Optional[Dict], base_row: Optional[Dict]) -> bool:
+        """Check whether a row is no longer the row something was built from (None: no row)"""
+        if current is base_row:
+            return False
+        if current is None or base_row is None:
+            return True
+        # Rows replaced by a reload are compared by version, then by value
+        # (an edit made outside the app does not bump the version)
+        return current.get(self.version_column) != base_row.get(self.version_column) or current != base_row
+        
+    def _refresh_locked(self):
+        """Catch up with commits made by other app instances since our last load or write.
+
+        Runs with the write lock and the storage lock held, before every
+        commit. The cache only holds committed rows (transactions queue their
+        changes per thread), so it can always be reloaded; only the rows that
+        changed on disk are re-parsed. Nothing may be written on top of a
+        cache that failed to reload, so that raises an error.
+        """
+        if self.storage.fingerprint() == self._fingerprint:
+            return
+            
+        logging.info("Data changed on another desk; reloading changed rows")
+        self._load_data_locked()
+        if self.storage.fingerprint() != self._fingerprint:
+            raise IOError("Could not reload the data changed on another desk")
+            
+    def _commit_cas(self, customer_id: str, build) -> bool:
+        """Compare-and-swap commit of a change derived from one customer's current row.
+
+        build(row, installments) returns the Change to commit, or None to give
+        up. It runs without the write lock; if another thread replaced the row
+        before the swap, build runs again on the newer row, so changes made by
+        both threads to different fields or installments are all kept. Under
+        heavy contention the last attempt holds the locks from reading the row
+        to the commit (see _commit_lock), so it cannot conflict.
+        """
+        for attempt in range(self._cas_retries):
+            last = attempt == self._cas_retries - 1 and not self._in_transaction()
+            with self._commit_lock() if last else nullcontext():
+                with self._rwlock.read():
+                    row = self._current_row(customer_id)
+                    installments = self._current_ledger(customer_id)
+                if row is None:
+                    logging.warning(f"Customer not found: {customer_id}")
+                    return False
+                    
+                change = build(row, installments)
+                if change is None:
+                    return False
+                try:
+                    return self._commit([change], expected={customer_id: row}, build=build)
+                except CommitConflict:
+                    logging.info(f"Customer {customer_id} changed concurrently; merging (attempt {attempt + 1})")
                 
-            self._update_cache(validated_data)
+        logging.error(f"Giving up on customer {customer_id} after {self._cas_retries} concurrent changes")
+        return False
+        
+    @contextmanager
+    def _commit_lock(self):
+        """Hold the write lock and the storage lock, caught up with other desks"""
+        with self._rwlock.write(), self.storage.lock():
+            self._refresh_locked()
+            yield
+            
+    def _commit(self, changes: List[Change], expected: Optional[Dict[str, Dict]] = None, build=None) -> bool:
+        """Validate and persist changes to single customers.
+
+        Raises CommitConflict when expected rows were replaced (see _persist).
+        """
+        try:
+            for change in changes:
+                if change.row is not None and not self._validate_row(change.row):
+                    logging.warning(f"Invalid row data rejected: {change.row}")
+                    return False
+            
+            if self._backup_before_save() and not self._in_transaction():
+                self.create_backup(reason="before_save")
+            
+            self._persist(changes, expected, build)
             return True
+        except CommitConflict:
+            raise
         except Exception as e:
             logging.error(f"Error saving data: {str(e)}")
             return False
             
+    def checkpoint(self) -> bool:
+        """Fold journaled changes into the main data file (called on exit)"""
+        try:
+            with self._rwlock.write(), self.storage.lock():
+                self.storage.checkpoint()
+                self._fingerprint = self.storage.fingerprint()
+            return True
+        except Exception as e:
+            logging.error(f"Error checkpointing data: {str(e)}")
+            return False
+            
     def _validate_row(self, row: Dict) -> bool:
         """Validate row data"""
         required_fields = ["Name", "Phone", "Amount", "Installments"]
@@ -429,8 +1115,7 @@ class CSVManager:
             if not os.path.exists(self.backup_folder):
                 os.makedirs(self.backup_folder)
                 
-            if not os.path.exists(self.csv_file):
-                self._create_empty_csv()
+            self.storage.ensure_exists()
                 
         except Exception as e:
             logging.error(f"Error ensuring files exist: {str(e)}")
@@ -439,9 +1124,7 @@ class CSVManager:
     def _create_empty_csv(self):
         """Create empty CSV file with headers."""
         try:
-            with open(self.csv_file, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(self.columns)
+            self.storage.ensure_exists()
         except Exception as e:
             logging.error(f"Error creating empty CSV: {str(e)}")
             raise
@@ -449,27 +1132,29 @@ class CSVManager:
     def append_customer(self, customer_data: Dict) -> bool:
         """Append a new customer to the CSV file."""
         try:
-            missing_fields = [field for field in self.columns if field not in customer_data]
+            # Customer_ID and Row_Version are maintained by CSVManager itself
+            missing_fields = [
+                field for field in self.columns
+                if field not in customer_data and field not in (self.id_column, self.version_column)
+            ]
             if missing_fields:
                 logging.error(f"Missing required fields: {missing_fields}")
                 messagebox.showerror("خطأ", f"الحقول التالية مطلوبة: {', '.join(missing_fields)}")
                 return False
             
-            if not self.create_backup():
+            if self._backup_before_save() and not self._in_transaction() and not self.create_backup(reason="before_save"):
                 logging.error("Failed to create backup before appending customer")
                 messagebox.showerror("خطأ", "فشل في إنشاء نسخة احتياطية")
                 return False
             
-            file_exists = os.path.exists(self.csv_file) and os.path.getsize(self.csv_file) > 0
-            
-            with open(self.csv_file, mode='a', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=self.columns)
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(customer_data)
-            
-            self._cache = {}
-            self._cache_timestamp = None
+            self._ensure_cache()
+                
+            row = self._clean_row_data(customer_data)
+            with self._rwlock.write():
+                if not row.get(self.id_column) or row[self.id_column] in self._cache:
+                    row[self.id_column] = new_customer_id()
+                
+                self._persist([Change("insert", row[self.id_column], row)])
             return True
         except PermissionError:
             logging.error("Permission denied while writing to CSV file")
@@ -483,26 +1168,24 @@ class CSVManager:
     def update_customer(self, name: str, updated_data: Dict) -> bool:
         """Update customer data in CSV file."""
         try:
-            data = self.read_data()
-            customer_found = False
-            
-            for i, row in enumerate(data):
-                if row["Name"] == name:
-                    preserved_fields = {
-                        "Notification Sent": row.get("Notification Sent", False),
-                        "Paid_Installments": row.get("Paid_Installments", "[]"),
-                        "Notified_Installments": row.get("Notified_Installments", "[]"),
-                        "Installment_Values": row.get("Installment_Values", "{}")
-                    }
-                    data[i] = {**row, **updated_data, **preserved_fields}
-                    customer_found = True
-                    break
-            
-            if not customer_found:
+            customer_id = self._resolve_id(name)
+            if customer_id is None:
                 logging.error(f"Customer not found: {name}")
                 return False
                 
-            success = self.save_data(data)
+            def build(row, installments):
+                preserved_fields = {
+                    "Notification Sent": row.get("Notification Sent", False),
+                    "Paid_Installments": row.get("Paid_Installments", "[]"),
+                    "Notified_Installments": row.get("Notified_Installments", "[]"),
+                    "Installment_Values": row.get("Installment_Values", "{}"),
+                    self.id_column: customer_id
+                }
+                updated_row = CachedRow({**row, **updated_data, **preserved_fields})
+                updated_row["Phone"] = normalize_phone(updated_row["Phone"])
+                return Change("update", customer_id, updated_row)
+                
+            success = self._commit_cas(customer_id, build)
             if success:
                 logging.info(f"Successfully updated customer: {name}")
             return success
@@ -513,33 +1196,34 @@ class CSVManager:
     def delete_customer(self, name: str) -> bool:
         """Delete customer from CSV file."""
         try:
-            data = self.read_data()
-            original_length = len(data)
-            data = [row for row in data if row["Name"] != name]
+            # A name (rather than an id) deletes every customer with that name
+            customer_ids = self._resolve_ids(name)
             
-            if len(data) == original_length:
+            if not customer_ids:
                 logging.error(f"Customer not found: {name}")
                 return False
                 
-            return self.save_data(data)
+            return self._commit([Change("delete", customer_id) for customer_id in customer_ids])
         except Exception as e:
             logging.error(f"Error deleting customer: {str(e)}")
             return False
             
-    def create_backup(self) -> Optional[str]:
-        """Create a backup of the current data."""
+    def create_backup(self, reason: str = "manual") -> Optional[str]:
+        """Create a backup of the current data.
+
+        Only the rows changed since the last full snapshot are stored, and
+        nothing is stored if the data did not change since the last backup
+        (the path of that backup is returned). reason ("manual",
+        "before_save", "before_restore") is recorded in the backup catalog.
+        """
         try:
-            if not os.path.exists(self.csv_file):
+            if not self.storage.exists():
                 logging.error("No data file to backup")
                 return None
-                
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = os.path.join(self.backup_folder, f"backup_{timestamp}.csv")
-            
-            if not os.path.exists(self.backup_folder):
-                os.makedirs(self.backup_folder)
             
-            shutil.copy2(self.csv_file, backup_filename)
+            # Exclusive, so the rows backed up are one committed state
+            with self._rwlock.write(), self.storage.lock():
+                backup_filename = self.backups.save(self.storage.load(), reason=reason)
             logging.info(f"Backup created: {backup_filename}")
             return backup_filename
         except Exception as e:
@@ -547,19 +1231,26 @@ class CSVManager:
             return None
             
     def restore_backup(self, backup_file: str) -> bool:
-        """Restore from a backup file."""
+        """Restore from a backup file (a snapshot, a delta or an older full copy)."""
         try:
-            backup_path = os.path.join(self.backup_folder, backup_file)
-            if not os.path.exists(backup_path):
-                logging.error(f"Backup file not found: {backup_path}")
+            if not self.backups.exists(backup_file):
+                logging.error(f"Backup file not found: {os.path.join(self.backup_folder, backup_file)}")
                 return False
                 
-            self.create_backup()
+            self.create_backup(reason="before_restore")
             
-            shutil.copy2(backup_path, self.csv_file)
-            
-            self._cache = {}
-            self._cache_timestamp = None
+            # Deltas are applied to their snapshot into a temporary CSV file first
+            backup_path = self.backups.export(backup_file)
+            try:
+                with self._rwlock.write(), self.storage.lock():
+                    self.storage.import_csv(backup_path)
+                    
+                    self._cache = {}
+                    self._new_version()
+                    self._cache_timestamp = None
+                    self._fingerprint = None
+            finally:
+                os.remove(backup_path)
             
             return True
             
@@ -568,58 +1259,126 @@ class CSVManager:
             return False
             
     def get_backup_files(self) -> List[str]:
-        """Get list of available backup files."""
+        """Get list of available backup files, newest first."""
         try:
             if not os.path.exists(self.backup_folder):
                 os.makedirs(self.backup_folder)
-            return sorted(
-                [f for f in os.listdir(self.backup_folder) if f.endswith(".csv")],
-                reverse=True
-            )
+            return self.backups.list()
         except Exception as e:
             logging.error(f"Error getting backup files: {str(e)}")
             return []
 
-    def search_customers(self, query: str) -> List[Dict]:
-        """Search customers by any field."""
-        try:
-            data = self.read_data()
-            query = query.lower()
-            return [
-                row for row in data 
-                if any(
-                    str(value).lower().find(query) != -1 
-                    for value in row.values()
-                )
-            ]
+    def diff_backups(self, old_backup: str, new_backup: Optional[str] = None) -> Optional[BackupDiff]:
+        """Customers added, removed and changed between two backups.
+
+        Without new_backup the old backup is compared with the current data.
+        """
+        try:
+            if new_backup is None:
+                with self._rwlock.write(), self.storage.lock():
+                    current = self.storage.load()
+                new_rows = lambda: current
+            else:
+                new_rows = lambda: self.backups.iter_rows(new_backup)
+            return diff_rows(
+                lambda: self.backups.iter_rows(old_backup), new_rows,
+                self.columns, self.id_column, self.version_column
+            )
+        except Exception as e:
+            logging.error(f"Error comparing backups: {str(e)}")
+            return None
+            
+    def restore_to_time(self, when: datetime) -> Optional[str]:
+        """Restore the data as it was at a point in time.
+
+        Uses the newest backup taken at or before when (a delta is applied
+        to its snapshot). Returns the name of the backup restored, or None.
+        """
+        try:
+            backup_file = self.backups.backup_at(when)
+            if backup_file is None:
+                logging.error(f"No backup taken before {when}")
+                return None
+            return backup_file if self.restore_backup(backup_file) else None
+        except Exception as e:
+            logging.error(f"Error restoring to {when}: {str(e)}")
+            return None
+            
+    def get_backup_catalog(self, offset: int = 0, limit: int = 50) -> Tuple[List[Dict], int]:
+        """Get one page of the backup catalog (newest first) and the number of backups."""
+        try:
+            return self.backups.catalog_page(offset, limit)
+        except Exception as e:
+            logging.error(f"Error reading backup catalog: {str(e)}")
+            return [], 0
+
+    def search_customers(self, query: str, within: Optional[Set[str]] = None) -> List[Dict]:
+        """Search customers by any field.
+
+        Returns the customers with a field containing query, in file order,
+        using the trigram index instead of scanning every field. Case, Arabic
+        spelling variants, diacritics and Arabic-Indic digits are ignored, and
+        a complete phone number matches however it is formatted.
+
+        within (Customer_IDs) limits the search to the results of an earlier
+        query contained in this one, as search-as-you-type does.
+        """
+        try:
+            self._ensure_cache()
+            query = normalize_text(query)
+            if not self._search_index.built:
+                with self._rwlock.write():
+                    if not self._search_index.built:
+                        self._search_index.build(
+                            (customer_id, self._search_text(row)) for customer_id, row in self._cache.items()
+                        )
+            # A query typed as a phone number ("00974 5512-3456") also finds that phone
+            phone = normalize_phone(query)
+            with self._rwlock.read():
+                matches = self._search_index.search(query, within)
+                if phone != query and re.fullmatch(r"\+\d{10,15}", phone):
+                    matches = matches | set(self._ids_by_phone.get(phone, []))
+                return [row for row in self.snapshot() if row[self.id_column] in matches]
         except Exception as e:
             logging.error(f"Error searching customers: {str(e)}")
             return []
 
+    def _change_installment(self, customer_name: str, installment_date: str, **fields) -> bool:
+        """Replace one installment record of a customer and persist only that change."""
+        customer_id = self._resolve_id(customer_name)
+        if customer_id is None:
+            logging.warning(f"Customer not found: {customer_name}")
+            return False
+        if "due_date" in fields:
+            # A new date is parsed once here, like the dates parsed at load
+            fields["due_day"], fields["due_date"] = parse_date(fields["due_date"])
+            
+        def build(row, installments):
+            installments = list(installments)
+            index = find_installment(installments, installment_date)
+            if index < 0:
+                logging.warning(f"Installment date {installment_date} not found for customer {customer_name}")
+                return None
+                
+            installments[index] = installments[index]._replace(**fields)
+            updated_row = CachedRow(row)
+            encode_installments(updated_row, installments)
+            
+            old_date = installment_date if installment_date != installments[index].due_date else None
+            return Change("installment", customer_id, updated_row, installments[index], old_date)
+            
+        return self._commit_cas(customer_id, build)
+
     def mark_installment_as_paid(self, customer_name: str, installment_date: str) -> bool:
         """Mark a specific installment as paid."""
         try:
-            data = self.read_data()
-            
-            for i, row in enumerate(data):
-                if row["Name"] == customer_name:
-                    try:
-                        paid_installments = eval(row.get("Paid_Installments", "[]"))
-                        if not isinstance(paid_installments, list):
-                            paid_installments = []
-                    except:
-                        paid_installments = []
-                        
-                    if installment_date not in paid_installments:
-                        paid_installments.append(installment_date)
-                        data[i]["Paid_Installments"] = str(paid_installments)
-                        return self.save_data(data)
-                    else:
-                        logging.info(f"Installment already paid: {installment_date}")
-                        return True
-            
-            logging.warning(f"Customer not found: {customer_name}")
-            return False
+            installments = self.get_installments(customer_name)
+            index = find_installment(installments, installment_date)
+            if index >= 0 and installments[index].paid:
+                logging.info(f"Installment already paid: {installment_date}")
+                return True
+                
+            return self._change_installment(customer_name, installment_date, paid=True)
             
         except Exception as e:
             logging.error(f"Error marking installment as paid: {str(e)}")
@@ -628,15 +1387,9 @@ class CSVManager:
     def get_payment_status(self, customer_name: str, installment_date: str) -> bool:
         """Check if a specific installment has been paid."""
         try:
-            data = self.read_data()
-            for customer in data:
-                if customer["Name"] == customer_name:
-                    try:
-                        paid_installments = eval(customer.get("Paid_Installments", "[]"))
-                        return installment_date in paid_installments
-                    except:
-                        return False
-            return False
+            installments = self.get_installments(customer_name)
+            index = find_installment(installments, installment_date)
+            return index >= 0 and installments[index].paid
         except Exception as e:
             logging.error(f"Error checking payment status: {str(e)}")
             return False
@@ -644,50 +1397,11 @@ class CSVManager:
     def update_installment(self, customer_name: str, old_date: str, new_date: str, new_value: float) -> bool:
         """Update an installment's date and value."""
         try:
-            data = self.read_data()
-            
-            for i, customer in enumerate(data):
-                if customer["Name"] == customer_name:
-                    dates_str = customer.get("Installment Dates", "")
-                    if not dates_str:
-                        logging.warning(f"Customer {customer_name} has no installment dates")
-                        return False
-                        
-                    installment_dates = dates_str.split(";")
-                    
-                    if old_date not in installment_dates:
-                        logging.warning(f"Installment date {old_date} not found for customer {customer_name}")
-                        return False
-                        
-                    installment_dates[installment_dates.index(old_date)] = new_date
-                    data[i]["Installment Dates"] = ";".join(installment_dates)
-                    
-                    try:
-                        installment_values = eval(customer.get("Installment_Values", "{}"))
-                        if old_date in installment_values:
-                            installment_values[new_date] = new_value
-                            del installment_values[old_date]
-                        else:
-                            installment_values[new_date] = new_value
-                        data[i]["Installment_Values"] = str(installment_values)
-                    except:
-                        data[i]["Installment_Values"] = str({new_date: new_value})
-                    
-                    try:
-                        paid_installments = eval(customer.get("Paid_Installments", "[]"))
-                        if old_date in paid_installments:
-                            paid_installments.remove(old_date)
-                            paid_installments.append(new_date)
-                            data[i]["Paid_Installments"] = str(paid_installments)
-                    except Exception as e:
-                        logging.error(f"Error updating paid status: {str(e)}")
-                    
-                    if self.save_data(data):
-                        return True
-                    return False
-            
-            logging.warning(f"Customer not found: {customer_name}")
-            return False
+            fields = {"due_date": new_date, "amount": float(new_value)}
+            if new_date != old_date:
+                # A rescheduled installment needs a new reminder
+                fields["notified"] = False
+            return self._change_installment(customer_name, old_date, **fields)
             
         except Exception as e:
             logging.error(f"Error updating installment: {str(e)}")
@@ -696,30 +1410,40 @@ class CSVManager:
     def unmark_installment_as_paid(self, customer_name: str, installment_date: str) -> bool:
         """Remove a specific installment from the paid list."""
         try:
-            data = self.read_data()
-            
-            for i, row in enumerate(data):
-                if row["Name"] == customer_name:
-                    try:
-                        paid_installments = eval(row.get("Paid_Installments", "[]"))
-                        if not isinstance(paid_installments, list):
-                            paid_installments = []
-                    except:
-                        paid_installments = []
-                        
-                    if installment_date in paid_installments:
-                        paid_installments.remove(installment_date)
-                        data[i]["Paid_Installments"] = str(paid_installments)
-                        return self.save_data(data)
-                    else:
-                        logging.info(f"Installment wasn't marked as paid: {installment_date}")
-                        return True
+            installments = self.get_installments(customer_name)
+            index = find_installment(installments, installment_date)
+            if index >= 0 and not installments[index].paid:
+                logging.info(f"Installment wasn't marked as paid: {installment_date}")
+                return True
+                
+            return self._change_installment(customer_name, installment_date, paid=False)
             
-            logging.warning(f"Customer not found: {customer_name}")
+        except Exception as e:
+            logging.error(f"Error unmarking installment as paid: {str(e)}")
+            return False
+
+    def set_notification_sent(self, customer_name: str, sent: bool = True) -> bool:
+        """Set the Notification Sent flag of a customer."""
+        try:
+            customer_id = self._resolve_id(customer_name)
+            if customer_id is None:
+                logging.error(f"Customer not found: {customer_name}")
+                return False
+                
+            return self._commit_cas(
+                customer_id,
+                lambda row, installments: Change("update", customer_id, CachedRow({**row, "Notification Sent": sent}))
+            )
+        except Exception as e:
+            logging.error(f"Error updating notification status: {str(e)}")
             return False
             
+    def mark_installment_as_notified(self, customer_name: str, installment_date: str) -> bool:
+        """Record that a reminder was sent for a specific installment."""
+        try:
+            return self._change_installment(customer_name, installment_date, notified=True)
         except Exception as e:
-            logging.error(f"Error unmarking installment as paid: {str(e)}")
+            logging.error(f"Error marking installment as notified: {str(e)}")
             return False
 
 